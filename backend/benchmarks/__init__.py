@@ -0,0 +1 @@
+# Benchmarks package (запуск: python -m benchmarks.<module> из папки backend)
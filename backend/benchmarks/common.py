@@ -0,0 +1,63 @@
+"""
+Общие функции бенчмарков: перцентили, замер времени, сохранение результатов
+"""
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Перцентиль p (0-100) методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def measure(func: Callable[[], object], min_time: float = 0.2, min_runs: int = 3) -> Dict[str, float]:
+    """Вызывать func, пока не наберется min_time секунд; время одного вызова в мс"""
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < min_runs or time.perf_counter() - started < min_time:
+        call_started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - call_started) * 1000)
+    return {
+        "runs": len(timings),
+        "mean_ms": round(statistics.mean(timings), 4),
+        "median_ms": round(statistics.median(timings), 4),
+        "min_ms": round(min(timings), 4),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(results: Dict, output: Path) -> Dict:
+    """Добавить метаданные запуска (коммит, время, Python) и записать JSON"""
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+        },
+        **results,
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+    return results
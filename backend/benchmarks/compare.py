@@ -0,0 +1,56 @@
+"""
+Сравнение двух JSON с результатами бенчмарков (например, до и после коммита).
+Сравниваются все числовые метрики времени (*_ms, *_s); регрессией считается
+рост больше порога.
+
+Запуск из папки backend:
+    python -m benchmarks.compare old/micro.json benchmarks/results/micro.json --threshold 10
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+
+def timing_metrics(data: Dict, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    """Плоский список (путь, значение) метрик времени, без метаданных"""
+    for key, value in data.items():
+        if key in ("meta", "config"):
+            continue
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from timing_metrics(value, path)
+        elif isinstance(value, (int, float)) and (key.endswith("_ms") or key.endswith("_s")):
+            yield path, float(value)
+
+
+def compare(old: Dict, new: Dict, threshold: float) -> int:
+    """Напечатать изменения; вернуть число регрессий"""
+    old_metrics = dict(timing_metrics(old))
+    regressions = 0
+    print(f"old: {old.get('meta', {}).get('commit', '?')}  new: {new.get('meta', {}).get('commit', '?')}")
+    for path, new_value in timing_metrics(new):
+        old_value = old_metrics.get(path)
+        if not old_value:
+            continue
+        change = (new_value - old_value) / old_value * 100
+        marker = ""
+        if change > threshold:
+            marker = "  REGRESSION"
+            regressions += 1
+        elif change < -threshold:
+            marker = "  improved"
+        print(f"{path:50} {old_value:12.3f} -> {new_value:12.3f}  {change:+7.1f}%{marker}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old", type=Path)
+    parser.add_argument("new", type=Path)
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent slowdown counted as regression")
+    args = parser.parse_args()
+
+    regressions = compare(json.loads(args.old.read_text()), json.loads(args.new.read_text()), args.threshold)
+    sys.exit(1 if regressions else 0)
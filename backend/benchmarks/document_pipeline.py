@@ -0,0 +1,73 @@
+"""
+Сравнение end-to-end латентности генерации документа:
+один большой промпт (single) против параллельных секций (sections).
+
+Gemini заменяется заглушкой (StubProvider), латентность которой моделирует
+реальную: время до первого токена + время на каждый выходной токен.
+
+Запуск из папки backend:
+    python -m benchmarks.document_pipeline --runs 5
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+
+from benchmarks.common import RESULTS_DIR, save_results
+from services.gemini_service import GeminiService
+from services.llm_provider import StubProvider
+
+CHAT_HISTORY = [
+    {"role": "user", "content": "Хотим CRM для отделений ForteBank: учет клиентов, заявок и звонков."},
+    {"role": "assistant", "content": "Какие цели проекта и кто пользователи?"},
+    {"role": "user", "content": "Цель - сократить время обработки заявки на 30%. Пользователи - менеджеры и руководители отделений."},
+    {"role": "assistant", "content": "Нужны ли интеграции?"},
+    {"role": "user", "content": "Да, с АБС банка и телефонией, плюс отчеты для руководства."},
+]
+
+
+async def run_once(service: GeminiService, mode: str) -> float:
+    started = time.perf_counter()
+    if mode == "sections":
+        document = await service.generate_document_sections(CHAT_HISTORY)
+    else:
+        document = await service.generate_document(CHAT_HISTORY)
+    await service.validate_document(document, use_cache=False)
+    return time.perf_counter() - started
+
+
+async def main(runs: int, first_token: float, per_token: float) -> dict:
+    service = GeminiService(StubProvider(first_token, per_token, jitter=0, error_rate=0))
+
+    results = {}
+    for mode in ("single", "sections"):
+        timings = []
+        for run in range(runs):
+            # Разные истории, чтобы не срабатывало объединение запросов
+            CHAT_HISTORY[-1]["content"] += f" ({mode} {run})"
+            timings.append(await run_once(service, mode))
+        results[mode] = {
+            "runs": runs,
+            "mean_s": round(statistics.mean(timings), 3),
+            "p50_s": round(statistics.median(timings), 3),
+            "max_s": round(max(timings), 3),
+        }
+
+    service.close()
+    results["speedup"] = round(results["single"]["mean_s"] / results["sections"]["mean_s"], 2)
+    results["latency_model"] = {"first_token_s": first_token, "per_token_s": per_token}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--first-token", type=float, default=0.5, help="seconds before first token")
+    parser.add_argument("--per-token", type=float, default=0.004, help="seconds per output token")
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR / "document_pipeline.json")
+    args = parser.parse_args()
+
+    results = save_results(asyncio.run(main(args.runs, args.first_token, args.per_token)), args.output)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
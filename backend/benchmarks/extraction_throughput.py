@@ -0,0 +1,107 @@
+"""
+Пропускная способность извлечения текста: N одновременных файлов
+(PDF на --pages страниц) разбираются в event loop, как раньше, и в пуле
+процессов ExtractionPool с разным числом воркеров. Кроме файлов в секунду
+замеряется максимальная задержка event loop - насколько разбор мешает
+остальным запросам.
+
+Запуск из папки backend:
+    python -m benchmarks.extraction_throughput --files 16 --pages 300 --workers 1,2,4
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks import fixtures
+from benchmarks.common import RESULTS_DIR, save_results
+from services.extraction_pool import ExtractionPool
+from utils.file_processor import FileProcessor
+
+TICK = 0.01
+
+
+async def loop_lag(stop: asyncio.Event) -> float:
+    """Максимальная задержка тика event loop за время замера"""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        worst = max(worst, time.perf_counter() - started - TICK)
+    return worst
+
+
+async def run_level(paths: List[str], workers: int = None) -> Dict:
+    pool = None
+    if workers is not None:
+        pool = ExtractionPool(workers=workers, timeout=600)
+        await pool.warmup()
+
+    async def extract(path: str):
+        if pool is None:
+            # Как до пула: разбор прямо в event loop
+            return FileProcessor.process_file(path, os.path.basename(path))
+        return await pool.extract(path, os.path.basename(path))
+
+    stop = asyncio.Event()
+    lag = asyncio.ensure_future(loop_lag(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*[extract(path) for path in paths])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    max_lag = await lag
+    if pool is not None:
+        pool.stop()
+
+    return {
+        "mode": "event_loop" if pool is None else "process_pool",
+        "workers": workers or 0,
+        "elapsed_s": round(elapsed, 3),
+        "files_per_s": round(len(paths) / elapsed, 2),
+        "max_loop_lag_ms": round(max_lag * 1000, 1),
+    }
+
+
+async def run(files: int, pages: int, levels: List[int]) -> Dict:
+    directory = tempfile.mkdtemp(prefix="extraction_bench_")
+    data = fixtures.make_pdf(pages)
+    paths = []
+    for i in range(files):
+        path = os.path.join(directory, f"spec_{i}.pdf")
+        with open(path, "wb") as f:
+            f.write(data)
+        paths.append(path)
+
+    try:
+        results = [await run_level(paths)]
+        for workers in levels:
+            results.append(await run_level(paths, workers))
+    finally:
+        for path in paths:
+            os.unlink(path)
+        os.rmdir(directory)
+
+    baseline = results[0]["files_per_s"]
+    for result in results:
+        result["speedup"] = round(result["files_per_s"] / baseline, 2)
+    return {
+        "config": {"files": files, "pages": pages, "file_kb": len(data) // 1024, "cpu_count": os.cpu_count()},
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=16, help="files extracted concurrently")
+    parser.add_argument("--pages", type=int, default=300, help="pages per PDF")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated pool sizes")
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR / "extraction_throughput.json")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.workers.split(",")]
+    results = save_results(asyncio.run(run(args.files, args.pages, levels)), args.output)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
@@ -0,0 +1,136 @@
+"""
+Анализ длинной спецификации: прежний путь (текст обрезается до
+FILE_ANALYSIS_SINGLE_PASS_CHARS, один вызов Pro) против map-reduce по
+чанкам во Flash. Замеряются латентность и покрытие - доля требований
+REQ-NNNNN документа, попавших в итоговый список.
+
+Gemini заменяется заглушкой, которая "находит" все требования в видимом
+ей тексте (идеальная модель - разница в покрытии только от обрезки).
+Латентность: время до первого токена + входные токены * --prefill +
+выходные * --per-token; Pro в --pro-slowdown раз медленнее Flash.
+
+Запуск из папки backend:
+    python -m benchmarks.file_analysis --pages 200 --runs 3
+"""
+import argparse
+import asyncio
+import json
+import re
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+from benchmarks import fixtures
+from benchmarks.common import RESULTS_DIR, save_results
+from config import settings
+from services.gemini_service import GeminiService
+from services.llm_provider import LLMResponse, LLMUsage, StubModel, StubProvider
+
+REQUIREMENT = re.compile(r"REQ-\d{5}: [^.]*\.")
+REQUIREMENT_ID = re.compile(r"REQ-\d{5}")
+
+
+class SpecModel(StubModel):
+    """Заглушка анализа файла: в ответе все требования из текста промпта"""
+
+    def generate_content(self, prompt: str, generation_config: Any = None, stream: bool = False, **kwargs):
+        provider = self.provider
+        requirements = list(dict.fromkeys(REQUIREMENT.findall(prompt)))
+        text = json.dumps({
+            "projectName": "Платежный шлюз",
+            "goals": ["Сократить время обработки платежей"],
+            "requirements": requirements,
+            "stakeholders": ["Операционисты", "Служба безопасности"],
+            "description": "Прием и обработка платежей клиентов банка",
+        }, ensure_ascii=False)
+        usage = LLMUsage(provider.token_count(prompt), provider.token_count(text), 0)
+        latency = (
+            provider.first_token
+            + usage.prompt_token_count * provider.prefill
+            + usage.candidates_token_count * provider.per_token
+        )
+        if "pro" in self.model_name:
+            latency *= provider.pro_slowdown
+        provider.calls += 1
+        provider.sleep(latency)
+        return LLMResponse(text, usage)
+
+
+class SpecProvider(StubProvider):
+    def __init__(self, first_token: float, prefill: float, per_token: float, pro_slowdown: float):
+        super().__init__(first_token, per_token, jitter=0, error_rate=0)
+        self.prefill = prefill
+        self.pro_slowdown = pro_slowdown
+
+    def get_model(self, model_name: str) -> SpecModel:
+        return SpecModel(self, model_name)
+
+
+def coverage(analysis: Dict, total: int) -> float:
+    found = {match for item in analysis["requirements"] for match in REQUIREMENT_ID.findall(item)}
+    return round(len(found) / total, 4)
+
+
+async def run_mode(service: GeminiService, text: str, total: int, mode: str, runs: int) -> Dict:
+    timings = []
+    calls_before = service.provider.calls
+    for _ in range(runs):
+        started = time.perf_counter()
+        if mode == "truncate":
+            # Как раньше: модель видит только начало текста
+            analysis = await service.analyze_file(text[:settings.FILE_ANALYSIS_SINGLE_PASS_CHARS], use_cache=False)
+        else:
+            analysis = await service.analyze_file_chunked(text, use_cache=False)
+        timings.append(time.perf_counter() - started)
+    return {
+        "mean_s": round(statistics.mean(timings), 3),
+        "max_s": round(max(timings), 3),
+        "llm_calls": (service.provider.calls - calls_before) // runs,
+        "requirements": len(analysis["requirements"]),
+        "coverage": coverage(analysis, total),
+    }
+
+
+async def main(pages: int, runs: int, first_token: float, prefill: float, per_token: float, pro_slowdown: float) -> Dict:
+    text = fixtures.make_spec_text(pages)
+    total = len(set(REQUIREMENT_ID.findall(text)))
+    service = GeminiService(SpecProvider(first_token, prefill, per_token, pro_slowdown))
+    # Кэш контекста отдал бы модель провайдера вместо SpecModel
+    service.context_cache.enabled = False
+
+    results = {mode: await run_mode(service, text, total, mode, runs) for mode in ("truncate", "map_reduce")}
+    service.close()
+    results["speedup"] = round(results["truncate"]["mean_s"] / results["map_reduce"]["mean_s"], 2)
+    results["config"] = {
+        "pages": pages,
+        "characters": len(text),
+        "requirements": total,
+        "chunk_chars": settings.FILE_ANALYSIS_CHUNK_CHARS,
+        "chunk_concurrency": settings.FILE_ANALYSIS_CHUNK_CONCURRENCY,
+    }
+    results["latency_model"] = {
+        "first_token_s": first_token,
+        "prefill_s_per_token": prefill,
+        "per_token_s": per_token,
+        "pro_slowdown": pro_slowdown,
+    }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200, help="pages in the specification")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--first-token", type=float, default=0.5, help="seconds before first token (Flash)")
+    parser.add_argument("--prefill", type=float, default=0.00002, help="seconds per input token (Flash)")
+    parser.add_argument("--per-token", type=float, default=0.004, help="seconds per output token (Flash)")
+    parser.add_argument("--pro-slowdown", type=float, default=4.0, help="Pro latency relative to Flash")
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR / "file_analysis.json")
+    args = parser.parse_args()
+
+    results = save_results(
+        asyncio.run(main(args.pages, args.runs, args.first_token, args.prefill, args.per_token, args.pro_slowdown)),
+        args.output
+    )
+    print(json.dumps(results, indent=2, ensure_ascii=False))
@@ -0,0 +1,117 @@
+"""
+Генераторы входных данных для бенчмарков: файлы PDF/DOCX/XLSX, текст,
+ответы LLM с JSON и Mermaid кодом заданного размера.
+"""
+import io
+import json
+import random
+
+import fitz  # PyMuPDF
+import openpyxl
+from docx import Document
+
+PARAGRAPH = (
+    "Система должна обеспечивать учет клиентов, заявок и звонков в отделениях банка. "
+    "Менеджер создает заявку, руководитель отделения контролирует сроки обработки. "
+    "Интеграция с АБС и телефонией обязательна, отчеты формируются ежедневно."
+)
+
+
+def make_text(paragraphs: int) -> str:
+    """Сырой извлеченный текст: лишние пробелы, повторы символов, служебные символы"""
+    parts = []
+    for i in range(paragraphs):
+        parts.append(f"  {i + 1}.   {PARAGRAPH}\n\n\t-------------- \x0c")
+    return "\n".join(parts)
+
+
+def make_pdf(pages: int, paragraphs_per_page: int = 8, padding: int = 0) -> bytes:
+    """padding - байт несжимаемого вложения, чтобы получить файл нужного размера"""
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        text = "\n".join(
+            f"Требование {page_num + 1}.{i + 1}: {PARAGRAPH[:90]}"
+            for i in range(paragraphs_per_page)
+        )
+        page.insert_text((50, 72), text, fontsize=9)
+    if padding:
+        doc.embfile_add("padding.bin", random.Random(pages).randbytes(padding))
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def make_docx(paragraphs: int, tables: int = 1, rows: int = 10) -> bytes:
+    doc = Document()
+    for i in range(paragraphs):
+        doc.add_paragraph(f"{i + 1}. {PARAGRAPH}")
+    for _ in range(tables):
+        table = doc.add_table(rows=rows, cols=3)
+        for r, row in enumerate(table.rows):
+            for c, cell in enumerate(row.cells):
+                cell.text = f"Ячейка {r}.{c}"
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def make_xlsx(rows: int, sheets: int = 2, cols: int = 6) -> bytes:
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for s in range(sheets):
+        sheet = wb.create_sheet(f"Лист {s + 1}")
+        sheet.append([f"Колонка {c + 1}" for c in range(cols)])
+        for r in range(rows):
+            sheet.append([f"Значение {r}.{c}" if c % 2 == 0 else r * c for c in range(cols)])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def make_spec_text(pages: int, requirements_per_page: int = 3, paragraphs_per_page: int = 8) -> str:
+    """
+    Очищенный текст длинной спецификации, как после FileProcessor: маркеры
+    страниц, пронумерованные требования REQ-NNNNN (равномерно по документу)
+    и текст между ними
+    """
+    parts = []
+    for page_num in range(pages):
+        lines = [f"=== Страница {page_num + 1} ==="]
+        for i in range(paragraphs_per_page):
+            if i < requirements_per_page:
+                number = page_num * requirements_per_page + i + 1
+                lines.append(f"REQ-{number:05d}: система должна поддерживать сценарий {number} без потери данных.")
+            lines.append(PARAGRAPH)
+        parts.append(" ".join(lines))
+    return " ".join(parts)
+
+
+def make_llm_json(items: int, json_mode: bool = False) -> str:
+    """
+    Ответ модели: JSON в markdown блоке, с комментарием и висячими запятыми;
+    json_mode - чистый JSON, как в нативном JSON режиме
+    """
+    document = {
+        "projectName": "CRM для отделений",
+        "goals": [{"text": f"Цель {i}: {PARAGRAPH[:60]}", "priority": "high"} for i in range(items)],
+        "useCases": [
+            {"id": f"UC{i:03d}", "title": f"Сценарий {i}", "mainScenario": [f"Шаг {j}" for j in range(8)]}
+            for i in range(items)
+        ],
+    }
+    body = json.dumps(document, ensure_ascii=False, indent=2)
+    if json_mode:
+        return body
+    body = body.replace("\n  ]", ",\n  ]", 1)
+    return f"Вот документ:\n```json\n// сгенерировано\n{body}\n```\nГотово."
+
+
+def make_mermaid(nodes: int, seed: int = 42) -> str:
+    """Flowchart, в котором узлы и стрелки перемешаны"""
+    rng = random.Random(seed)
+    node_lines = [f"    N{i}[Шаг {i}]" for i in range(nodes)]
+    edge_lines = [f"    N{i} --> N{i + 1}" for i in range(nodes - 1)]
+    lines = node_lines + edge_lines
+    rng.shuffle(lines)
+    return "```mermaid\nflowchart TD\n%% комментарий\n" + "\n".join(lines) + "\n```"
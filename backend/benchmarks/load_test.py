@@ -0,0 +1,191 @@
+"""
+Нагрузочный тест API: виртуальные пользователи отправляют смесь запросов
+/api/chat/message, /api/documents/generate, /api/files/upload и /api/projects/,
+на выходе - p50/p95/p99 латентности и пропускная способность по эндпоинтам.
+
+По умолчанию приложение запускается в этом же процессе (ASGI, без сети)
+с LLM_PROVIDER=stub и временной БД. С --base-url нагрузка идет на уже
+запущенный сервер (его LLM провайдер настраивается на стороне сервера).
+Исходящий rate limit к LLM (RATE_LIMIT_REQUESTS) действует и для заглушки.
+
+Запуск из папки backend:
+    python -m benchmarks.load_test --users 20 --duration 30
+    python -m benchmarks.load_test --mix chat=70,projects=30 --base-url http://localhost:8000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+from benchmarks import fixtures
+from benchmarks.common import RESULTS_DIR, percentile, save_results
+
+DEFAULT_MIX = {"chat": 60, "document": 5, "upload": 15, "projects": 20}
+
+CHAT_MESSAGES = [
+    "Хотим CRM для отделений банка: учет клиентов, заявок и звонков.",
+    "Цель - сократить время обработки заявки на 30%.",
+    "Пользователи - менеджеры и руководители отделений.",
+    "Нужна интеграция с АБС и телефонией.",
+    "Отчеты для руководства должны формироваться ежедневно.",
+]
+
+
+class Recorder:
+    """Латентности и ошибки по эндпоинтам"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def call(self, name: str, request):
+        started = time.perf_counter()
+        try:
+            response = await request
+            failed = response.status_code >= 400
+        except httpx.HTTPError:
+            response, failed = None, True
+        self.latencies[name].append((time.perf_counter() - started) * 1000)
+        if failed:
+            self.errors[name] += 1
+        return response
+
+    def report(self, duration: float) -> Dict:
+        endpoints = {}
+        for name, values in sorted(self.latencies.items()):
+            endpoints[name] = {
+                "requests": len(values),
+                "errors": self.errors[name],
+                "throughput_rps": round(len(values) / duration, 2),
+                "mean_ms": round(statistics.mean(values), 1),
+                "p50_ms": round(percentile(values, 50), 1),
+                "p95_ms": round(percentile(values, 95), 1),
+                "p99_ms": round(percentile(values, 99), 1),
+            }
+        total = sum(len(values) for values in self.latencies.values())
+        return {
+            "endpoints": endpoints,
+            "total": {
+                "requests": total,
+                "errors": sum(self.errors.values()),
+                "throughput_rps": round(total / duration, 2),
+            },
+        }
+
+
+async def virtual_user(client: httpx.AsyncClient, recorder: Recorder, mix: Dict[str, int], deadline: float, seed: int):
+    rng = random.Random(seed)
+    names, weights = zip(*mix.items())
+
+    response = await client.post("/api/projects/create", json={"name": f"Load test {seed}"})
+    response.raise_for_status()
+    project_id = response.json()["id"]
+    # Генерации документа нужна непустая история
+    await client.post("/api/chat/message", json={"project_id": project_id, "message": CHAT_MESSAGES[0]})
+
+    uploads = 0
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        if name == "chat":
+            await recorder.call(name, client.post(
+                "/api/chat/message",
+                json={"project_id": project_id, "message": rng.choice(CHAT_MESSAGES)}
+            ))
+        elif name == "document":
+            await recorder.call(name, client.post(
+                "/api/documents/generate", json={"project_id": project_id}
+            ))
+        elif name == "upload":
+            # Каждый файл уникален, чтобы анализ не отдавался из кэша
+            uploads += 1
+            data = fixtures.make_docx(5 + uploads % 5, tables=0)
+            await recorder.call(name, client.post(
+                "/api/files/upload",
+                params={"project_id": project_id, "use_cache": "false"},
+                files={"file": (f"load_{seed}_{uploads}.docx", data)}
+            ))
+        elif name == "projects":
+            await recorder.call(name, client.get("/api/projects/"))
+
+
+@asynccontextmanager
+async def in_process_client():
+    """Клиент к приложению в этом процессе, с запущенным lifespan"""
+    from main import app
+
+    # Логи на каждый запрос искажают замеры
+    logging.disable(logging.INFO)
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=300) as client:
+            yield client
+
+
+async def run(users: int, duration: float, mix: Dict[str, int], base_url: str = None) -> Dict:
+    recorder = Recorder()
+
+    if base_url:
+        client_context = httpx.AsyncClient(base_url=base_url, timeout=300)
+    else:
+        client_context = in_process_client()
+
+    async with client_context as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*[
+            virtual_user(client, recorder, mix, deadline, seed)
+            for seed in range(users)
+        ])
+        elapsed = time.perf_counter() - started
+
+    return {
+        "config": {"users": users, "duration_s": duration, "mix": mix, "target": base_url or "in-process"},
+        "elapsed_s": round(elapsed, 2),
+        **recorder.report(elapsed),
+    }
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        name, weight = part.split("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown endpoint '{name}', expected one of {list(DEFAULT_MIX)}")
+        mix[name] = int(weight)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. chat=60,document=5,upload=15,projects=20")
+    parser.add_argument("--base-url", help="load a running server instead of an in-process app")
+    parser.add_argument("--first-token", type=float, default=0.3, help="stub: seconds before first token")
+    parser.add_argument("--per-token", type=float, default=0.004, help="stub: seconds per output token")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="stub: share of calls failing with 503")
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR / "load_test.json")
+    args = parser.parse_args()
+
+    if not args.base_url:
+        # Настройки читаются при импорте config - задаем их до запуска приложения
+        os.environ.setdefault("LLM_PROVIDER", "stub")
+        os.environ.setdefault("LLM_STUB_FIRST_TOKEN_LATENCY", str(args.first_token))
+        os.environ.setdefault("LLM_STUB_TOKEN_LATENCY", str(args.per_token))
+        os.environ.setdefault("LLM_STUB_ERROR_RATE", str(args.error_rate))
+        database_dir = tempfile.mkdtemp(prefix="load_test_")
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{database_dir}/load_test.db")
+
+    results = save_results(asyncio.run(run(args.users, args.duration, args.mix, args.base_url)), args.output)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
@@ -0,0 +1,92 @@
+"""
+Микробенчмарки разбора ответов LLM и извлечения текста из файлов
+на входных данных возрастающего размера.
+
+Запуск из папки backend:
+    python -m benchmarks.micro
+    python -m benchmarks.micro --only extract_json,process_pdf --min-time 1
+"""
+import argparse
+import json
+import logging
+from pathlib import Path
+
+from benchmarks import fixtures
+from benchmarks.common import RESULTS_DIR, measure, save_results
+from services.gemini_service import GeminiService
+from services.llm_provider import StubProvider
+from utils.file_processor import FileProcessor
+
+SIZES = {
+    "small": {"items": 5, "nodes": 10, "pages": 2, "paragraphs": 20, "rows": 50},
+    "medium": {"items": 50, "nodes": 100, "pages": 20, "paragraphs": 200, "rows": 500},
+    "large": {"items": 500, "nodes": 1000, "pages": 200, "paragraphs": 2000, "rows": 5000},
+}
+
+
+def build_cases(service: GeminiService):
+    """name -> (фабрика входных данных по размеру, функция)"""
+    return {
+        "extract_json": (
+            lambda size: fixtures.make_llm_json(size["items"]),
+            service._extract_json_from_text,
+        ),
+        # Ответ JSON режима разбирается без regex очистки
+        "parse_json_direct": (
+            lambda size: fixtures.make_llm_json(size["items"], json_mode=True),
+            json.loads,
+        ),
+        "clean_mermaid": (
+            lambda size: fixtures.make_mermaid(size["nodes"]),
+            service._clean_mermaid_code,
+        ),
+        "process_pdf": (
+            lambda size: fixtures.make_pdf(size["pages"]),
+            FileProcessor.process_pdf,
+        ),
+        "process_docx": (
+            lambda size: fixtures.make_docx(size["paragraphs"], rows=size["rows"] // 10),
+            FileProcessor.process_docx,
+        ),
+        "process_xlsx": (
+            lambda size: fixtures.make_xlsx(size["rows"]),
+            FileProcessor.process_xlsx,
+        ),
+        "clean_text": (
+            lambda size: fixtures.make_text(size["paragraphs"]),
+            FileProcessor.clean_extracted_text,
+        ),
+    }
+
+
+def main(only=None, sizes=None, min_time: float = 0.2) -> dict:
+    # Логи на каждый вызов искажают замеры
+    logging.disable(logging.INFO)
+    service = GeminiService(StubProvider())
+
+    results = {}
+    for name, (make_input, func) in build_cases(service).items():
+        if only and name not in only:
+            continue
+        results[name] = {}
+        for size_name in sizes or SIZES:
+            data = make_input(SIZES[size_name])
+            stats = measure(lambda: func(data), min_time=min_time)
+            stats["input_bytes"] = len(data if isinstance(data, bytes) else data.encode("utf-8"))
+            results[name][size_name] = stats
+            print(f"{name:18} {size_name:7} {stats['median_ms']:10.3f} ms  ({stats['input_bytes']} bytes)")
+
+    service.close()
+    return {"benchmarks": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", type=lambda s: s.split(","), help="comma-separated benchmark names")
+    parser.add_argument("--sizes", type=lambda s: s.split(","), help="comma-separated sizes: small,medium,large")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per benchmark and size")
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR / "micro.json")
+    args = parser.parse_args()
+
+    results = save_results(main(args.only, args.sizes, args.min_time), args.output)
+    print(json.dumps(results["meta"], ensure_ascii=False))
@@ -0,0 +1,74 @@
+"""
+Извлечение одного большого PDF (по умолчанию 500 страниц): пул из одного
+воркера разбирает файл целиком, пул из N воркеров - диапазонами страниц
+параллельно. Время должно падать примерно пропорционально числу ядер
+(пока воркеров не больше ядер).
+
+Запуск из папки backend:
+    python -m benchmarks.pdf_split --pages 500 --workers 1,2,4 --repeat 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks import fixtures
+from benchmarks.common import RESULTS_DIR, save_results
+from services.extraction_pool import ExtractionPool
+
+
+async def run_level(path: str, pages: int, workers: int, repeat: int) -> Dict:
+    pool = ExtractionPool(workers=workers, timeout=600)
+    await pool.warmup()
+    timings = []
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            text, _, _ = await pool.extract(path, os.path.basename(path))
+            timings.append(time.perf_counter() - started)
+    finally:
+        pool.stop()
+
+    return {
+        "workers": workers,
+        "ranges": len(pool.page_ranges(0, pages)) if pool.pdf_splits else 1,
+        "best_s": round(min(timings), 3),
+        "text_chars": len(text),
+    }
+
+
+async def run(pages: int, levels: List[int], repeat: int) -> Dict:
+    data = fixtures.make_pdf(pages)
+    fd, path = tempfile.mkstemp(prefix="pdf_split_", suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+
+    try:
+        results = [await run_level(path, pages, workers, repeat) for workers in levels]
+    finally:
+        os.unlink(path)
+
+    baseline = results[0]["best_s"]
+    for result in results:
+        result["speedup"] = round(baseline / result["best_s"], 2)
+    return {
+        "config": {"pages": pages, "file_kb": len(data) // 1024, "repeat": repeat, "cpu_count": os.cpu_count()},
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=500, help="pages in the PDF")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated pool sizes; the first is the baseline")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per pool size, the best one is reported")
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR / "pdf_split.json")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.workers.split(",")]
+    results = save_results(asyncio.run(run(args.pages, levels, args.repeat)), args.output)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
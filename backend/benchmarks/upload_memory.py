@@ -0,0 +1,107 @@
+"""
+Пиковая память процесса (RSS) при одновременных загрузках файлов:
+N параллельных запросов /api/files/extract-text с PDF заданного размера
+и один запрос с файлом больше MAX_FILE_SIZE. Приложение работает в этом же
+процессе (ASGI, LLM_PROVIDER=stub). ru_maxrss - пик за всю жизнь процесса,
+поэтому каждый замер идет в отдельном подпроцессе; тело запроса клиент
+собирает до замера базовой памяти.
+
+Запуск из папки backend:
+    python -m benchmarks.upload_memory --size-mb 8 --concurrency 1,4,8
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+from benchmarks.common import RESULTS_DIR, save_results
+
+
+def current_rss_mb() -> float:
+    with open("/proc/self/statm") as statm:
+        pages = int(statm.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def peak_rss_mb() -> float:
+    # В Linux ru_maxrss - в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def measure(size_mb: float, concurrency: int, oversized: bool) -> Dict:
+    import httpx
+
+    from benchmarks import fixtures
+    from config import settings
+    from main import app
+
+    logging.disable(logging.INFO)
+    size = int((settings.MAX_FILE_SIZE * 3 if oversized else size_mb * 1024 * 1024))
+    data = fixtures.make_pdf(20, padding=size)
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            requests = [
+                client.build_request("POST", "/api/files/extract-text", files={"file": (f"bench_{i}.pdf", data)})
+                for i in range(concurrency)
+            ]
+            for request in requests:
+                request.read()
+
+            baseline = current_rss_mb()
+            started = time.perf_counter()
+            responses = await asyncio.gather(*[client.send(request) for request in requests])
+            elapsed = time.perf_counter() - started
+            peak = peak_rss_mb()
+
+    return {
+        "file_mb": round(len(data) / 1024 / 1024, 2),
+        "concurrency": concurrency,
+        "statuses": sorted({response.status_code for response in responses}),
+        "elapsed_s": round(elapsed, 3),
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(peak, 1),
+        "peak_over_baseline_per_upload_mb": round((peak - baseline) / concurrency, 2),
+    }
+
+
+def run_isolated(size_mb: float, concurrency: int, oversized: bool = False) -> Dict:
+    command = [sys.executable, "-m", "benchmarks.upload_memory", "--worker",
+               "--size-mb", str(size_mb), "--concurrency", str(concurrency)]
+    if oversized:
+        command.append("--oversized")
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=8, help="PDF size for regular uploads")
+    parser.add_argument("--concurrency", default="1,4,8", help="comma-separated concurrency levels")
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR / "upload_memory.json")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--oversized", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        os.environ.setdefault("LLM_PROVIDER", "stub")
+        database_dir = tempfile.mkdtemp(prefix="upload_memory_")
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{database_dir}/upload_memory.db")
+        print(json.dumps(asyncio.run(measure(args.size_mb, int(args.concurrency), args.oversized))))
+        sys.exit(0)
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    results = {
+        "uploads": [run_isolated(args.size_mb, level) for level in levels],
+        "oversized": run_isolated(args.size_mb, 1, oversized=True),
+    }
+    results = save_results(results, args.output)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
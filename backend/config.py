@@ -1,14 +1,77 @@
 import os
-from typing import List
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     # Gemini API
-    GEMINI_API_KEY: str
-    GEMINI_MODEL_FLASH: str = "gemini-1.5-flash"
-    GEMINI_MODEL_PRO: str = "gemini-1.5-pro"
-    GEMINI_TIMEOUT: int = 30
+    GEMINI_API_KEY: str = ""  # нужен только провайдерам gemini и record
+    GEMINI_MODEL_FLASH: str = "gemini-2.5-flash"
+    GEMINI_MODEL_PRO: str = "gemini-2.5-pro"
+    GEMINI_TIMEOUT: int = 30  # seconds, бюджет латентности вызова по умолчанию
     GEMINI_MAX_RETRIES: int = 3
+    GEMINI_MAX_CONCURRENCY_FLASH: int = 16  # одновременных вызовов Flash
+    GEMINI_MAX_CONCURRENCY_PRO: int = 4     # одновременных вызовов Pro
+    GEMINI_RETRY_BASE_DELAY: float = 1.0  # seconds, экспонента с jitter
+    GEMINI_RETRY_MAX_DELAY: float = 30.0  # дольше не ждем, даже если просит сервер
+    GEMINI_CIRCUIT_FAILURE_THRESHOLD: int = 5  # ошибок подряд до размыкания
+    GEMINI_CIRCUIT_RECOVERY_TIMEOUT: float = 30.0  # seconds до пробного вызова
+
+    # LLM provider: "gemini", "stub" (офлайн заглушка), "record" (Gemini + запись
+    # ответов в кассеты) или "replay" (только записанные ответы, без сети)
+    LLM_PROVIDER: str = "gemini"
+    LLM_CASSETTE_DIR: str = "cassettes"
+    LLM_STUB_FIRST_TOKEN_LATENCY: float = 0.3  # seconds до первого токена
+    LLM_STUB_TOKEN_LATENCY: float = 0.004  # seconds на выходной токен
+    LLM_STUB_JITTER: float = 0.2  # разброс латентности, доля (+-20%)
+    LLM_STUB_ERROR_RATE: float = 0.0  # доля вызовов с ошибкой 503
+    LLM_STUB_SEED: Optional[int] = None
+    
+    # Token accounting: цены за 1M токенов (USD) по моделям и квота на проект
+    LLM_PRICES_PER_MTOK: Dict[str, Dict[str, float]] = {
+        "gemini-2.5-flash": {"input": 0.30, "output": 2.50, "cached": 0.075},
+        "gemini-2.5-pro": {"input": 1.25, "output": 10.00, "cached": 0.31},
+    }
+    LLM_PROJECT_TOKEN_QUOTA: Optional[int] = None  # по умолчанию без лимита
+    LLM_USAGE_FLUSH_INTERVAL: float = 1.0  # seconds, записи token_usage пишутся пачками в фоне
+    
+    # Model routing: Flash/Pro по операции, размеру входа и бюджету латентности
+    LLM_ROUTER_PRO_OPERATIONS: List[str] = ["analyze"]  # операции, которым нужна Pro
+    LLM_ROUTER_PRO_MIN_INPUT_TOKENS: int = 2000  # короткий вход Flash разберет не хуже
+    LLM_ROUTER_PRO_MAX_INPUT_TOKENS: int = 200000  # длиннее - Pro дорога и медленна
+    LLM_ROUTER_LATENCY_BUDGETS: Dict[str, float] = {"chat": 15.0, "chat_stream": 15.0, "analyze": 60.0}
+    LLM_ROUTER_MIN_SAMPLES: int = 20  # замеров до использования перцентилей
+    LLM_HEDGE_ENABLED: bool = True
+    LLM_HEDGE_PERCENTILE: float = 0.9  # дольше p90 Pro - параллельный запрос к Flash
+    LLM_HEDGE_DEFAULT_DELAY: float = 20.0  # seconds, пока замеров мало
+    
+    # Chat context
+    CHAT_CONTEXT_TOKEN_BUDGET: int = 4000  # токенов истории в промпте
+    CHAT_CONTEXT_MAX_MESSAGE_TOKENS: int = 1000  # длинные сообщения обрезаются
+    CHAT_SUMMARY_MAX_TOKENS: int = 512
+    CHAT_HISTORY_CACHE_MESSAGES: int = 200  # хвост истории на проект в памяти
+    CHAT_HISTORY_CACHE_PROJECTS: int = 500
+    
+    # Document generation: "single" (один промпт), "sections" (секции параллельно)
+    # или "delta" (обновить последнюю версию документа только по новым сообщениям)
+    DOCUMENT_GENERATION_MODE: str = "single"
+    
+    # Background jobs
+    JOB_WORKERS: int = 2  # одновременно выполняемых фоновых задач
+    
+    # LLM response cache
+    LLM_CACHE_MAX_ENTRIES: int = 1000
+    LLM_CACHE_MAX_BYTES: int = 50 * 1024 * 1024  # 50MB
+    LLM_CACHE_TTL: int = 24 * 60 * 60  # seconds
+    LLM_CACHE_PERSISTENT: bool = False  # хранить кэш в БД (таблица llm_cache)
+    LLM_CACHE_DB_MAX_ENTRIES: int = 10000
+    LLM_CACHE_FLUSH_INTERVAL: float = 1.0  # seconds, записи в llm_cache пишутся пачками в фоне
+    
+    # Provider-side context cache: длинные неизменные префиксы промптов
+    LLM_CONTEXT_CACHE_ENABLED: bool = True
+    LLM_CONTEXT_CACHE_TTL: int = 60 * 60  # seconds
+    LLM_CONTEXT_CACHE_MIN_TOKENS: int = 1024  # минимальный размер кэша у Gemini 2.5 Flash
+    LLM_CONTEXT_CACHE_MAX_HANDLES: int = 100
+    LLM_CONTEXT_CACHE_MIN_USES: int = 2  # кэш создается, когда префикс использован повторно в пределах TTL
     
     # Database
     DATABASE_URL: str = "sqlite:///./database.db"
@@ -18,9 +81,30 @@ class Settings(BaseSettings):
     
     # File upload
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # загрузка копируется во временный файл частями
+    UPLOAD_MULTIPART_OVERHEAD: int = 64 * 1024  # заголовки multipart сверх MAX_FILE_SIZE
+    UPLOAD_TMP_DIR: Optional[str] = None  # по умолчанию системная временная папка
+    
+    # File extraction: пул процессов для разбора PDF/DOCX/XLSX
+    EXTRACTION_WORKERS: Optional[int] = None  # по умолчанию - число ядер; 0 - без пула, в потоке
+    EXTRACTION_TIMEOUT: float = 60.0  # seconds на один файл
+    EXTRACTION_MEMORY_LIMIT_MB: int = 1024  # адресное пространство воркера
+    EXTRACTION_MAX_TASKS_PER_WORKER: int = 100  # воркер перезапускается (утечки парсеров)
+    PDF_SPLIT_MIN_PAGES: int = 100  # PDF от стольких страниц разбирается диапазонами в нескольких воркерах
+    PDF_RANGE_MIN_PAGES: int = 25  # минимум страниц в одном диапазоне
+    
+    # File cache: текст и анализ загруженных файлов по SHA-256 содержимого (таблица file_cache)
+    FILE_CACHE_ENABLED: bool = True
+    FILE_CACHE_MAX_BYTES: int = 200 * 1024 * 1024  # 200MB текста и анализов, дальше - LRU
+    
+    # File analysis: длинный текст анализируется по чанкам во Flash (map-reduce)
+    FILE_ANALYSIS_SINGLE_PASS_CHARS: int = 50000  # текст не длиннее - один вызов Pro
+    FILE_ANALYSIS_CHUNK_CHARS: int = 30000  # символов в чанке
+    FILE_ANALYSIS_CHUNK_CONCURRENCY: int = 4  # одновременных вызовов по чанкам одного файла
+    FILE_ANALYSIS_MAX_CHARS: int = 2_000_000  # длиннее - ошибка 400, а не обрезанный текст
     ALLOWED_FILE_TYPES: List[str] = ["pdf", "docx", "xlsx"]
     
-    # Rate limiting
+    # Rate limiting (исходящие запросы к Gemini, на каждую модель)
     RATE_LIMIT_REQUESTS: int = 60  # requests per minute
     RATE_LIMIT_WINDOW: int = 60   # seconds
     
@@ -34,8 +118,4 @@ class Settings(BaseSettings):
         env_file = ".env"
         case_sensitive = True
 
-settings = Settings()
-
-# Validate critical settings
-if not settings.GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY environment variable is required")
\ No newline at end of file
+settings = Settings()
\ No newline at end of file
@@ -1,6 +1,6 @@
-from sqlalchemy import create_engine, Column, String, Text, DateTime, Integer, Boolean, ForeignKey
+from sqlalchemy import create_engine, inspect, text, Column, String, Text, DateTime, Integer, Boolean, Float, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.orm import sessionmaker, Session, relationship, deferred
 from sqlalchemy.sql import func
 import uuid
 from datetime import datetime
@@ -52,13 +52,102 @@ class Document(Base):
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     version = Column(Integer, default=1)
+    # Время последнего сообщения, вошедшего в версию: дельта берет сообщения после него
+    history_until = Column(DateTime, nullable=True)
     
     # Relationships
     project = relationship("Project", back_populates="documents")
 
+class ConversationSummary(Base):
+    __tablename__ = "conversation_summaries"
+    
+    project_id = Column(String, ForeignKey("projects.id"), primary_key=True)
+    summary = Column(Text, nullable=False)
+    message_count = Column(Integer, nullable=False)  # сколько сообщений вошло в summary
+    last_message_id = Column(String, nullable=False)  # последнее сообщение, вошедшее в summary
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    type = Column(String(50), nullable=False)
+    project_id = Column(String, ForeignKey("projects.id"), nullable=True)
+    status = Column(String(20), nullable=False, index=True)  # queued, running, succeeded, failed
+    progress = Column(Integer, default=0)
+    progress_message = Column(String(255), nullable=True)
+    params_json = Column(Text, nullable=False)  # JSON string
+    # Большой вход задачи (текст файла) - отдельно от params, до завершения задачи
+    payload = deferred(Column(Text, nullable=True))
+    result_json = Column(Text, nullable=True)  # JSON string
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache"
+    
+    key = Column(String(64), primary_key=True)  # SHA-256 от модели, промпта и конфига
+    value = Column(Text, nullable=False)  # JSON string
+    created_at = Column(Float, nullable=False, index=True)
+    expires_at = Column(Float, nullable=False)
+
+class FileCacheEntry(Base):
+    __tablename__ = "file_cache"
+    
+    sha256 = Column(String(64), primary_key=True)  # SHA-256 байтов загруженного файла
+    file_type = Column(String(10), nullable=False)
+    extracted_text = Column(Text, nullable=False)
+    metadata_json = Column(Text, nullable=False)  # JSON string
+    analysis_json = Column(Text, nullable=True)  # FileAnalysisResponse, после первого анализа
+    analysis_version = Column(String(64), nullable=True)  # версия промптов и моделей анализа
+    size = Column(Integer, nullable=False)  # текст + JSON - для вытеснения по FILE_CACHE_MAX_BYTES
+    created_at = Column(Float, nullable=False)
+    last_used_at = Column(Float, nullable=False, index=True)
+
+class TokenUsage(Base):
+    __tablename__ = "token_usage"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # Без внешнего ключа: учет сохраняется и после удаления проекта
+    project_id = Column(String, nullable=True, index=True)
+    operation = Column(String(50), nullable=False)  # chat, document, validate, diagram, ...
+    model = Column(String(100), nullable=False)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)
+    estimated = Column(Boolean, default=False)  # ответ без usage_metadata - оценка по длине
+    cost_usd = Column(Float, nullable=False, default=0.0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class TokenQuota(Base):
+    __tablename__ = "token_quotas"
+    
+    project_id = Column(String, ForeignKey("projects.id"), primary_key=True)
+    max_tokens = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Колонки, добавленные в уже существующие таблицы (create_all их не создает)
+_ADDED_COLUMNS = {
+    "documents": ["history_until DATETIME"],
+    "jobs": ["payload TEXT"],
+    "file_cache": ["analysis_version VARCHAR(64)"],
+}
+
 def init_db():
     """Initialize database - create tables"""
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+
+def _add_missing_columns():
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table, columns in _ADDED_COLUMNS.items():
+            existing = {column["name"] for column in inspector.get_columns(table)}
+            for column in columns:
+                if column.split()[0] not in existing:
+                    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column}"))
 
 def get_db() -> Session:
     """Dependency to get database session"""
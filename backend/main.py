@@ -7,7 +7,13 @@ from contextlib import asynccontextmanager
 
 from config import settings
 from database import init_db
-from routes import chat, document, validator, diagram, file as file_route, projects
+from services.gemini_service import shutdown_gemini_service
+from services.job_queue import job_queue
+from services.extraction_pool import extraction_pool
+from services.metrics import MetricsMiddleware
+from services.upload_limit import UploadSizeLimitMiddleware
+from services.usage_ledger import QuotaExceededError, usage_ledger
+from routes import chat, document, validator, diagram, file as file_route, projects, llm, jobs, metrics, usage
 
 # Настройка логирования
 logging.basicConfig(
@@ -23,9 +29,17 @@ async def lifespan(app: FastAPI):
     logger.info("Starting up AI Business Analyst Backend...")
     init_db()
     logger.info("Database initialized")
+    await job_queue.start()
+    logger.info(f"Job queue started with {job_queue.workers} workers")
+    await extraction_pool.warmup()
+    logger.info(f"Extraction pool started with {extraction_pool.workers} workers")
     yield
     # Shutdown
     logger.info("Shutting down...")
+    await job_queue.stop()
+    extraction_pool.stop()
+    shutdown_gemini_service()
+    usage_ledger.stop()
 
 # FastAPI app
 app = FastAPI(
@@ -37,6 +51,10 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Загрузки больше MAX_FILE_SIZE отклоняются до чтения всего тела.
+# add_middleware добавляет снаружи - CORS ниже оборачивает и ответ 413
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -46,6 +64,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Метрики запросов (/metrics)
+app.add_middleware(MetricsMiddleware)
+
 # Health check endpoint
 @app.get("/health", tags=["Health"])
 async def health_check():
@@ -56,6 +77,19 @@ async def health_check():
         "version": "1.0.0"
     }
 
+# Квота токенов проекта исчерпана
+@app.exception_handler(QuotaExceededError)
+async def quota_exceeded_handler(request: Request, exc: QuotaExceededError):
+    return JSONResponse(
+        status_code=429,
+        content={
+            "detail": str(exc),
+            "project_id": exc.project_id,
+            "used_tokens": exc.used,
+            "quota": exc.limit
+        }
+    )
+
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -75,6 +109,10 @@ app.include_router(validator.router)
 app.include_router(diagram.router)
 app.include_router(file_route.router)
 app.include_router(projects.router)
+app.include_router(llm.router)
+app.include_router(jobs.router)
+app.include_router(metrics.router)
+app.include_router(usage.router)
 
 if __name__ == "__main__":
     uvicorn.run(
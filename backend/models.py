@@ -15,6 +15,11 @@ class DiagramType(str, Enum):
     JOURNEY = "journey"
     ER = "erDiagram"
 
+class GenerationMode(str, Enum):
+    SINGLE = "single"       # один большой промпт
+    SECTIONS = "sections"   # секции параллельно
+    DELTA = "delta"         # обновить последнюю версию по новым сообщениям
+
 class Severity(str, Enum):
     HIGH = "high"
     MEDIUM = "medium"
@@ -29,7 +34,6 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     project_id: str = Field(..., description="Project ID")
     message: str = Field(..., description="User message")
-    history: Optional[List[ChatMessage]] = Field(default=[], description="Chat history")
 
 class ChatResponse(BaseModel):
     message: str = Field(..., description="AI response")
@@ -78,17 +82,25 @@ class KPI(BaseModel):
     target: float
     unit: str
 
+# Ключи словарей для схемы ответа LLM (Gemini не принимает объекты без properties)
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
 class DocumentContent(BaseModel):
     projectName: str
-    description: Dict[str, List[str]]  # {"paragraphs": ["text1", "text2"]}
+    description: Dict[str, List[str]] = Field(  # {"paragraphs": ["text1", "text2"]}
+        ..., json_schema_extra={"properties": {"paragraphs": _STRING_LIST}, "required": ["paragraphs"]}
+    )
     goals: List[Goal]
-    scope: Dict[str, List[str]]  # {"inScope": [...], "outOfScope": [...]}
+    scope: Dict[str, List[str]] = Field(  # {"inScope": [...], "outOfScope": [...]}
+        ..., json_schema_extra={"properties": {"inScope": _STRING_LIST, "outOfScope": _STRING_LIST}, "required": ["inScope", "outOfScope"]}
+    )
     businessRules: List[BusinessRule]
     useCases: List[UseCase]
     kpis: List[KPI]
 
 class DocumentGenerateRequest(BaseModel):
     project_id: str
+    mode: Optional[GenerationMode] = Field(None, description="Generation mode (default from settings)")
 
 class DocumentGenerateResponse(BaseModel):
     document: DocumentContent
@@ -127,6 +139,14 @@ class DiagramResponse(BaseModel):
     diagram_type: str
 
 # File models
+# Ответ LLM при анализе файла (схема structured output)
+class FileAnalysis(BaseModel):
+    projectName: str
+    goals: List[str]
+    requirements: List[str]
+    stakeholders: List[str]
+    description: str
+
 class FileAnalysisResponse(BaseModel):
     project_name: str
     goals: List[str]
@@ -135,6 +155,7 @@ class FileAnalysisResponse(BaseModel):
     description: str
     extracted_text_length: int
     file_type: str
+    cached: bool = False  # ответ взят из кэша файлов (тот же файл уже анализировали)
 
 # Section improvement models
 class SectionImprovementRequest(BaseModel):
@@ -149,4 +170,53 @@ class SectionImprovementResponse(BaseModel):
 class ChatHistoryResponse(BaseModel):
     messages: List[ChatMessage]
     total: int
-    project_id: str
\ No newline at end of file
+    project_id: str
+
+# Background job models
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+class JobResponse(BaseModel):
+    job_id: str
+    type: str
+    project_id: Optional[str] = None
+    status: JobStatus
+    progress: int = Field(0, ge=0, le=100)
+    progress_message: Optional[str] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+# Token usage models
+class UsageTotals(BaseModel):
+    calls: int
+    prompt_tokens: int
+    output_tokens: int
+    cached_tokens: int
+    total_tokens: int
+    cost_usd: float
+
+class OperationUsage(UsageTotals):
+    operation: str
+    model: str
+
+class ProjectUsageResponse(BaseModel):
+    project_id: str
+    total: UsageTotals
+    by_operation: List[OperationUsage]
+    quota: Optional[int] = Field(None, description="Token quota, None - unlimited")
+
+class DailyUsage(UsageTotals):
+    date: str
+
+class DailyUsageResponse(BaseModel):
+    project_id: Optional[str] = None
+    days: List[DailyUsage]
+
+class TokenQuotaRequest(BaseModel):
+    max_tokens: Optional[int] = Field(None, ge=1, description="Token quota, None - reset to default")
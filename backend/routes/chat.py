@@ -1,21 +1,29 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
-from typing import List
+from typing import List, Optional
+from contextlib import aclosing
+import json
+import logging
 import uuid
 from datetime import datetime
 
-from database import get_db, Message, Project
+from database import get_db, SessionLocal, Message, Project, ConversationSummary
 from models import ChatRequest, ChatResponse, ChatMessage, ChatHistoryResponse
-from services.gemini_service import GeminiService
+from services.gemini_service import GeminiService, get_gemini_service
+from services.context_builder import ContextBuilder
+from services.history_cache import chat_history_cache
+from services.usage_ledger import usage_ledger
 
 router = APIRouter(prefix="/api/chat", tags=["Chat"])
-gemini_service = GeminiService()
+logger = logging.getLogger(__name__)
 
 @router.post("/message", response_model=ChatResponse)
 async def send_message(
     request: ChatRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    gemini_service: GeminiService = Depends(get_gemini_service)
 ):
     """
     Отправить сообщение в чат и получить ответ от AI
@@ -28,6 +36,12 @@ async def send_message(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
+    # Квота токенов проекта (429), до сохранения сообщения
+    await usage_ledger.check_quota(request.project_id)
+    
+    # История до текущего сообщения (из кэша хвоста, без запроса к БД)
+    history = chat_history_cache.get(db, request.project_id)
+    
     # Сохранить сообщение пользователя
     user_message = Message(
         id=str(uuid.uuid4()),
@@ -39,22 +53,22 @@ async def send_message(
     db.add(user_message)
     db.commit()
     db.refresh(user_message)
+    chat_history_cache.append(user_message)
     
     try:
-        # Подготовить контекст из истории
-        context = []
-        if request.history:
-            context = [
-                {"role": msg.role, "content": msg.content} 
-                for msg in request.history
-            ]
-        
-        # Вызвать Gemini
-        ai_response = await gemini_service.chat_completion(
-            prompt=request.message,
-            context=context,
-            temperature=0.7
-        )
+        with usage_ledger.scope(request.project_id, check_quota=False) as usage:
+            # Подготовить контекст из истории в пределах бюджета токенов
+            summary, context = await ContextBuilder(gemini_service).build(
+                db, request.project_id, history
+            )
+            
+            # Вызвать Gemini
+            ai_response = await gemini_service.chat_completion(
+                prompt=request.message,
+                context=context,
+                temperature=0.7,
+                summary=summary
+            )
         
         # Сохранить ответ AI
         ai_message = Message(
@@ -62,16 +76,19 @@ async def send_message(
             project_id=request.project_id,
             role="assistant",
             content=ai_response,
-            timestamp=datetime.utcnow()
+            timestamp=datetime.utcnow(),
+            tokens_used=usage.total_tokens
         )
         db.add(ai_message)
         db.commit()
         db.refresh(ai_message)
+        chat_history_cache.append(ai_message)
         
         return ChatResponse(
             message=ai_response,
             message_id=ai_message.id,
-            timestamp=ai_message.timestamp
+            timestamp=ai_message.timestamp,
+            tokens_used=ai_message.tokens_used
         )
         
     except Exception as e:
@@ -80,12 +97,126 @@ async def send_message(
         # Удалить пользовательское сообщение при ошибке
         db.delete(user_message)
         db.commit()
+        chat_history_cache.invalidate(request.project_id)
         
         raise HTTPException(
             status_code=503,
             detail=f"AI service unavailable: {str(e)}"
         )
 
+@router.post("/stream")
+async def stream_message(
+    request: ChatRequest,
+    db: Session = Depends(get_db),
+    gemini_service: GeminiService = Depends(get_gemini_service)
+):
+    """
+    Отправить сообщение в чат и получить ответ AI потоком (Server-Sent Events)
+    
+    События: token (фрагмент текста), done (id сохраненного ответа), error.
+    Сообщения сохраняются в БД после завершения или обрыва потока.
+    """
+    # Проверить существование проекта
+    project = db.query(Project).filter(
+        Project.id == request.project_id
+    ).first()
+    
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    # Квота токенов проекта (429) - до начала потока
+    await usage_ledger.check_quota(request.project_id)
+    
+    # Подготовить контекст из истории в пределах бюджета токенов
+    history = chat_history_cache.get(db, request.project_id)
+    with usage_ledger.scope(request.project_id, check_quota=False) as context_usage:
+        summary, context = await ContextBuilder(gemini_service).build(
+            db, request.project_id, history
+        )
+    user_timestamp = datetime.utcnow()
+    
+    async def event_stream():
+        chunks = []
+        ai_message_id = str(uuid.uuid4())
+        with usage_ledger.scope(request.project_id, check_quota=False) as usage:
+            try:
+                # aclosing: обрыв клиентом сразу закрывает поток модели
+                async with aclosing(gemini_service.stream_chat_completion(
+                    prompt=request.message,
+                    context=context,
+                    summary=summary
+                )) as stream:
+                    async for chunk in stream:
+                        chunks.append(chunk)
+                        yield _sse("token", {"text": chunk})
+                
+                yield _sse("done", {
+                    "message_id": ai_message_id,
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "tokens_used": context_usage.total_tokens + usage.total_tokens
+                })
+            except Exception as e:
+                logger.error(f"Chat stream error: {e}")
+                yield _sse("error", {"detail": f"AI service unavailable: {str(e)}"})
+            finally:
+                # Сохраняем диалог, даже если клиент оборвал поток на середине
+                if chunks:
+                    _save_exchange(
+                        request.project_id,
+                        request.message,
+                        user_timestamp,
+                        ai_message_id,
+                        "".join(chunks).strip(),
+                        context_usage.total_tokens + usage.total_tokens
+                    )
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _sse(event: str, data: dict) -> str:
+    """Сформировать одно SSE событие"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _save_exchange(
+    project_id: str,
+    user_content: str,
+    user_timestamp: datetime,
+    ai_message_id: str,
+    ai_content: str,
+    tokens_used: Optional[int] = None
+):
+    """Сохранить сообщение пользователя и ответ AI после завершения потока"""
+    db = SessionLocal()
+    try:
+        user_message = Message(
+            id=str(uuid.uuid4()),
+            project_id=project_id,
+            role="user",
+            content=user_content,
+            timestamp=user_timestamp
+        )
+        ai_message = Message(
+            id=ai_message_id,
+            project_id=project_id,
+            role="assistant",
+            content=ai_content,
+            timestamp=datetime.utcnow(),
+            tokens_used=tokens_used
+        )
+        db.add(user_message)
+        db.add(ai_message)
+        db.commit()
+        chat_history_cache.append(user_message)
+        chat_history_cache.append(ai_message)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to save streamed chat messages: {e}")
+    finally:
+        db.close()
+
 @router.get("/history/{project_id}", response_model=ChatHistoryResponse)
 async def get_chat_history(
     project_id: str,
@@ -143,7 +274,13 @@ async def clear_chat_history(
         Message.project_id == project_id
     ).update({"deleted": True})
     
+    # Краткое содержание очищенной беседы больше не нужно
+    db.query(ConversationSummary).filter(
+        ConversationSummary.project_id == project_id
+    ).delete()
+    
     db.commit()
+    chat_history_cache.invalidate(project_id)
     
     return {
         "message": f"Chat history cleared for project {project_id}",
@@ -1,21 +1,33 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
 from models import DiagramRequest, DiagramResponse, DiagramType
-from services.gemini_service import GeminiService
+from services.gemini_service import GeminiService, get_gemini_service
+from services.usage_ledger import usage_ledger
 
 router = APIRouter(prefix="/api/diagrams", tags=["Diagrams"])
-gemini_service = GeminiService()
 
 @router.post("/generate", response_model=DiagramResponse)
-async def generate_diagram(request: DiagramRequest):
+async def generate_diagram(
+    request: DiagramRequest,
+    use_cache: bool = True,
+    project_id: Optional[str] = None,
+    gemini_service: GeminiService = Depends(get_gemini_service)
+):
     """
     Сгенерировать Mermaid диаграмму на основе описания процесса
+    (project_id - учесть расход токенов в проекте)
     """
+    if project_id:
+        await usage_ledger.check_quota(project_id)
+    
     try:
         # Генерируем диаграмму через Gemini
-        mermaid_code = await gemini_service.generate_diagram(
-            description=request.description,
-            diagram_type=request.diagram_type.value
-        )
+        with usage_ledger.scope(project_id, check_quota=False):
+            mermaid_code = await gemini_service.generate_diagram(
+                description=request.description,
+                diagram_type=request.diagram_type.value,
+                use_cache=use_cache
+            )
         
         return DiagramResponse(
             mermaid_code=mermaid_code,
@@ -29,7 +41,11 @@ async def generate_diagram(request: DiagramRequest):
         )
 
 @router.post("/generate-from-usecase")
-async def generate_diagram_from_usecase(usecase: dict, diagram_type: DiagramType):
+async def generate_diagram_from_usecase(
+    usecase: dict,
+    diagram_type: DiagramType,
+    gemini_service: GeminiService = Depends(get_gemini_service)
+):
     """
     Сгенерировать диаграмму на основе use case
     """
@@ -61,7 +77,10 @@ async def generate_diagram_from_usecase(usecase: dict, diagram_type: DiagramType
         )
 
 @router.post("/generate-process-flow")
-async def generate_process_flow(business_rules: list):
+async def generate_process_flow(
+    business_rules: list,
+    gemini_service: GeminiService = Depends(get_gemini_service)
+):
     """
     Сгенерировать диаграмму бизнес-процесса на основе бизнес-правил
     """
@@ -1,27 +1,141 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from contextlib import aclosing
+from typing import Awaitable, Callable, Dict, List, Optional
 import json
+import logging
 import uuid
 from datetime import datetime
 
-from database import get_db, Project, Message, Document
-from models import DocumentGenerateRequest, DocumentGenerateResponse, SectionImprovementRequest, SectionImprovementResponse
-from services.gemini_service import GeminiService
+from database import get_db, SessionLocal, Project, Message, Document
+from config import settings
+from models import DocumentGenerateRequest, DocumentGenerateResponse, GenerationMode, SectionImprovementRequest, SectionImprovementResponse
+from services.gemini_service import GeminiService, get_gemini_service
+from services.usage_ledger import usage_ledger
 
 router = APIRouter(prefix="/api/documents", tags=["Documents"])
-gemini_service = GeminiService()
+
+logger = logging.getLogger(__name__)
 
 @router.post("/generate", response_model=DocumentGenerateResponse)
 async def generate_document(
     request: DocumentGenerateRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    gemini_service: GeminiService = Depends(get_gemini_service)
 ):
     """
     Сгенерировать полный документ бизнес-требований на основе истории чата
     """
+    chat_history = load_chat_history(db, request.project_id)
+    await usage_ledger.check_quota(request.project_id)
+    
+    try:
+        return await generate_and_save_document(
+            db, gemini_service, request.project_id, chat_history, request.mode
+        )
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Document generation failed: {str(e)}"
+        )
+
+@router.post("/generate/stream")
+async def generate_document_stream(
+    request: DocumentGenerateRequest,
+    db: Session = Depends(get_db),
+    gemini_service: GeminiService = Depends(get_gemini_service)
+):
+    """
+    Сгенерировать документ потоком (Server-Sent Events).
+    
+    События:
+    - section: {"name": ключ секции, "content": значение} - секция готова
+    - done: документ сохранен (как ответ /generate)
+    - error: {"detail": "..."} - генерация не удалась, документ не сохранен
+    
+    Режим как у /generate: в дельта-режиме обновленная версия отдается
+    секциями сразу, без предыдущей версии или при ошибке - полная генерация.
+    Если диалог с последней версии не менялся, отдается она сама (done без
+    новой версии).
+    """
+    chat_history = load_chat_history(db, request.project_id)
+    await usage_ledger.check_quota(request.project_id)
+    mode = request.mode or GenerationMode(settings.DOCUMENT_GENERATION_MODE)
+    
+    async def event_stream():
+        sections = {}
+        with usage_ledger.scope(request.project_id, check_quota=False):
+            try:
+                latest, new_messages = None, []
+                if mode == GenerationMode.DELTA:
+                    session = SessionLocal()
+                    try:
+                        latest = _latest_document(session, request.project_id)
+                    finally:
+                        session.close()
+                    if latest is not None:
+                        new_messages = _new_messages(latest, chat_history)
+                
+                if latest is not None and not new_messages:
+                    # Диалог не менялся - последняя версия как есть, без проверки и новой записи
+                    response = document_response(latest)
+                    for name, content in response.document.dict().items():
+                        yield _sse("section", {"name": name, "content": content})
+                    yield _sse("done", json.loads(response.json()))
+                    return
+                
+                updated = None
+                if latest is not None:
+                    updated = await gemini_service.update_document(
+                        json.loads(latest.content_json), new_messages, chat_history
+                    )
+                
+                if updated is not None:
+                    for name, content in updated.items():
+                        sections[name] = content
+                        yield _sse("section", {"name": name, "content": content})
+                else:
+                    stream_mode = GenerationMode.SECTIONS if mode == GenerationMode.SECTIONS else GenerationMode.SINGLE
+                    async with aclosing(gemini_service.stream_document(chat_history, stream_mode)) as stream:
+                        async for name, content in stream:
+                            sections[name] = content
+                            yield _sse("section", {"name": name, "content": content})
+                
+                document_content = gemini_service.complete_document(sections, chat_history)
+                quality_score = await gemini_service.validate_document(document_content)
+                
+                # Сессия запроса к этому моменту может быть уже закрыта
+                session = SessionLocal()
+                try:
+                    response = save_document(
+                        session, request.project_id, document_content, quality_score, history_until(chat_history)
+                    )
+                finally:
+                    session.close()
+                yield _sse("done", json.loads(response.json()))
+            except Exception as e:
+                logger.error(f"Document stream error: {e}")
+                yield _sse("error", {"detail": f"Document generation failed: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _sse(event: str, data: dict) -> str:
+    """Сформировать одно SSE событие"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def load_chat_history(db: Session, project_id: str) -> List[Dict]:
+    """
+    История чата проекта для генерации документа (404/400 если ее нет)
+    """
     # Проверить существование проекта
     project = db.query(Project).filter(
-        Project.id == request.project_id
+        Project.id == project_id
     ).first()
     
     if not project:
@@ -29,7 +143,7 @@ async def generate_document(
     
     # Получить историю чата
     messages = db.query(Message).filter(
-        Message.project_id == request.project_id,
+        Message.project_id == project_id,
         Message.deleted == False
     ).order_by(Message.timestamp).all()
     
@@ -40,45 +154,112 @@ async def generate_document(
         )
     
     # Подготовить историю для Gemini
-    chat_history = [
-        {"role": msg.role, "content": msg.content}
+    # timestamp - чтобы версия документа запомнила, до какого сообщения она собрана
+    return [
+        {"role": msg.role, "content": msg.content, "timestamp": msg.timestamp}
         for msg in messages
     ]
-    
-    try:
+
+async def generate_and_save_document(
+    db: Session,
+    gemini_service: GeminiService,
+    project_id: str,
+    chat_history: List[Dict],
+    mode: Optional[GenerationMode] = None,
+    progress: Optional[Callable[[int, str], Awaitable[None]]] = None
+) -> DocumentGenerateResponse:
+    """
+    Сгенерировать документ, оценить качество и сохранить новую версию.
+    Используется эндпоинтом и фоновой задачей (progress - для статуса задачи).
+    Квоту проекта проверяет вызывающий код.
+    """
+    with usage_ledger.scope(project_id, check_quota=False):
         # Генерировать документ через Gemini
-        document_content = await gemini_service.generate_document(chat_history)
+        mode = mode or GenerationMode(settings.DOCUMENT_GENERATION_MODE)
+        if progress:
+            await progress(10, "Генерация документа")
+        document_content = None
+        if mode == GenerationMode.DELTA:
+            latest = _latest_document(db, project_id)
+            if latest is not None:
+                new_messages = _new_messages(latest, chat_history)
+                if not new_messages:
+                    # Диалог не менялся - последняя версия как есть, без проверки и новой записи
+                    return document_response(latest)
+                document_content = await gemini_service.update_document(
+                    json.loads(latest.content_json), new_messages, chat_history
+                )
+        
+        # Без предыдущей версии или при ошибке дельты - полная генерация
+        if document_content is None:
+            if mode == GenerationMode.SECTIONS:
+                document_content = await gemini_service.generate_document_sections(chat_history)
+            else:
+                document_content = await gemini_service.generate_document(chat_history)
         
         # Вычислить базовую оценку качества
+        if progress:
+            await progress(70, "Проверка качества")
         quality_score = await gemini_service.validate_document(document_content)
-        
-        # Сохранить документ в БД
-        document_record = Document(
-            id=str(uuid.uuid4()),
-            project_id=request.project_id,
-            content_json=json.dumps(document_content, ensure_ascii=False),
-            quality_score=quality_score.get("qualityScore", {}).get("health", 75),
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow(),
-            version=1
-        )
-        
-        db.add(document_record)
-        db.commit()
-        db.refresh(document_record)
-        
-        return DocumentGenerateResponse(
-            document=document_content,
-            quality_score=document_record.quality_score,
-            created_at=document_record.created_at,
-            document_id=document_record.id
-        )
-        
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Document generation failed: {str(e)}"
-        )
+    
+    return save_document(db, project_id, document_content, quality_score, history_until(chat_history))
+
+def history_until(chat_history: List[Dict]) -> Optional[datetime]:
+    """Время последнего сообщения истории (load_chat_history) - граница версии документа"""
+    return chat_history[-1].get("timestamp") if chat_history else None
+
+def _new_messages(latest: Document, chat_history: List[Dict]) -> List[Dict]:
+    """
+    Дельта-режим: сообщения истории, которые не вошли в версию latest.
+    Граница - последнее сообщение, из которого собрана версия, а не время
+    ее сохранения: сообщение, отправленное во время генерации, не теряется
+    """
+    # Версии без history_until (сохранены до появления колонки) - по времени сохранения
+    until = latest.history_until or latest.created_at
+    return [msg for msg in chat_history if msg.get("timestamp") and msg["timestamp"] > until]
+
+def _latest_document(db: Session, project_id: str) -> Optional[Document]:
+    return db.query(Document).filter(
+        Document.project_id == project_id
+    ).order_by(Document.created_at.desc()).first()
+
+def save_document(
+    db: Session,
+    project_id: str,
+    document_content: Dict,
+    quality_score: Dict,
+    history_until: Optional[datetime] = None
+) -> DocumentGenerateResponse:
+    """
+    Сохранить сгенерированный документ с оценкой качества как следующую версию;
+    history_until - время последнего сообщения, из которого собран документ
+    """
+    latest = _latest_document(db, project_id)
+    document_record = Document(
+        id=str(uuid.uuid4()),
+        project_id=project_id,
+        content_json=json.dumps(document_content, ensure_ascii=False),
+        quality_score=quality_score.get("qualityScore", {}).get("health", 75),
+        created_at=datetime.utcnow(),
+        updated_at=datetime.utcnow(),
+        version=(latest.version or 0) + 1 if latest else 1,
+        history_until=history_until
+    )
+    
+    db.add(document_record)
+    db.commit()
+    db.refresh(document_record)
+    
+    return document_response(document_record)
+
+def document_response(document_record: Document) -> DocumentGenerateResponse:
+    """Ответ /generate для сохраненной версии документа"""
+    return DocumentGenerateResponse(
+        document=json.loads(document_record.content_json),
+        quality_score=document_record.quality_score,
+        created_at=document_record.created_at,
+        document_id=document_record.id
+    )
 
 @router.get("/{document_id}")
 async def get_document(
@@ -154,17 +335,26 @@ async def get_project_documents(
 @router.post("/improve-section", response_model=SectionImprovementResponse)
 async def improve_section(
     request: SectionImprovementRequest,
-    db: Session = Depends(get_db)
+    use_cache: bool = True,
+    project_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+    gemini_service: GeminiService = Depends(get_gemini_service)
 ):
     """
     Улучшить секцию документа на основе выявленной проблемы
+    (project_id - учесть расход токенов в проекте)
     """
+    if project_id:
+        await usage_ledger.check_quota(project_id)
+    
     try:
         # Улучшить секцию через Gemini
-        improved_text = await gemini_service.improve_section(
-            section_text=request.section_text,
-            issue_description=request.issue_description
-        )
+        with usage_ledger.scope(project_id, check_quota=False):
+            improved_text = await gemini_service.improve_section(
+                section_text=request.section_text,
+                issue_description=request.issue_description,
+                use_cache=use_cache
+            )
         
         # Определить основные изменения (простая эвристика)
         changes_made = []
@@ -1,54 +1,62 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, NamedTuple, Optional, Tuple
+import hashlib
+import os
+import tempfile
+import time
 import uuid
 from datetime import datetime
 
 from database import get_db, Project
 from models import FileAnalysisResponse
-from services.gemini_service import GeminiService
-from utils.file_processor import FileProcessor
+from services.gemini_service import GeminiService, FileAnalysisError, get_gemini_service, fallback_file_analysis
+from services.usage_ledger import usage_ledger
+from services.model_router import latency_budget
+from services.upload_limit import file_too_large_detail
+from services.extraction_pool import extraction_pool
+from services.file_cache import CachedFile, file_cache
 from config import settings
 
 router = APIRouter(prefix="/api/files", tags=["Files"])
-gemini_service = GeminiService()
-file_processor = FileProcessor()
+UPLOAD_LATENCY_BUDGET = settings.LLM_ROUTER_LATENCY_BUDGETS.get("analyze", settings.GEMINI_TIMEOUT)
 
 @router.post("/upload", response_model=FileAnalysisResponse)
 async def upload_and_analyze_file(
     file: UploadFile = File(...),
     project_id: str = None,
-    db: Session = Depends(get_db)
+    use_cache: bool = True,
+    force: bool = False,
+    db: Session = Depends(get_db),
+    gemini_service: GeminiService = Depends(get_gemini_service)
 ):
     """
-    Загрузить и проанализировать файл (PDF, DOCX, XLSX)
+    Загрузить и проанализировать файл (PDF, DOCX, XLSX).
+    Повторная загрузка того же файла возвращает сохраненный анализ;
+    use_cache=false - проанализировать заново (текст берется из кэша файлов),
+    force=true - разобрать и проанализировать файл заново
     """
+    # Бюджет латентности запроса: анализ получает то, что осталось после извлечения текста
+    started = time.monotonic()
+    
     # Проверить проект если указан
     if project_id:
         project = db.query(Project).filter(Project.id == project_id).first()
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
+        await usage_ledger.check_quota(project_id)
     
-    # Читаем содержимое файла
     try:
-        contents = await file.read()
-    except Exception as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Failed to read file: {str(e)}"
-        )
-    
-    # Проверка размера файла
-    if not file_processor.validate_file_size(contents, settings.MAX_FILE_SIZE):
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE // (1024*1024)}MB"
-        )
-    
-    try:
-        # Обработать файл
-        extracted_text, file_type, metadata = file_processor.process_file(
-            contents, file.filename or ""
-        )
+        # Сохранить загрузку во временный файл и извлечь из него текст
+        async with save_upload(file) as upload:
+            cached = None if force else await run_in_threadpool(
+                file_cache.get, upload.sha256, gemini_service.file_analysis_version
+            )
+            if use_cache and cached is not None and cached.analysis is not None:
+                return FileAnalysisResponse(**{**cached.analysis, "cached": True})
+            extracted_text, file_type, metadata = await extract_cached(upload, file.filename, cached)
         
         if not extracted_text.strip():
             raise HTTPException(
@@ -57,29 +65,26 @@ async def upload_and_analyze_file(
             )
         
         # Проанализировать содержимое через Gemini
-        analysis_result = await gemini_service.analyze_file(extracted_text)
+        with usage_ledger.scope(project_id, check_quota=False), latency_budget(UPLOAD_LATENCY_BUDGET, started):
+            try:
+                analysis_result = await gemini_service.analyze_file(
+                    extracted_text, use_cache=use_cache and not force, fallback=False
+                )
+                analyzed = True
+            except FileAnalysisError:
+                # Резервный ответ не кэшируется - следующая загрузка повторит анализ
+                analysis_result, analyzed = fallback_file_analysis(), False
 
-        # Extract fields from Gemini analysis
-        project_name = analysis_result.get("projectName", "Неизвестный проект")
-        goals = analysis_result.get("goals", ["Анализ файла выполнен"])
-        requirements = analysis_result.get("requirements", ["Требует дополнительной обработки"])
-        stakeholders = analysis_result.get("stakeholders", ["Не определены"])
-        description = analysis_result.get("description", "Анализ завершен успешно")
-        
-        # Convert to strings if they're objects
-        if isinstance(goals, list) and len(goals) > 0 and isinstance(goals[0], dict):
-            goals = [goal.get("text", str(goal)) for goal in goals]
-        
-        return FileAnalysisResponse(
-            project_name=project_name,
-            goals=goals if isinstance(goals, list) else [str(goals)],
-            requirements=requirements if isinstance(requirements, list) else [str(requirements)],
-            stakeholders=stakeholders if isinstance(stakeholders, list) else [str(stakeholders)],
-            description=description,
-            extracted_text_length=len(extracted_text),
-            file_type=file_type
-        )
+        response = build_file_analysis_response(analysis_result, extracted_text, file_type)
+        if analyzed:
+            await run_in_threadpool(
+                file_cache.put, upload.sha256, file_type, extracted_text, metadata,
+                response.dict(exclude={"cached"}), gemini_service.file_analysis_version
+            )
+        return response
         
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -88,32 +93,112 @@ async def upload_and_analyze_file(
             detail=f"File processing failed: {str(e)}"
         )
 
-@router.post("/extract-text")
-async def extract_text_only(file: UploadFile = File(...)):
+class SavedUpload(NamedTuple):
+    path: str
+    sha256: str  # хэш содержимого - ключ кэша файлов
+    size: int
+
+@asynccontextmanager
+async def save_upload(file: UploadFile) -> AsyncIterator[SavedUpload]:
     """
-    Просто извлечь текст из файла без AI анализа
+    Скопировать загруженный файл частями во временный файл и отдать путь
+    к нему и SHA-256 содержимого; файл удаляется при выходе из блока.
+    Копирование прерывается (413), как только превышен MAX_FILE_SIZE, -
+    в памяти не бывает больше одной части файла. Ошибка чтения - 400.
     """
-    # Читаем файл
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    target = tempfile.NamedTemporaryFile(prefix="upload_", suffix=suffix, dir=settings.UPLOAD_TMP_DIR, delete=False)
     try:
-        contents = await file.read()
-    except Exception as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Failed to read file: {str(e)}"
-        )
+        size = 0
+        digest = hashlib.sha256()
+        with target:
+            while True:
+                try:
+                    chunk = await file.read(settings.UPLOAD_CHUNK_SIZE)
+                except Exception as e:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Failed to read file: {str(e)}"
+                    )
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > settings.MAX_FILE_SIZE:
+                    raise HTTPException(status_code=413, detail=file_too_large_detail())
+                digest.update(chunk)
+                await run_in_threadpool(target.write, chunk)
+        
+        yield SavedUpload(target.name, digest.hexdigest(), size)
+    finally:
+        os.unlink(target.name)
+
+async def extract_cached(
+    upload: SavedUpload,
+    filename: Optional[str],
+    cached: Optional[CachedFile]
+) -> Tuple[str, str, dict]:
+    """
+    Текст файла из записи кэша, если она есть, иначе извлечь его в пуле
+    и сохранить в кэш файлов
+    """
+    if cached is not None:
+        return cached.extracted_text, cached.file_type, cached.metadata
+    extracted_text, file_type, metadata = await extraction_pool.extract(upload.path, filename or "")
+    if extracted_text.strip():
+        await run_in_threadpool(file_cache.put, upload.sha256, file_type, extracted_text, metadata)
+    return extracted_text, file_type, metadata
+
+def build_file_analysis_response(
+    analysis_result: Dict,
+    extracted_text: str,
+    file_type: str
+) -> FileAnalysisResponse:
+    """
+    Привести результат анализа Gemini к FileAnalysisResponse
+    """
+    # Extract fields from Gemini analysis
+    project_name = analysis_result.get("projectName", "Неизвестный проект")
+    goals = analysis_result.get("goals", ["Анализ файла выполнен"])
+    requirements = analysis_result.get("requirements", ["Требует дополнительной обработки"])
+    stakeholders = analysis_result.get("stakeholders", ["Не определены"])
+    description = analysis_result.get("description", "Анализ завершен успешно")
     
-    # Проверка размера
-    if not file_processor.validate_file_size(contents, settings.MAX_FILE_SIZE):
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE // (1024*1024)}MB"
-        )
+    # Convert to strings if they're objects
+    if isinstance(goals, list) and len(goals) > 0 and isinstance(goals[0], dict):
+        goals = [goal.get("text", str(goal)) for goal in goals]
     
+    return FileAnalysisResponse(
+        project_name=project_name,
+        goals=goals if isinstance(goals, list) else [str(goals)],
+        requirements=requirements if isinstance(requirements, list) else [str(requirements)],
+        stakeholders=stakeholders if isinstance(stakeholders, list) else [str(stakeholders)],
+        description=description,
+        extracted_text_length=len(extracted_text),
+        file_type=file_type
+    )
+
+@router.post("/extract-text")
+async def extract_text_only(
+    file: UploadFile = File(...),
+    first_page: int = Query(1, ge=1, description="Первая страница PDF (с 1)"),
+    last_page: Optional[int] = Query(None, ge=1, description="Последняя страница PDF, включительно (например, без приложений)"),
+    force: bool = False
+):
+    """
+    Просто извлечь текст из файла без AI анализа
+    (весь файл - из кэша файлов, если его уже загружали; force=true - разобрать заново)
+    """
     try:
-        # Извлечь текст
-        extracted_text, file_type, metadata = file_processor.process_file(
-            contents, file.filename or ""
-        )
+        # Извлечь текст из временной копии загрузки
+        async with save_upload(file) as upload:
+            if first_page == 1 and last_page is None:
+                cached = None if force else await run_in_threadpool(file_cache.get, upload.sha256)
+                extracted_text, file_type, metadata = await extract_cached(upload, file.filename, cached)
+            else:
+                # Диапазон страниц не кэшируется - в кэше только текст всего файла
+                extracted_text, file_type, metadata = await extraction_pool.extract(
+                    upload.path, file.filename or "", first_page, last_page
+                )
         
         return {
             "filename": file.filename,
@@ -123,6 +208,8 @@ async def extract_text_only(file: UploadFile = File(...)):
             "metadata": metadata
         }
         
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -134,6 +221,7 @@ async def extract_text_only(file: UploadFile = File(...)):
 @router.post("/analyze-requirements")
 async def analyze_requirements_from_text(
     text_content: dict,  # {"text": "content to analyze"}
+    gemini_service: GeminiService = Depends(get_gemini_service)
 ):
     """
     Проанализировать требования из предоставленного текста
@@ -147,9 +235,12 @@ async def analyze_requirements_from_text(
                 detail="Text content is required"
             )
         
-        # Ограничиваем размер текста
-        if len(text) > 100000:  # 100k символов
-            text = text[:100000] + "...[текст обрезан]"
+        # Длинный текст не обрезается - analyze_file разбирает его по чанкам
+        if len(text) > settings.FILE_ANALYSIS_MAX_CHARS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Text is too long: {len(text)} characters, maximum is {settings.FILE_ANALYSIS_MAX_CHARS}"
+            )
         
         # Анализируем через Gemini
         analysis_result = await gemini_service.analyze_file(text)
@@ -160,12 +251,36 @@ async def analyze_requirements_from_text(
             "timestamp": datetime.utcnow()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Requirements analysis failed: {str(e)}"
         )
 
+@router.get("/extraction-pool")
+async def get_extraction_pool_stats():
+    """
+    Состояние пула процессов извлечения текста: воркеры, таймауты, падения
+    """
+    return extraction_pool.stats()
+
+@router.get("/cache")
+async def get_file_cache_stats():
+    """
+    Статистика кэша файлов по хэшу содержимого: записи, размер, попадания
+    """
+    return await run_in_threadpool(file_cache.stats)
+
+@router.delete("/cache")
+async def clear_file_cache():
+    """
+    Удалить сохраненный текст и анализы всех файлов
+    """
+    deleted = await run_in_threadpool(file_cache.clear)
+    return {"message": "File cache cleared", "deleted": deleted}
+
 @router.get("/supported-formats")
 async def get_supported_formats():
     """
@@ -0,0 +1,190 @@
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+import json
+from typing import Optional
+
+from database import get_db, SessionLocal, Project
+from models import DocumentGenerateRequest, GenerationMode, ValidationRequest, ValidationResponse, JobResponse
+from services.gemini_service import GeminiService, get_gemini_service
+from services.job_queue import job_queue, ProgressCallback
+from services.usage_ledger import usage_ledger
+from routes.document import load_chat_history, generate_and_save_document
+from routes.file import save_upload, extract_cached, build_file_analysis_response
+from services.file_cache import file_cache
+from services.gemini_service import FileAnalysisError, fallback_file_analysis
+
+router = APIRouter(prefix="/api/jobs", tags=["Jobs"])
+
+# Обработчики задач
+
+async def _run_document_generation(params: dict, progress: ProgressCallback) -> dict:
+    db = SessionLocal()
+    try:
+        chat_history = load_chat_history(db, params["project_id"])
+        response = await generate_and_save_document(
+            db,
+            get_gemini_service(),
+            params["project_id"],
+            chat_history,
+            GenerationMode(params["mode"]) if params.get("mode") else None,
+            progress=progress
+        )
+        return json.loads(response.json())
+    finally:
+        db.close()
+
+async def _run_file_analysis(params: dict, progress: ProgressCallback) -> dict:
+    if params.get("analysis"):
+        # Файл уже анализировали - результат взят из кэша файлов при постановке
+        return params["analysis"]
+    # Текст файла хранится в задаче (payload); "text" и ссылка на кэш файлов -
+    # задачи, поставленные прежними версиями
+    text = params.get("payload", params.get("text"))
+    if text is None:
+        text = await run_in_threadpool(file_cache.text, params["sha256"])
+        if text is None:
+            raise ValueError("Extracted text is no longer in the file cache, upload the file again")
+    await progress(10, "Анализ содержимого файла")
+    service = get_gemini_service()
+    with usage_ledger.scope(params.get("project_id"), check_quota=False):
+        try:
+            analysis_result = await service.analyze_file(
+                text, use_cache=params.get("use_cache", True), fallback=False
+            )
+            analyzed = True
+        except FileAnalysisError:
+            analysis_result, analyzed = fallback_file_analysis(), False
+    response = build_file_analysis_response(analysis_result, text, params["file_type"])
+    if params.get("sha256") and analyzed:
+        await run_in_threadpool(
+            file_cache.put_analysis, params["sha256"], response.dict(exclude={"cached"}), service.file_analysis_version
+        )
+    return response.dict()
+
+async def _run_validation(params: dict, progress: ProgressCallback) -> dict:
+    await progress(10, "Проверка качества документа")
+    with usage_ledger.scope(params.get("project_id"), check_quota=False):
+        validation_result = await get_gemini_service().validate_document(
+            params["document"], use_cache=params.get("use_cache", True)
+        )
+    return ValidationResponse(**validation_result).dict()
+
+job_queue.register("document_generation", _run_document_generation)
+job_queue.register("file_analysis", _run_file_analysis)
+job_queue.register("validation", _run_validation)
+
+# Эндпоинты
+
+@router.post("/documents/generate", response_model=JobResponse, status_code=202)
+async def submit_document_generation(
+    request: DocumentGenerateRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Поставить генерацию документа в очередь и сразу вернуть id задачи
+    """
+    # Ошибки во входных данных возвращаем сразу, а не через статус задачи
+    load_chat_history(db, request.project_id)
+    await usage_ledger.check_quota(request.project_id)
+    
+    return await job_queue.submit(
+        "document_generation",
+        {"project_id": request.project_id, "mode": request.mode.value if request.mode else None},
+        project_id=request.project_id
+    )
+
+@router.post("/files/analyze", response_model=JobResponse, status_code=202)
+async def submit_file_analysis(
+    file: UploadFile = File(...),
+    project_id: str = None,
+    use_cache: bool = True,
+    force: bool = False,
+    db: Session = Depends(get_db),
+    gemini_service: GeminiService = Depends(get_gemini_service)
+):
+    """
+    Извлечь текст из файла и поставить его AI анализ в очередь
+    (уже анализированный файл сразу завершает задачу; use_cache=false -
+    анализ заново по тексту из кэша файлов; force=true - разобрать заново)
+    """
+    if project_id:
+        project = db.query(Project).filter(Project.id == project_id).first()
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+        await usage_ledger.check_quota(project_id)
+    
+    try:
+        async with save_upload(file) as upload:
+            cached = None if force else await run_in_threadpool(
+                file_cache.get, upload.sha256, gemini_service.file_analysis_version
+            )
+            extracted_text, file_type, metadata = await extract_cached(upload, file.filename, cached)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not extracted_text.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="No text could be extracted from the file"
+        )
+    
+    params = {
+        "file_type": file_type,
+        "use_cache": use_cache and not force,
+        "project_id": project_id,
+        "sha256": upload.sha256
+    }
+    if use_cache and cached is not None and cached.analysis is not None:
+        params["analysis"] = {**cached.analysis, "cached": True}
+        return await job_queue.submit("file_analysis", params, project_id=project_id)
+    # Текст - в строке задачи: запись кэша файлов может быть вытеснена до ее запуска
+    return await job_queue.submit("file_analysis", params, project_id=project_id, payload=extracted_text)
+
+@router.post("/validator/analyze", response_model=JobResponse, status_code=202)
+async def submit_validation(
+    request: ValidationRequest,
+    use_cache: bool = True,
+    project_id: Optional[str] = None
+):
+    """
+    Поставить проверку качества документа в очередь
+    """
+    if project_id:
+        await usage_ledger.check_quota(project_id)
+    
+    return await job_queue.submit(
+        "validation",
+        {"document": request.document.dict(), "use_cache": use_cache, "project_id": project_id},
+        project_id=project_id
+    )
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """
+    Получить статус и результат задачи
+    """
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Поток изменений статуса задачи (Server-Sent Events) до ее завершения
+    """
+    if not await job_queue.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def event_stream():
+        async for job in job_queue.watch(job_id):
+            payload = JobResponse(**job).json()
+            yield f"event: {job['status']}\ndata: {payload}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,60 @@
+from fastapi import APIRouter, Depends
+
+from services.gemini_service import GeminiService, get_gemini_service
+
+router = APIRouter(prefix="/api/llm", tags=["LLM"])
+
+@router.get("/cache")
+async def get_cache_stats(
+    gemini_service: GeminiService = Depends(get_gemini_service)
+):
+    """
+    Статистика кэша ответов LLM (попадания, промахи, заполненность)
+    """
+    return gemini_service.cache.stats()
+
+@router.get("/coalescing")
+async def get_coalescing_stats(
+    gemini_service: GeminiService = Depends(get_gemini_service)
+):
+    """
+    Статистика объединения одинаковых одновременных запросов к LLM
+    """
+    return gemini_service.single_flight.stats()
+
+@router.get("/circuit")
+async def get_circuit_state(
+    gemini_service: GeminiService = Depends(get_gemini_service)
+):
+    """
+    Состояние circuit breaker и исходящего rate limiter для каждой модели
+    """
+    return gemini_service.resilience_stats()
+
+@router.get("/context-cache")
+async def get_context_cache_stats(
+    gemini_service: GeminiService = Depends(get_gemini_service)
+):
+    """
+    Кэши контекста на стороне провайдера: хэндлы, срок жизни, попадания
+    """
+    return gemini_service.context_cache.stats()
+
+@router.get("/routing")
+async def get_routing_stats(
+    gemini_service: GeminiService = Depends(get_gemini_service)
+):
+    """
+    Решения роутера моделей и латентность Flash/Pro по операциям
+    """
+    return gemini_service.router.stats()
+
+@router.delete("/cache")
+async def clear_cache(
+    gemini_service: GeminiService = Depends(get_gemini_service)
+):
+    """
+    Очистить кэш ответов LLM в памяти
+    """
+    gemini_service.cache.clear()
+    return {"message": "LLM response cache cleared"}
@@ -1,11 +1,14 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends
 from sqlalchemy.orm import Session
 from typing import List
 import uuid
 from datetime import datetime
 
-from database import get_db, Project
+from database import get_db, Project, Message, Document, ConversationSummary, TokenQuota
 from models import ProjectCreate, ProjectResponse
+from services.history_cache import chat_history_cache
+from services.gemini_service import drop_project_context
+from services.usage_ledger import usage_ledger
 
 router = APIRouter(prefix="/api/projects", tags=["Projects"])
 
@@ -127,6 +130,7 @@ async def update_project(
 @router.delete("/{project_id}")
 async def delete_project(
     project_id: str,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
@@ -137,9 +141,16 @@ async def delete_project(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Удаляем проект (каскадное удаление сообщений и документов происходит автоматически)
+    # SQLite не проверяет внешние ключи - связанные строки удаляем явно,
+    # одной транзакцией с проектом (учет токенов token_usage остается)
+    for model in (Message, Document, ConversationSummary, TokenQuota):
+        db.query(model).filter(model.project_id == project_id).delete(synchronize_session=False)
     db.delete(project)
     db.commit()
+    chat_history_cache.invalidate(project_id)
+    usage_ledger.forget_project(project_id)
+    # Кэши контекста файлов проекта у провайдера больше не нужны (удаление - вызов API)
+    background_tasks.add_task(drop_project_context, project_id)
     
     return {
         "message": f"Project {project_id} deleted successfully"
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from database import get_db, Project
+from models import ProjectUsageResponse, DailyUsageResponse, TokenQuotaRequest
+from services.usage_ledger import usage_ledger
+
+router = APIRouter(prefix="/api/usage", tags=["Usage"])
+
+@router.get("/projects/{project_id}", response_model=ProjectUsageResponse)
+async def get_project_usage(project_id: str):
+    """
+    Расход токенов и стоимость по проекту с разбивкой по операциям и моделям
+    """
+    return await run_in_threadpool(usage_ledger.project_usage, project_id)
+
+@router.get("/daily", response_model=DailyUsageResponse)
+async def get_daily_usage(
+    project_id: Optional[str] = None,
+    days: int = Query(30, ge=1, le=366)
+):
+    """
+    Расход токенов по дням (UTC), по проекту или по всем проектам
+    """
+    return DailyUsageResponse(
+        project_id=project_id,
+        days=await run_in_threadpool(usage_ledger.daily_usage, project_id, days)
+    )
+
+@router.put("/projects/{project_id}/quota", response_model=ProjectUsageResponse)
+async def set_project_quota(
+    project_id: str,
+    request: TokenQuotaRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Установить квоту токенов проекта (max_tokens = null - квота по умолчанию)
+    """
+    project = db.query(Project).filter(Project.id == project_id).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    await run_in_threadpool(usage_ledger.set_quota, project_id, request.max_tokens)
+    return await run_in_threadpool(usage_ledger.project_usage, project_id)
@@ -1,21 +1,32 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
 from models import ValidationRequest, ValidationResponse
-from services.gemini_service import GeminiService
+from services.gemini_service import GeminiService, get_gemini_service
+from services.usage_ledger import usage_ledger
 
 router = APIRouter(prefix="/api/validator", tags=["Validation"])
-gemini_service = GeminiService()
 
 @router.post("/analyze", response_model=ValidationResponse)
-async def analyze_document_quality(request: ValidationRequest):
+async def analyze_document_quality(
+    request: ValidationRequest,
+    use_cache: bool = True,
+    project_id: Optional[str] = None,
+    gemini_service: GeminiService = Depends(get_gemini_service)
+):
     """
     Проанализировать качество документа бизнес-требований
+    (project_id - учесть расход токенов в проекте)
     """
+    if project_id:
+        await usage_ledger.check_quota(project_id)
+    
     try:
         # Конвертируем Pydantic модель в словарь
         document_dict = request.document.dict()
         
         # Анализируем через Gemini
-        validation_result = await gemini_service.validate_document(document_dict)
+        with usage_ledger.scope(project_id, check_quota=False):
+            validation_result = await gemini_service.validate_document(document_dict, use_cache=use_cache)
         
         # Преобразуем результат в нужный формат
         from models import QualityScore, ValidationIssue
@@ -35,7 +46,10 @@ async def analyze_document_quality(request: ValidationRequest):
         )
 
 @router.post("/quick-check")
-async def quick_quality_check(document_section: dict):
+async def quick_quality_check(
+    document_section: dict,
+    gemini_service: GeminiService = Depends(get_gemini_service)
+):
     """
     Быстрая проверка качества отдельной секции документа
     """
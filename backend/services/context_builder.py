@@ -0,0 +1,132 @@
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import ConversationSummary
+from services.history_cache import CachedMessage
+
+logger = logging.getLogger(__name__)
+
+# Грубая оценка: для русского текста у Gemini ~3 символа на токен
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценить число токенов в тексте без обращения к API"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class ContextBuilder:
+    """
+    Собирает контекст чата в пределах бюджета токенов.
+
+    Последние сообщения берутся целиком (от новых к старым), пока помещаются
+    в бюджет. Все, что старше окна, заменяется кратким содержанием, которое
+    хранится в conversation_summaries и пересчитывается только когда новые
+    сообщения вытесняют старые из окна.
+    """
+
+    def __init__(
+        self,
+        gemini_service,
+        token_budget: int = None,
+        max_message_tokens: int = None
+    ):
+        self.gemini_service = gemini_service
+        self.token_budget = token_budget or settings.CHAT_CONTEXT_TOKEN_BUDGET
+        self.max_message_tokens = max_message_tokens or settings.CHAT_CONTEXT_MAX_MESSAGE_TOKENS
+
+    async def build(
+        self,
+        db: Session,
+        project_id: str,
+        messages: List[CachedMessage]
+    ) -> Tuple[Optional[str], List[Dict]]:
+        """
+        Вернуть (summary, context) для промпта.
+        messages - хвост истории проекта по возрастанию времени, без текущего сообщения.
+        """
+        window_start = self._window_start(messages)
+
+        summary, covered = await self._roll_summary(db, project_id, messages, window_start)
+        # Сообщения, уже вошедшие в summary, в окно не дублируем
+        window_start = max(window_start, covered)
+
+        context = [
+            {"role": msg.role, "content": self._truncate(msg.content)}
+            for msg in messages[window_start:]
+        ]
+        return summary, context
+
+    def _window_start(self, messages: List[CachedMessage]) -> int:
+        """Индекс первого сообщения, которое помещается в бюджет"""
+        used = 0
+        start = len(messages)
+        for index in range(len(messages) - 1, -1, -1):
+            tokens = min(estimate_tokens(messages[index].content), self.max_message_tokens)
+            if used + tokens > self.token_budget:
+                break
+            used += tokens
+            start = index
+        return start
+
+    def _truncate(self, content: str) -> str:
+        max_chars = self.max_message_tokens * CHARS_PER_TOKEN
+        if len(content) <= max_chars:
+            return content
+        return content[:max_chars] + "...[сообщение сокращено]"
+
+    async def _roll_summary(
+        self,
+        db: Session,
+        project_id: str,
+        messages: List[CachedMessage],
+        window_start: int
+    ) -> Tuple[Optional[str], int]:
+        """
+        Дополнить summary сообщениями, вытесненными из окна.
+        Возвращает (summary, сколько первых сообщений хвоста оно покрывает).
+        """
+        summary_record = db.query(ConversationSummary).filter(
+            ConversationSummary.project_id == project_id
+        ).first()
+
+        covered = 0
+        previous_summary = None
+        if summary_record:
+            previous_summary = summary_record.summary
+            # Граница summary ищется по id: в хвосте нет абсолютных индексов.
+            # Если сообщения нет в хвосте, summary покрывает все, что до него.
+            for index, msg in enumerate(messages):
+                if msg.id == summary_record.last_message_id:
+                    covered = index + 1
+                    break
+
+        if covered >= window_start:
+            return previous_summary, covered
+
+        evicted = [
+            {"role": msg.role, "content": msg.content}
+            for msg in messages[covered:window_start]
+        ]
+        try:
+            summary = await self.gemini_service.summarize_conversation(evicted, previous_summary)
+        except Exception as e:
+            logger.error(f"Conversation summary failed for project {project_id}: {e}")
+            return previous_summary, covered
+        logger.info(f"Conversation summary updated for project {project_id}: {covered} -> {window_start} messages")
+
+        if summary_record is None:
+            summary_record = ConversationSummary(project_id=project_id)
+            db.add(summary_record)
+            summary_record.message_count = 0
+        summary_record.summary = summary
+        summary_record.message_count += len(evicted)
+        summary_record.last_message_id = messages[window_start - 1].id
+        summary_record.updated_at = datetime.utcnow()
+        db.commit()
+
+        return summary, window_start
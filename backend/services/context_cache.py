@@ -0,0 +1,286 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from google.api_core import exceptions as api_exceptions
+
+from config import settings
+from services.context_builder import estimate_tokens
+from services.llm_provider import LLMProvider
+from services.metrics import LLM_CONTEXT_CACHE
+
+logger = logging.getLogger(__name__)
+
+# Запас до истечения кэша: хэндл, который истечет раньше, не используется
+_EXPIRY_MARGIN = 60
+
+
+@dataclass
+class _Handle:
+    name: str
+    model_name: str
+    model: Any                 # модель, привязанная к кэшу на стороне провайдера
+    token_count: int
+    expires_at: float
+    project_id: Optional[str]  # None - общий префикс (инструкции), иначе контекст файла проекта
+    hits: int = 0
+
+
+class ContextCache:
+    """
+    Кэш контекста на стороне провайдера (context caching Gemini).
+
+    Длинный неизменный префикс промпта (статические инструкции шаблона
+    или текст загруженного файла) загружается провайдеру один раз, дальше
+    запросы отправляют только переменную часть, а токены префикса
+    оплачиваются по цене закэшированных. Локально хранятся хэндлы:
+    ключ - SHA-256 от проекта, модели и префикса, срок жизни, число токенов.
+    Проект входит в ключ, чтобы удаление одного проекта не удаляло кэш,
+    которым пользуется другой.
+
+    Создание и хранение кэша оплачиваются, поэтому он создается только для
+    префикса, который использован LLM_CONTEXT_CACHE_MIN_USES раз в пределах
+    TTL: разовый анализ файла или хедж того же запроса в другую модель
+    отправляются целиком и кэш не создают.
+
+    Хэндл продлевается, когда до истечения остается меньше половины TTL,
+    и пересоздается после истечения. Число хэндлов ограничено (LRU), лишние
+    удаляются у провайдера - хранение кэша тоже оплачивается. Префиксы
+    короче LLM_CONTEXT_CACHE_MIN_TOKENS провайдер не кэширует явно - они
+    отправляются целиком (у Gemini 2.5 их покрывает неявный кэш префиксов).
+    Статические префиксы шаблонов сейчас все короче минимума, GeminiService
+    их не передает (cacheable), так что явно кэшируются тексты файлов.
+
+    Методы синхронные: вызываются из потоков executor GeminiService.
+    """
+
+    def __init__(
+        self,
+        provider: LLMProvider,
+        enabled: bool = None,
+        ttl: int = None,
+        min_tokens: int = None,
+        max_handles: int = None,
+        min_uses: int = None
+    ):
+        self.provider = provider
+        self.enabled = enabled if enabled is not None else settings.LLM_CONTEXT_CACHE_ENABLED
+        self.ttl = ttl if ttl is not None else settings.LLM_CONTEXT_CACHE_TTL
+        self.min_tokens = min_tokens if min_tokens is not None else settings.LLM_CONTEXT_CACHE_MIN_TOKENS
+        self.max_handles = max_handles if max_handles is not None else settings.LLM_CONTEXT_CACHE_MAX_HANDLES
+        self.min_uses = min_uses if min_uses is not None else settings.LLM_CONTEXT_CACHE_MIN_USES
+
+        self._handles: "OrderedDict[str, _Handle]" = OrderedDict()
+        # Ключи, для которых хэндл сейчас создается: параллельные запросы
+        # с тем же префиксом не создают дубликаты, а идут без кэша
+        self._creating: set = set()
+        # Префиксы без кэша: ключ -> (число использований, когда первое)
+        self._uses: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.creates = 0
+        self.skipped = 0
+        self.deferred = 0
+        self.errors = 0
+
+    @property
+    def active(self) -> bool:
+        return self.enabled and self.provider.supports_context_cache
+
+    @staticmethod
+    def make_key(model_name: str, prefix: str, project_id: Optional[str] = None) -> str:
+        payload = f"{project_id or ''}\n{model_name}\n{prefix}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def cacheable(self, prefix: str) -> bool:
+        """Достаточно ли длинный префикс для явного кэша провайдера"""
+        return estimate_tokens(prefix) >= self.min_tokens
+
+    def generate(
+        self,
+        model: Any,
+        prompt: str,
+        cached_prefix: Optional[str] = None,
+        project_id: Optional[str] = None,
+        **kwargs
+    ):
+        """
+        model.generate_content(prompt, **kwargs); если prompt начинается
+        с cached_prefix и для него есть (или создан) кэш, провайдеру
+        отправляется только остаток промпта
+        """
+        handle = None
+        if cached_prefix and self.active and prompt.startswith(cached_prefix):
+            handle = self._acquire(model, cached_prefix, project_id)
+        if handle is None:
+            return model.generate_content(prompt, **kwargs)
+
+        try:
+            return handle.model.generate_content(prompt[len(cached_prefix):], **kwargs)
+        except api_exceptions.NotFound:
+            # Кэш удален или истек у провайдера раньше локального срока
+            LLM_CONTEXT_CACHE.labels(model.model_name, "not_found").inc()
+            self._discard(handle, delete=False)
+            return model.generate_content(prompt, **kwargs)
+
+    def _acquire(self, model: Any, prefix: str, project_id: Optional[str]) -> Optional[_Handle]:
+        model_name = model.model_name
+        if not self.cacheable(prefix):
+            with self._lock:
+                self.skipped += 1
+            LLM_CONTEXT_CACHE.labels(model_name, "skip").inc()
+            return None
+
+        key = self.make_key(model_name, prefix, project_id)
+        now = time.time()
+        expired = None
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None and handle.expires_at - _EXPIRY_MARGIN > now:
+                self._handles.move_to_end(key)
+                handle.hits += 1
+                self.hits += 1
+                extend = handle.expires_at - now < self.ttl / 2
+            elif key in self._creating:
+                return None
+            elif handle is None and not self._reused(key, now):
+                self.deferred += 1
+                LLM_CONTEXT_CACHE.labels(model_name, "defer").inc()
+                return None
+            else:
+                expired, handle = handle, None
+                if expired is not None:
+                    del self._handles[key]
+                self._creating.add(key)
+
+        if handle is not None:
+            LLM_CONTEXT_CACHE.labels(model_name, "hit").inc()
+            if extend:
+                self._extend(handle)
+            return handle
+
+        if expired is not None:
+            LLM_CONTEXT_CACHE.labels(model_name, "expire").inc()
+            self._delete_remote(expired)
+        try:
+            return self._create(key, model_name, prefix, project_id)
+        finally:
+            with self._lock:
+                self._creating.discard(key)
+
+    def _reused(self, key: str, now: float) -> bool:
+        """
+        Учесть использование префикса без кэша; True, если он использован
+        min_uses раз в пределах TTL (вызывается под self._lock)
+        """
+        uses, first_used = self._uses.pop(key, (0, now))
+        if now - first_used > self.ttl:
+            uses, first_used = 0, now
+        uses += 1
+        if uses >= self.min_uses:
+            return True
+        self._uses[key] = (uses, first_used)
+        # Хранятся только недавние префиксы - по несколько на каждый хэндл
+        while len(self._uses) > self.max_handles * 10:
+            self._uses.popitem(last=False)
+        return False
+
+    def _create(self, key: str, model_name: str, prefix: str, project_id: Optional[str]) -> Optional[_Handle]:
+        try:
+            cached = self.provider.create_cached_content(model_name, prefix, self.ttl)
+            bound = self.provider.cached_model(model_name, cached.name)
+        except Exception as e:
+            # Без кэша запрос все равно выполнится - с полным промптом
+            with self._lock:
+                self.errors += 1
+            LLM_CONTEXT_CACHE.labels(model_name, "error").inc()
+            logger.warning(f"Context cache creation failed for {model_name}: {e}")
+            return None
+
+        handle = _Handle(cached.name, model_name, bound, cached.token_count, cached.expires_at, project_id)
+        evicted = []
+        with self._lock:
+            self._handles[key] = handle
+            self.creates += 1
+            while len(self._handles) > self.max_handles:
+                evicted.append(self._handles.popitem(last=False)[1])
+        LLM_CONTEXT_CACHE.labels(model_name, "create").inc()
+        for old in evicted:
+            LLM_CONTEXT_CACHE.labels(old.model_name, "evict").inc()
+            self._delete_remote(old)
+        return handle
+
+    def _extend(self, handle: _Handle):
+        try:
+            expires_at = self.provider.update_cached_content(handle.name, self.ttl)
+        except Exception as e:
+            logger.warning(f"Context cache {handle.name} extension failed: {e}")
+            return
+        handle.expires_at = expires_at
+        LLM_CONTEXT_CACHE.labels(handle.model_name, "extend").inc()
+
+    def _discard(self, handle: _Handle, delete: bool = True):
+        with self._lock:
+            for key, existing in list(self._handles.items()):
+                if existing is handle:
+                    del self._handles[key]
+        if delete:
+            self._delete_remote(handle)
+
+    def _delete_remote(self, handle: _Handle):
+        try:
+            self.provider.delete_cached_content(handle.name)
+        except api_exceptions.NotFound:
+            pass
+        except Exception as e:
+            logger.warning(f"Context cache {handle.name} deletion failed: {e}")
+
+    def drop_project(self, project_id: str) -> int:
+        """Удалить кэши контекста файлов проекта (проект удален)"""
+        with self._lock:
+            handles = [handle for handle in self._handles.values() if handle.project_id == project_id]
+        for handle in handles:
+            self._discard(handle)
+        return len(handles)
+
+    def clear(self):
+        """Удалить все кэши у провайдера (остановка приложения)"""
+        with self._lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+        for handle in handles:
+            self._delete_remote(handle)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            handles: List[Dict[str, Any]] = [
+                {
+                    "name": handle.name,
+                    "model": handle.model_name,
+                    "tokens": handle.token_count,
+                    "expires_in": max(0, int(handle.expires_at - now)),
+                    "project_id": handle.project_id,
+                    "hits": handle.hits,
+                }
+                for handle in self._handles.values()
+            ]
+            return {
+                "enabled": self.enabled,
+                "supported": self.provider.supports_context_cache,
+                "ttl": self.ttl,
+                "min_tokens": self.min_tokens,
+                "max_handles": self.max_handles,
+                "cached_tokens": sum(handle["tokens"] for handle in handles),
+                "hits": self.hits,
+                "creates": self.creates,
+                "skipped": self.skipped,
+                "deferred": self.deferred,
+                "errors": self.errors,
+                "handles": handles,
+            }
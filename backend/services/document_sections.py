@@ -0,0 +1,59 @@
+import hashlib
+import json
+from typing import Any, Optional
+
+from models import DocumentContent
+
+# Секции верхнего уровня документа требований в порядке документа
+DOCUMENT_KEYS = list(DocumentContent.model_fields)
+
+_DIGEST_ITEMS = 10
+_DIGEST_CHARS = 80
+
+
+def compact_json(value: Any) -> str:
+    """JSON без отступов и пробелов - для промптов"""
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def section_hash(value: Any) -> str:
+    """Хэш содержимого секции, не зависящий от форматирования и порядка ключей"""
+    payload = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def section_key(name: Optional[str]) -> Optional[str]:
+    """Ключ секции по названию из ответа модели ("Goals", " useCases ") или None"""
+    if not name:
+        return None
+    normalized = name.strip().lower()
+    for key in DOCUMENT_KEYS:
+        if key.lower() == normalized:
+            return key
+    return None
+
+
+def section_digest(value: Any) -> str:
+    """Краткое содержание секции: число элементов и начала их заголовков"""
+    if isinstance(value, str):
+        return _shorten(value)
+    if isinstance(value, dict):
+        return "; ".join(f"{key}: {section_digest(item)}" for key, item in value.items())
+    if isinstance(value, list):
+        titles = [_shorten(_item_title(item)) for item in value[:_DIGEST_ITEMS]]
+        more = f" и еще {len(value) - _DIGEST_ITEMS}" if len(value) > _DIGEST_ITEMS else ""
+        return f"{len(value)} эл.: " + " | ".join(titles) + more
+    return str(value)
+
+
+def _item_title(item: Any) -> str:
+    if isinstance(item, dict):
+        for field in ("title", "text", "name"):
+            if item.get(field):
+                return f"{item.get('id', '')} {item[field]}".strip()
+        return compact_json(item)
+    return str(item)
+
+
+def _shorten(text: str) -> str:
+    return text if len(text) <= _DIGEST_CHARS else text[:_DIGEST_CHARS] + "…"
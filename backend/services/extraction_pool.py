@@ -0,0 +1,271 @@
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from services.metrics import FILE_EXTRACTION_DURATION, FILE_EXTRACTION_POOL_EVENTS, size_bucket
+from utils.file_processor import FileProcessor, FileSource, source_size
+
+logger = logging.getLogger(__name__)
+
+# Попыток на задачу: повторы нужны задачам, чей пул пересоздали из-за чужой ошибки
+_MAX_ATTEMPTS = 3
+
+
+class ExtractionError(ValueError):
+    """Извлечение текста не удалось: превышено время или воркер упал"""
+
+
+def _init_worker(memory_limit_mb: int):
+    """Инициализация процесса-воркера: заранее загрузить парсеры и ограничить память"""
+    import fitz  # noqa: F401
+    import docx  # noqa: F401
+    import openpyxl  # noqa: F401
+
+    if memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        # Превышение - MemoryError внутри парсера, а не OOM всего сервера
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _extract(source: FileSource, filename: str, first_page: int, last_page: Optional[int]) -> Tuple[str, str, dict]:
+    return FileProcessor.extract(source, filename, first_page, last_page)
+
+
+def _pdf_info(source: FileSource) -> dict:
+    return FileProcessor.pdf_info(source)
+
+
+def _pdf_pages(source: FileSource, start: int, stop: int) -> str:
+    return FileProcessor.process_pdf_pages(source, start, stop)
+
+
+class ExtractionPool:
+    """
+    Пул процессов для разбора файлов (PyMuPDF, python-docx, openpyxl и
+    регулярки очистки текста занимают CPU и держат GIL - в event loop или
+    в потоке они останавливают все остальные запросы).
+
+    Воркеры запускаются через spawn (fork процесса с потоками небезопасен),
+    парсеры импортируются при старте воркера, адресное пространство
+    ограничено EXTRACTION_MEMORY_LIMIT_MB. Задача дольше EXTRACTION_TIMEOUT
+    или падение воркера не роняют API: зависшие процессы завершаются, пул
+    пересоздается, а запрос получает ExtractionError (400).
+
+    В пул передается не больше задач, чем воркеров, остальные ждут своей
+    очереди в event loop: задача попадает в пул, только когда для нее есть
+    свободный воркер, поэтому таймаут отсчитывается от начала разбора, а не
+    от постановки в очередь (и не включает запуск воркеров нового пула).
+    При пересоздании пула ожидающие задачи не отменяются, а задачи, которые
+    потеряли воркер из-за чужой ошибки, повторяются на новом пуле.
+
+    PDF от PDF_SPLIT_MIN_PAGES страниц (с диска) делится на диапазоны
+    страниц, которые разбирают разные воркеры; текст собирается в порядке
+    страниц. Таймаут действует на каждый диапазон отдельно.
+
+    EXTRACTION_WORKERS=0 - разбор в отдельном потоке без пула (таймаут
+    ограничивает только ожидание, поток не прерывается).
+    """
+
+    def __init__(
+        self,
+        workers: int = None,
+        timeout: float = None,
+        memory_limit_mb: int = None,
+        max_tasks_per_worker: int = None,
+        split_min_pages: int = None
+    ):
+        if workers is None:
+            workers = settings.EXTRACTION_WORKERS
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.timeout = timeout if timeout is not None else settings.EXTRACTION_TIMEOUT
+        self.memory_limit_mb = memory_limit_mb if memory_limit_mb is not None else settings.EXTRACTION_MEMORY_LIMIT_MB
+        self.max_tasks_per_worker = max_tasks_per_worker or settings.EXTRACTION_MAX_TASKS_PER_WORKER
+        self.split_min_pages = split_min_pages if split_min_pages is not None else settings.PDF_SPLIT_MIN_PAGES
+        self.range_min_pages = settings.PDF_RANGE_MIN_PAGES
+
+        self._executor: Optional[Executor] = None
+        # Свободные воркеры: задача отправляется в пул, только заняв один из них
+        self._slots: Optional[asyncio.Semaphore] = None
+        # Номер пула: задача, чей пул пересоздали из-за чужой ошибки, повторяется
+        self._generation = 0
+        # Номер пула, воркеры которого уже запущены (spawn не входит в таймаут задачи)
+        self._ready_generation: Optional[int] = None
+        self.tasks = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.restarts = 0
+        self.resubmits = 0
+        self.pdf_splits = 0
+
+    def start(self):
+        """Создать пул (воркеры запускаются при первых задачах или warmup)"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(max(1, self.workers))
+        if self._executor is not None:
+            return
+        if self.workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.memory_limit_mb,),
+                max_tasks_per_child=self.max_tasks_per_worker
+            )
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="extraction")
+
+    async def warmup(self):
+        """Запустить всех воркеров заранее, чтобы первая загрузка не ждала spawn"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        generation = self._generation
+        await asyncio.gather(*[loop.run_in_executor(self._executor, _ping) for _ in range(max(1, self.workers))])
+        self._ready_generation = generation
+
+    def stop(self):
+        if self._executor is not None:
+            self._terminate(self._executor)
+            self._executor = None
+        self._slots = None
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Выполнить func(*args) в воркере с таймаутом; func должна быть функцией модуля"""
+        self.start()
+        self.tasks += 1
+        async with self._slots:
+            return await self._dispatch(func, *args)
+
+    async def _dispatch(self, func: Callable, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        for attempt in range(_MAX_ATTEMPTS):
+            generation = self._generation
+            try:
+                if self._ready_generation != generation:
+                    # Новый пул: дождаться запуска воркеров до отсчета таймаута
+                    await loop.run_in_executor(self._executor, _ping)
+                    self._ready_generation = generation
+                return await asyncio.wait_for(loop.run_in_executor(self._executor, func, *args), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                FILE_EXTRACTION_POOL_EVENTS.labels("timeout").inc()
+                logger.error(f"Extraction exceeded {self.timeout}s, restarting worker pool")
+                self._restart(generation)
+                raise ExtractionError(f"File extraction timed out after {self.timeout:.0f}s")
+            except BrokenProcessPool:
+                if generation != self._generation and attempt < _MAX_ATTEMPTS - 1:
+                    # Пул пересоздан из-за другой задачи - повторяем на новом
+                    self.resubmits += 1
+                    FILE_EXTRACTION_POOL_EVENTS.labels("resubmit").inc()
+                    continue
+                self.crashes += 1
+                FILE_EXTRACTION_POOL_EVENTS.labels("crash").inc()
+                logger.error("Extraction worker crashed, restarting worker pool")
+                self._restart(generation)
+                if attempt == 0:
+                    continue
+                raise ExtractionError("File extraction failed: worker process crashed")
+
+    async def extract(
+        self,
+        source: FileSource,
+        filename: str,
+        first_page: int = 1,
+        last_page: Optional[int] = None
+    ) -> Tuple[str, str, dict]:
+        """
+        FileProcessor.process_file в воркере: (extracted_text, file_type, metadata);
+        first_page/last_page ограничивают страницы PDF
+        """
+        started = time.perf_counter()
+        if self._can_split(source, filename):
+            text, file_type, metadata = await self._extract_pdf(source, first_page, last_page)
+        else:
+            text, file_type, metadata = await self.run(_extract, source, filename, first_page, last_page)
+        FILE_EXTRACTION_DURATION.labels(file_type, size_bucket(source_size(source))).observe(
+            time.perf_counter() - started
+        )
+        return text, file_type, metadata
+
+    def _can_split(self, source: FileSource, filename: str) -> bool:
+        # Воркеры открывают файл сами - байты пришлось бы копировать в каждый
+        return (
+            self.workers > 1
+            and isinstance(source, str)
+            and FileProcessor.detect_file_type(source, filename) == "pdf"
+        )
+
+    def page_ranges(self, start: int, stop: int) -> List[Tuple[int, int]]:
+        """Страницы [start, stop) поровну на воркеров, не меньше PDF_RANGE_MIN_PAGES в части"""
+        size = max(self.range_min_pages, math.ceil((stop - start) / self.workers))
+        return [(first, min(first + size, stop)) for first in range(start, stop, size)]
+
+    async def _extract_pdf(self, path: str, first_page: int, last_page: Optional[int]) -> Tuple[str, str, dict]:
+        metadata = await self.run(_pdf_info, path)
+        start, stop = FileProcessor.pdf_page_range(metadata["pages"], first_page, last_page)
+        if stop - start < self.split_min_pages:
+            return await self.run(_extract, path, "", first_page, last_page)
+
+        if (start, stop) != (0, metadata["pages"]):
+            metadata["page_range"] = [start + 1, stop]
+        ranges = self.page_ranges(start, stop)
+        self.pdf_splits += 1
+        FILE_EXTRACTION_POOL_EVENTS.labels("pdf_split").inc()
+        parts = await asyncio.gather(*[self.run(_pdf_pages, path, first, last) for first, last in ranges])
+        # Части уже очищены воркерами; пробел - то, во что очистка превращает "\n\n" между страницами
+        text = " ".join(part for part in parts if part)
+        logger.info(f"PDF processed in {len(ranges)} ranges: {stop - start} of {metadata['pages']} pages, {len(text)} characters")
+        return text, "pdf", metadata
+
+    def _restart(self, generation: int):
+        """Пересоздать пул, если этого еще не сделала другая задача"""
+        if generation != self._generation:
+            return
+        self._generation += 1
+        self.restarts += 1
+        FILE_EXTRACTION_POOL_EVENTS.labels("restart").inc()
+        old, self._executor = self._executor, None
+        if old is not None:
+            self._terminate(old)
+        self.start()
+
+    @staticmethod
+    def _terminate(executor: Executor):
+        # ProcessPoolExecutor не умеет прерывать задачу - завершаем процессы
+        # (зависший парсер иначе держал бы воркер до конца разбора)
+        # Задачи остальных запросов не отменяются: они получат BrokenProcessPool
+        # и повторятся на новом пуле
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "mode": "process" if self.workers > 0 else "thread",
+            "timeout": self.timeout,
+            "memory_limit_mb": self.memory_limit_mb,
+            "tasks": self.tasks,
+            "timeouts": self.timeouts,
+            "crashes": self.crashes,
+            "restarts": self.restarts,
+            "resubmits": self.resubmits,
+            "split_min_pages": self.split_min_pages,
+            "pdf_splits": self.pdf_splits,
+        }
+
+
+extraction_pool = ExtractionPool()
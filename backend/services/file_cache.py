@@ -0,0 +1,237 @@
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func
+
+from config import settings
+from database import SessionLocal, FileCacheEntry
+from services.metrics import FILE_CACHE
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedFile:
+    sha256: str
+    file_type: str
+    extracted_text: str
+    metadata: dict
+    analysis: Optional[dict]  # FileAnalysisResponse.dict() или None, если файл еще не анализировали
+
+
+class FileCache:
+    """
+    Кэш загруженных файлов по SHA-256 их содержимого (таблица file_cache).
+
+    Одни и те же спецификации загружают повторно: по хэшу байтов повторная
+    загрузка берет извлеченный текст и метаданные без разбора файла, а если
+    файл уже анализировали - и готовый FileAnalysisResponse без вызова LLM.
+    Анализ хранится с версией промптов и моделей (GeminiService.file_analysis_version)
+    и отдается только для текущей: после их смены файл анализируется заново.
+    Хэш считается при сохранении загрузки (save_upload), файл не читается
+    второй раз.
+
+    Суммарный размер записей ограничен FILE_CACHE_MAX_BYTES: сверх лимита
+    удаляются давно не использованные. Методы синхронные (обращения к БД) -
+    из async-кода вызываются через run_in_threadpool.
+    """
+
+    def __init__(self, enabled: bool = None, max_bytes: int = None):
+        self.enabled = enabled if enabled is not None else settings.FILE_CACHE_ENABLED
+        self.max_bytes = max_bytes if max_bytes is not None else settings.FILE_CACHE_MAX_BYTES
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.text_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, sha256: str, analysis_version: Optional[str] = None) -> Optional[CachedFile]:
+        """
+        Запись по хэшу файла или None. Анализ в записи - только сделанный
+        версией analysis_version (без версии - только текст)
+        """
+        if not self.enabled:
+            return None
+        db = SessionLocal()
+        try:
+            entry = db.query(FileCacheEntry).filter(FileCacheEntry.sha256 == sha256).first()
+            if entry is not None:
+                entry.last_used_at = time.time()
+                db.commit()
+                cached = CachedFile(
+                    sha256=entry.sha256,
+                    file_type=entry.file_type,
+                    extracted_text=entry.extracted_text,
+                    metadata=json.loads(entry.metadata_json),
+                    analysis=(
+                        json.loads(entry.analysis_json)
+                        if entry.analysis_json and analysis_version is not None
+                        and entry.analysis_version == analysis_version
+                        else None
+                    )
+                )
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"File cache read failed: {e}")
+            return None
+        finally:
+            db.close()
+
+        if entry is None:
+            self._count("miss")
+            return None
+        self._count("hit" if cached.analysis is not None else "text_hit")
+        return cached
+
+    def text(self, sha256: str) -> Optional[str]:
+        """
+        Только извлеченный текст файла - для задач прежних версий, которые
+        хранят ссылку на него вместо текста (без учета в статистике попаданий)
+        """
+        if not self.enabled:
+            return None
+        db = SessionLocal()
+        try:
+            row = db.query(FileCacheEntry.extracted_text).filter(FileCacheEntry.sha256 == sha256).first()
+            return row[0] if row is not None else None
+        except Exception as e:
+            logger.warning(f"File cache read failed: {e}")
+            return None
+        finally:
+            db.close()
+
+    def put(
+        self,
+        sha256: str,
+        file_type: str,
+        extracted_text: str,
+        metadata: dict,
+        analysis: Optional[dict] = None,
+        analysis_version: Optional[str] = None
+    ):
+        """
+        Сохранить разбор файла (и анализ, если есть). Без analysis сохраненный
+        ранее анализ остается, пока текст файла не изменился
+        """
+        if not self.enabled:
+            return
+        metadata_json = json.dumps(metadata, ensure_ascii=False)
+        analysis_json = json.dumps(analysis, ensure_ascii=False) if analysis is not None else None
+        now = time.time()
+        db = SessionLocal()
+        try:
+            entry = db.query(FileCacheEntry).filter(FileCacheEntry.sha256 == sha256).first()
+            if entry is None:
+                entry = FileCacheEntry(sha256=sha256, created_at=now)
+                db.add(entry)
+            elif analysis_json is None and entry.extracted_text == extracted_text:
+                analysis_json, analysis_version = entry.analysis_json, entry.analysis_version
+            entry.file_type = file_type
+            entry.extracted_text = extracted_text
+            entry.metadata_json = metadata_json
+            entry.analysis_json = analysis_json
+            entry.analysis_version = analysis_version if analysis_json is not None else None
+            entry.size = len(extracted_text) + len(metadata_json) + len(analysis_json or "")
+            entry.last_used_at = now
+            if entry.size > self.max_bytes:
+                db.rollback()
+                return
+            db.commit()
+            FILE_CACHE.labels("store").inc()
+            self._evict(db)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"File cache write failed: {e}")
+        finally:
+            db.close()
+
+    def put_analysis(self, sha256: str, analysis: dict, analysis_version: str):
+        """Добавить анализ (версии analysis_version) к уже сохраненному разбору файла"""
+        if not self.enabled:
+            return
+        analysis_json = json.dumps(analysis, ensure_ascii=False)
+        db = SessionLocal()
+        try:
+            entry = db.query(FileCacheEntry).filter(FileCacheEntry.sha256 == sha256).first()
+            if entry is None:
+                # Разбор уже вытеснен - без текста анализ не сохраняем
+                return
+            entry.size += len(analysis_json) - len(entry.analysis_json or "")
+            entry.analysis_json = analysis_json
+            entry.analysis_version = analysis_version
+            entry.last_used_at = time.time()
+            db.commit()
+            FILE_CACHE.labels("store").inc()
+            self._evict(db)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"File cache write failed: {e}")
+        finally:
+            db.close()
+
+    def clear(self) -> int:
+        """Удалить все записи; возвращает их число"""
+        db = SessionLocal()
+        try:
+            deleted = db.query(FileCacheEntry).delete(synchronize_session=False)
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            entries, size = db.query(func.count(FileCacheEntry.sha256), func.sum(FileCacheEntry.size)).one()
+            analyzed = db.query(FileCacheEntry).filter(FileCacheEntry.analysis_json.isnot(None)).count()
+        finally:
+            db.close()
+        with self._lock:
+            lookups = self.hits + self.text_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": entries,
+                "analyzed_entries": analyzed,
+                "bytes": size or 0,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "text_hits": self.text_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.text_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def _count(self, event: str):
+        FILE_CACHE.labels(event).inc()
+        with self._lock:
+            if event == "hit":
+                self.hits += 1
+            elif event == "text_hit":
+                self.text_hits += 1
+            else:
+                self.misses += 1
+
+    def _evict(self, db):
+        """Удалить давно не использованные записи сверх FILE_CACHE_MAX_BYTES"""
+        total = db.query(func.sum(FileCacheEntry.size)).scalar() or 0
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for sha256, size in db.query(FileCacheEntry.sha256, FileCacheEntry.size).order_by(FileCacheEntry.last_used_at):
+            if total <= self.max_bytes:
+                break
+            stale.append(sha256)
+            total -= size
+        db.query(FileCacheEntry).filter(FileCacheEntry.sha256.in_(stale)).delete(synchronize_session=False)
+        db.commit()
+        FILE_CACHE.labels("evict").inc(len(stale))
+        with self._lock:
+            self.evictions += len(stale)
+
+
+file_cache = FileCache()
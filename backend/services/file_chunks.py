@@ -0,0 +1,90 @@
+import re
+from collections import Counter
+from typing import Dict, Iterable, List
+
+# Границы частей текста, которые ставит FileProcessor: страницы PDF,
+# листы XLSX, таблицы и основной текст DOCX
+_BOUNDARY = re.compile(r"(?==== (?:Страница \d+|Лист: |Таблица|Основной текст) ===)")
+
+# Где резать часть, которая сама длиннее чанка (по убыванию предпочтения)
+_BREAKS = ("\n\n", "\n", ". ", "; ", " ")
+
+UNKNOWN_PROJECT = "Неизвестный проект"
+
+
+def split_text(text: str, max_chars: int) -> List[str]:
+    """
+    Разбить извлеченный текст на чанки не длиннее max_chars по границам
+    страниц, листов и таблиц; соседние части собираются в один чанк, пока
+    он помещается. Часть длиннее max_chars режется по абзацам, предложениям
+    или словам
+    """
+    chunks: List[str] = []
+    current = ""
+    for part in _parts(text, max_chars):
+        if current and len(current) + 1 + len(part) > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current} {part}" if current else part
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _parts(text: str, max_chars: int) -> Iterable[str]:
+    for part in _BOUNDARY.split(text):
+        part = part.strip()
+        while len(part) > max_chars:
+            cut = _cut_position(part, max_chars)
+            yield part[:cut].strip()
+            part = part[cut:].strip()
+        if part:
+            yield part
+
+
+def _cut_position(text: str, max_chars: int) -> int:
+    for separator in _BREAKS:
+        position = text.rfind(separator, max_chars // 2, max_chars)
+        if position != -1:
+            return position + len(separator)
+    return max_chars
+
+
+def _normalize(item: str) -> str:
+    """Ключ для поиска дубликатов: регистр, ё, пунктуация и пробелы не важны"""
+    item = item.casefold().replace("ё", "е")
+    return " ".join(re.sub(r"[^\w]+", " ", item).split())
+
+
+def merge_unique(lists: Iterable[List[str]]) -> List[str]:
+    """Объединить списки в порядке появления, без повторов"""
+    seen = set()
+    merged = []
+    for items in lists:
+        for item in items:
+            item = item.strip()
+            key = _normalize(item)
+            if key and key not in seen:
+                seen.add(key)
+                merged.append(item)
+    return merged
+
+
+def merge_file_analyses(partials: List[Dict]) -> Dict:
+    """
+    Reduce-шаг анализа по чанкам: цели, требования и стейкхолдеры всех
+    чанков без дубликатов (в порядке документа), название - самое частое
+    из найденных, описание - первое непустое (обычно из введения)
+    """
+    names = Counter(
+        partial["projectName"].strip() for partial in partials
+        if partial.get("projectName", "").strip() and partial["projectName"].strip() != UNKNOWN_PROJECT
+    )
+    descriptions = [partial.get("description", "").strip() for partial in partials]
+    return {
+        "projectName": names.most_common(1)[0][0] if names else UNKNOWN_PROJECT,
+        "goals": merge_unique(partial.get("goals", []) for partial in partials),
+        "requirements": merge_unique(partial.get("requirements", []) for partial in partials),
+        "stakeholders": merge_unique(partial.get("stakeholders", []) for partial in partials),
+        "description": next((description for description in descriptions if description), ""),
+    }
@@ -3,26 +3,110 @@ import json
 import re
 import asyncio
 import logging
-from typing import Dict, List, Optional, Any
+import threading
+import time
+from contextlib import aclosing
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Dict, List, Optional, Any, Tuple
 from datetime import datetime
 
 from config import settings
+from models import DocumentContent, FileAnalysis, GenerationMode, ValidationResponse
+from services.llm_cache import ResponseCache
+from services.llm_provider import LLMProvider, create_provider
+from services.single_flight import SingleFlight
+from services.metrics import (
+    LLM_CALL_DURATION,
+    LLM_CALLS,
+    LLM_FAILURES,
+    LLM_FALLBACKS,
+    LLM_HEDGES,
+    LLM_RETRIES,
+    fallback_reason,
+    model_label,
+)
+from services.usage_ledger import usage_ledger, usage_from_response
+from services.structured_output import json_config, parse_structured, patch_model, response_schema, subset_model
+from services.json_stream import JsonSectionScanner, extract_json_object
+from services.document_sections import DOCUMENT_KEYS, compact_json, section_digest, section_hash, section_key
+from services.prompt_templates import DIAGRAMS, DOCUMENT_SECTIONS, PromptTemplate, file_context, get_prompt
+from services.context_cache import ContextCache
+from services.file_chunks import merge_file_analyses, split_text
+from services.model_router import ModelRouter
+from services.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    TokenBucket,
+    backoff_delay,
+    is_retryable,
+    retry_delay_hint,
+)
+
+class FileAnalysisError(Exception):
+    """Анализ файла не удался (analyze_file с fallback=False)"""
+
+def fallback_file_analysis() -> Dict:
+    """Результат analyze_file, когда LLM не ответила (такой анализ не кэшируется)"""
+    return {
+        "projectName": "Неизвестный проект",
+        "goals": ["Анализ файла не удался"],
+        "requirements": ["Требует ручной обработки"],
+        "stakeholders": ["Не определены"],
+        "description": "Ошибка при анализе файла"
+    }
 
 class GeminiService:
     """Service for interacting with Google Gemini API"""
     
-    def __init__(self):
-        self.api_key = settings.GEMINI_API_KEY
-        if not self.api_key:
-            raise ValueError("GEMINI_API_KEY is required. Please set it in .env file")
-
-        # Configure Gemini API with real key
-        genai.configure(api_key=self.api_key)
-        self.model_flash = genai.GenerativeModel('gemini-2.5-flash')
-        self.model_pro = genai.GenerativeModel('gemini-2.5-pro')
+    def __init__(self, provider: Optional[LLMProvider] = None):
+        # Провайдер моделей: Gemini API, заглушка или запись/воспроизведение (LLM_PROVIDER)
+        self.provider = provider or create_provider()
+        self.model_flash = self.provider.get_model(settings.GEMINI_MODEL_FLASH)
+        self.model_pro = self.provider.get_model(settings.GEMINI_MODEL_PRO)
+        # Выбор модели на каждый вызов и хеджирование медленных вызовов Pro
+        self.router = ModelRouter(self.model_flash, self.model_pro)
 
         self.logger = logging.getLogger(__name__)
-        self.logger.info("✅ Gemini API initialized successfully")
+        self.logger.info(f"✅ LLM provider '{self.provider.name}' initialized successfully")
+
+        # SDK вызовы синхронные - выполняем их в отдельном пуле потоков,
+        # чтобы не блокировать event loop. Семафоры ограничивают число
+        # одновременных запросов к каждой модели.
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.GEMINI_MAX_CONCURRENCY_FLASH + settings.GEMINI_MAX_CONCURRENCY_PRO,
+            thread_name_prefix="gemini"
+        )
+        self._limits = {
+            id(self.model_flash): asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY_FLASH),
+            id(self.model_pro): asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY_PRO),
+        }
+        
+        # Исходящий rate limit и circuit breaker - отдельно для каждой модели
+        self._rate_limiters = {
+            id(model): TokenBucket(settings.RATE_LIMIT_REQUESTS, settings.RATE_LIMIT_WINDOW)
+            for model in (self.model_flash, self.model_pro)
+        }
+        self._breakers = {
+            id(model): CircuitBreaker(
+                model.model_name,
+                failure_threshold=settings.GEMINI_CIRCUIT_FAILURE_THRESHOLD,
+                recovery_timeout=settings.GEMINI_CIRCUIT_RECOVERY_TIMEOUT
+            )
+            for model in (self.model_flash, self.model_pro)
+        }
+
+        # Кэш ответов для идемпотентных вызовов (валидация, диаграммы, анализ файлов).
+        # Модель роутер и хедж выбирают на каждый вызов, и ответить может любая
+        # из двух - в ключах кэша пара моделей сервиса (_response_cache_key)
+        self.cache = ResponseCache()
+        self._models_label = f"{self.model_pro.model_name}+{self.model_flash.model_name}"
+        
+        # Одинаковые одновременные запросы (двойной клик, повторный рендер) - один вызов API
+        self.single_flight = SingleFlight()
+        
+        # Кэш длинных неизменных префиксов промптов на стороне провайдера
+        self.context_cache = ContextCache(self.provider)
         
         # Generation configs
         self.chat_config = genai.types.GenerationConfig(
@@ -38,69 +122,59 @@ class GeminiService:
             top_k=10,
             max_output_tokens=4096,
         )
+        
+        # Одна секция документа - меньше выходных токенов, чем весь документ
+        self.section_config = genai.types.GenerationConfig(
+            temperature=0.3,
+            top_p=0.8,
+            top_k=10,
+            max_output_tokens=2048,
+        )
+        
+        self.summary_config = genai.types.GenerationConfig(
+            temperature=0.2,
+            max_output_tokens=settings.CHAT_SUMMARY_MAX_TOKENS,
+        )
+        
+        # Структурированные ответы: нативный JSON режим со схемой из models.py
+        # (если SDK его поддерживает), разбор и проверка - parse_structured
+        self.document_config = json_config(self.structured_config, response_schema(DocumentContent))
+        self.validation_config = json_config(self.structured_config, response_schema(ValidationResponse))
+        self.file_analysis_config = json_config(self.structured_config, response_schema(FileAnalysis))
+        
+        # Версия анализа файлов для кэша файлов: меняется вместе с промптами,
+        # моделями и конфигурацией анализа - прежние анализы не отдаются
+        self.file_analysis_version = self._response_cache_key(
+            "".join(get_prompt(name).prefix + get_prompt(name).body for name in ("file_analysis", "file_analysis_chunk")),
+            self.file_analysis_config
+        )[:16]
+        self.document_patch_model = patch_model(DocumentContent)
+        self.document_patch_config = json_config(self.structured_config, response_schema(self.document_patch_model))
+        self.section_models = {}
+        self.section_configs = {}
+        for name, (keys, _, _) in DOCUMENT_SECTIONS.items():
+            self.section_models[name] = subset_model(DocumentContent, keys)
+            self.section_configs[name] = json_config(self.section_config, response_schema(self.section_models[name]))
     
     async def chat_completion(
         self,
         prompt: str,
         context: List[Dict] = None,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        summary: Optional[str] = None
     ) -> str:
         """
         Отправить сообщение в Gemini и получить ответ для чата
         """
-        system_prompt = """
-Ты - AI Business Analyst для банка ForteBank в Казахстане.
-Твоя задача - собирать бизнес-требования через профессиональный диалог.
-
-ВАЖНО:
-- Задавай уточняющие вопросы только если информация отсутствует
-- НЕ задавай повторно вопросы на которые пользователь уже ответил
-- Анализируй всю историю диалога перед ответом
-- После сбора основной информации (цели, пользователи, функции) переходи к деталям
-- Будь профессионален, но дружелюбен
-- Отвечай на русском языке
-
-ТВОЯ РОЛЬ:
-- Задавай уточняющие вопросы о целях проекта
-- Выясняй стейкхолдеров и их потребности
-- Собирай функциональные и нефункциональные требования
-- Определяй ограничения и риски
-- Помогай структурировать требования
-
-СТИЛЬ ОБЩЕНИЯ:
-- Используй банковскую терминологию корректно
-- Структурируй вопросы логично
-- Не задавай более 2-3 вопросов за раз
-- Подтверждай понимание важных моментов
-- Избегай повторения вопросов
-
-ФОКУС НА:
-- Бизнес-цели и KPI
-- Пользовательские сценарии
-- Интеграции и техническая архитектура
-- Сроки и ресурсы
-- Соответствие регулятивным требованиям
-"""
-        
-        # Форматируем контекст из истории чата
-        full_prompt = system_prompt + "\n\n"
-        
-        if context:
-            full_prompt += "КОНТЕКСТ БЕСЕДЫ:\n"
-            # Берем только последние 10 сообщений для экономии токенов
-            recent_context = context[-10:] if len(context) > 10 else context
-            for msg in recent_context:
-                role = "Клиент" if msg.get("role") == "user" else "Аналитик"
-                full_prompt += f"{role}: {msg.get('content', '')}\n"
-            full_prompt += "\n"
-        
-        full_prompt += f"Клиент: {prompt}\nАналитик:"
+        full_prompt = self._build_chat_prompt(prompt, context, summary)
         
         try:
             response = await self._call_with_retry(
-                self.model_flash.generate_content,
+                self.model_flash,
                 full_prompt,
-                generation_config=self.chat_config
+                operation="chat",
+                generation_config=self.chat_config,
+                cached_prefix=self._static_prefix(get_prompt("chat"))
             )
 
             return response.text.strip()
@@ -109,63 +183,95 @@ class GeminiService:
             self.logger.error(f"Gemini chat completion error: {e}")
             return "Извините, произошла ошибка при обработке вашего запроса. Попробуйте еще раз."
     
+    async def stream_chat_completion(
+        self,
+        prompt: str,
+        context: List[Dict] = None,
+        summary: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Потоковый ответ для чата: отдает фрагменты текста по мере генерации
+        """
+        full_prompt = self._build_chat_prompt(prompt, context, summary)
+        
+        # aclosing: при обрыве потока клиентом _stream закрывается сразу
+        # (семафор модели и пробный вызов breaker), а не при сборке мусора
+        async with aclosing(self._stream(
+            self.model_flash,
+            full_prompt,
+            operation="chat_stream",
+            generation_config=self.chat_config,
+            cached_prefix=self._static_prefix(get_prompt("chat"))
+        )) as chunks:
+            async for chunk in chunks:
+                yield chunk
+    
+    async def summarize_conversation(
+        self,
+        messages: List[Dict],
+        previous_summary: Optional[str] = None
+    ) -> str:
+        """
+        Сжать старую часть диалога в краткое содержание (с учетом прошлого summary)
+        """
+        template = get_prompt("summary")
+        prompt = template.render(
+            previous=previous_summary or "(нет)",
+            messages=self._format_chat_history(messages)
+        )
+        
+        response = await self._call_with_retry(
+            self.model_flash,
+            prompt,
+            operation="summary",
+            generation_config=self.summary_config,
+            cached_prefix=self._static_prefix(template)
+        )
+        
+        return response.text.strip()
+    
+    def _build_chat_prompt(
+        self,
+        prompt: str,
+        context: List[Dict] = None,
+        summary: Optional[str] = None
+    ) -> str:
+        """Собрать промпт для чата из системной инструкции, истории и сообщения"""
+        history = ""
+        
+        if summary:
+            history += f"КРАТКОЕ СОДЕРЖАНИЕ ПРЕДЫДУЩЕЙ БЕСЕДЫ:\n{summary}\n\n"
+        
+        if context:
+            history += "КОНТЕКСТ БЕСЕДЫ:\n"
+            # Контекст уже уложен в бюджет токенов (см. ContextBuilder)
+            for msg in context:
+                role = "Клиент" if msg.get("role") == "user" else "Аналитик"
+                history += f"{role}: {msg.get('content', '')}\n"
+            history += "\n"
+        
+        return get_prompt("chat").render(history=history, message=prompt)
+    
     async def generate_document(self, chat_history: List[Dict]) -> Dict:
         """
         Сгенерировать полный документ бизнес-требований на основе истории чата
         """
-        chat_text = self._format_chat_history(chat_history)
-        
-        prompt = f"""
-Ты - эксперт по написанию бизнес-требований. На основе диалога с клиентом создай ДЕТАЛЬНЫЙ документ.
-
-ДИАЛОГ С КЛИЕНТОМ:
-{chat_text}
-
-КРИТИЧЕСКИ ВАЖНО:
-1. Если клиент назвал проект (например "Project Alpha", "CRM для банка", "Мобильное приложение доставки") - используй ТОЧНОЕ название в projectName
-2. Если клиент указал конкретные цели (например "Увеличить вовлеченность на 20%", "Автоматизировать процесс") - используй ИХ ТОЧНЫЕ формулировки в goals
-3. Если клиент описал функции - перенеси их в useCases с деталями
-4. НЕ используй общие фразы типа "Определить цели проекта" или "Требует уточнения" - ТОЛЬКО конкретика из диалога
-
-СТРУКТУРА JSON:
-{{
-  "projectName": "ТОЧНОЕ название из диалога (не 'Новый проект'!)",
-  "description": {{"paragraphs": ["конкретное описание из диалога", "детали проекта", "контекст и цели"]}},
-  "goals": [{{"text": "КОНКРЕТНАЯ цель из диалога (не заглушка!)", "priority": "high|medium|low"}}],
-  "scope": {{"inScope": ["конкретные функции из диалога"], "outOfScope": ["что точно не входит"]}},
-  "businessRules": [{{"id": "BR001", "title": "название", "description": "конкретное правило", "priority": "high|medium|low"}}],
-  "useCases": [{{"id": "UC001", "title": "конкретный сценарий", "actor": "роль пользователя", "preconditions": ["что должно быть"], "mainScenario": ["шаг 1: детально", "шаг 2: детально", "шаг 3: детально"], "postconditions": "результат"}}],
-  "kpis": [{{"name": "измеримая метрика", "current": текущее_число, "target": целевое_число, "unit": "единица измерения"}}]
-}}
-
-ПРАВИЛА ЗАПОЛНЕНИЯ:
-- projectName: Если клиент сказал "хочу создать CRM" -> "CRM система", если "Project Alpha" -> "Project Alpha"
-- goals: Если клиент сказал "увеличить продажи на 30%" -> {{"text": "Увеличить продажи на 30%", "priority": "high"}}
-- useCases: Минимум 3-5 детальных сценариев с 5-10 шагами каждый
-- kpis: Реальные числа если упомянуты ("рост на 20%" -> current: 100, target: 120)
-
-ЗАПРЕЩЕНО использовать:
-❌ "Определить цели проекта"
-❌ "Новый проект"
-❌ "Требует уточнения"
-❌ "Будет определено позже"
-❌ Любые заглушки
-
-Верни ТОЛЬКО валидный JSON без markdown блоков.
-"""
+        prompt = self._document_prompt(chat_history)
         
         try:
             response = await self._call_with_retry(
-                self.model_flash.generate_content,
+                self.model_flash,
                 prompt,
-                generation_config=self.structured_config
+                operation="document",
+                generation_config=self.document_config,
+                cached_prefix=self._static_prefix(get_prompt("document"))
             )
             
-            # Извлечь и распарсить JSON
-            json_str = self._extract_json_from_text(response.text)
-            self.logger.info(f"Extracted JSON string (first 500 chars): {json_str[:500]}")
-
-            document = json.loads(json_str)
+            # Распарсить JSON; недостающие поля достроит _ensure_all_fields
+            document = parse_structured(
+                response.text, DocumentContent, "document",
+                repair=self._extract_json_from_text, strict=False
+            )
             self.logger.info(f"Parsed document: projectName='{document.get('projectName')}', goals count={len(document.get('goals', []))}")
 
             # Заполнить отсутствующие поля значениями по умолчанию
@@ -180,278 +286,412 @@ class GeminiService:
             
         except json.JSONDecodeError as e:
             self.logger.error(f"Invalid JSON from Gemini: {e}")
+            LLM_FALLBACKS.labels("document", "invalid_json").inc()
             return self._get_fallback_document(chat_history)
         except Exception as e:
             self.logger.error(f"Document generation error: {e}")
+            LLM_FALLBACKS.labels("document", "error").inc()
             return self._get_fallback_document(chat_history)
     
-    async def validate_document(self, document: Dict) -> Dict:
+    async def stream_document(
+        self,
+        chat_history: List[Dict],
+        mode: GenerationMode = GenerationMode.SINGLE
+    ) -> AsyncIterator[Tuple[str, Any]]:
         """
-        Проанализировать качество документа требований
+        Потоковая генерация документа: отдает секции верхнего уровня
+        (ключ, значение) по мере того, как модель их закрывает. В режиме
+        SECTIONS секции запрашиваются параллельно и отдаются по готовности
         """
-        doc_str = json.dumps(document, ensure_ascii=False, indent=2)
+        if mode == GenerationMode.SECTIONS:
+            async for section in self._stream_document_sections(chat_history):
+                yield section
+            return
         
-        prompt = f"""
-Проанализируй документ бизнес-требований и оцени качество по 4 критериям (0-100%):
-
-1. ПОЛНОТА (completeness): все ли секции заполнены, достаточно ли информации
-2. ЯСНОСТЬ (clarity): понятность формулировок, отсутствие двусмысленности  
-3. ДЕТАЛИЗАЦИЯ (detail): достаточно ли деталей для реализации
-4. СОГЛАСОВАННОСТЬ (consistency): нет ли противоречий между секциями
-
-Также найди конкретные проблемы с указанием секции и возможности исправления.
-
-ДОКУМЕНТ:
-{doc_str}
-
-ФОРМАТ ОТВЕТА JSON:
-{{
-  "qualityScore": {{
-    "health": число_от_0_до_100,
-    "completeness": число_от_0_до_100,
-    "clarity": число_от_0_до_100,
-    "detail": число_от_0_до_100,
-    "consistency": число_от_0_до_100
-  }},
-  "issues": [
-    {{
-      "text": "описание проблемы",
-      "severity": "high|medium|low",
-      "section": "название секции",
-      "fixable": true/false
-    }}
-  ]
-}}
-
-health = среднее арифметическое остальных 4 метрик.
-Верни ТОЛЬКО JSON.
-"""
+        scanner = JsonSectionScanner()
+        async with aclosing(self._stream(
+            self.model_flash,
+            self._document_prompt(chat_history),
+            operation="document_stream",
+            generation_config=self.document_config,
+            cached_prefix=self._static_prefix(get_prompt("document"))
+        )) as chunks:
+            async for chunk in chunks:
+                for section in scanner.feed(chunk):
+                    yield section
+        
+        if not scanner.done:
+            raise json.JSONDecodeError("Document stream ended before the JSON object was closed", "", 0)
+    
+    async def update_document(
+        self,
+        document: Dict,
+        new_messages: List[Dict],
+        chat_history: List[Dict]
+    ) -> Optional[Dict]:
+        """
+        Обновить документ по новым сообщениям чата: модель получает текущий
+        документ и только новые реплики и возвращает измененные секции целиком.
+        None - обновление не удалось (вызывающий код генерирует документ заново).
+        """
+        template = get_prompt("document_delta")
+        prompt = template.render(
+            document=json.dumps(document, ensure_ascii=False, indent=2),
+            messages=self._format_chat_history(new_messages)
+        )
         
         try:
             response = await self._call_with_retry(
-                self.model_flash.generate_content,
+                self.model_flash,
                 prompt,
-                generation_config=self.structured_config
+                operation="document_delta",
+                generation_config=self.document_patch_config,
+                cached_prefix=self._static_prefix(template)
             )
             
-            json_str = self._extract_json_from_text(response.text)
-            validation = json.loads(json_str)
+            changes = parse_structured(
+                response.text, self.document_patch_model, "document_delta",
+                repair=self._extract_json_from_text, strict=False
+            )
+            if not isinstance(changes, dict):
+                raise ValueError("Document delta is not a JSON object")
             
-            return validation
+        except Exception as e:
+            self.logger.error(f"Document delta update error: {e}")
+            LLM_FALLBACKS.labels("document_delta", fallback_reason(e)).inc()
+            return None
+        
+        changed = [key for key in DocumentContent.model_fields if changes.get(key)]
+        self.logger.info(f"Document delta: {len(new_messages)} new messages, changed sections: {changed}")
+        
+        updated = dict(document)
+        for key in changed:
+            updated[key] = changes[key]
+        return self._ensure_all_fields(updated, chat_history)
+    
+    def complete_document(self, sections: Dict, chat_history: List[Dict]) -> Dict:
+        """Собрать документ из полученных секций, достроив недостающие"""
+        return self._ensure_all_fields(sections, chat_history)
+    
+    def _document_prompt(self, chat_history: List[Dict]) -> str:
+        return get_prompt("document").render(chat_text=self._format_chat_history(chat_history))
+    
+    async def generate_document_sections(self, chat_history: List[Dict]) -> Dict:
+        """
+        Сгенерировать документ по секциям: все секции запрашиваются параллельно
+        по одной и той же истории чата и затем собираются в один документ
+        """
+        chat_text = self._format_chat_history(chat_history)
+        
+        parts = await asyncio.gather(*[
+            self._generate_section(chat_text, name, keys)
+            for name, (keys, _, _) in DOCUMENT_SECTIONS.items()
+        ])
+        
+        document = {}
+        for part in parts:
+            document.update(part)
+        
+        return self._ensure_all_fields(document, chat_history)
+    
+    async def _stream_document_sections(self, chat_history: List[Dict]) -> AsyncIterator[Tuple[str, Any]]:
+        chat_text = self._format_chat_history(chat_history)
+        tasks = [
+            asyncio.ensure_future(self._generate_section(chat_text, name, keys))
+            for name, (keys, _, _) in DOCUMENT_SECTIONS.items()
+        ]
+        try:
+            for part in asyncio.as_completed(tasks):
+                for key, value in (await part).items():
+                    yield key, value
+        finally:
+            # Клиент отключился - оставшиеся секции не нужны
+            for task in tasks:
+                task.cancel()
+    
+    async def _generate_section(
+        self,
+        chat_text: str,
+        name: str,
+        keys: List[str]
+    ) -> Dict:
+        """Сгенерировать одну секцию документа; при ошибке - пустой результат"""
+        template = get_prompt(f"document_section:{name}")
+        prompt = template.render(chat_text=chat_text)
+        
+        try:
+            response = await self._call_with_retry(
+                self.model_flash,
+                prompt,
+                operation="document_section",
+                generation_config=self.section_configs[name],
+                cached_prefix=self._static_prefix(template)
+            )
+            
+            section = parse_structured(
+                response.text, self.section_models[name], "document_section",
+                repair=self._extract_json_from_text, strict=False
+            )
+            return {key: section[key] for key in keys if section.get(key)}
+            
+        except Exception as e:
+            self.logger.error(f"Document section '{name}' generation error: {e}")
+            LLM_FALLBACKS.labels("section", fallback_reason(e)).inc()
+            return {}
+    
+    async def validate_document(self, document: Dict, use_cache: bool = True) -> Dict:
+        """
+        Проанализировать качество документа требований.
+        
+        Замечания кэшируются по хэшу содержимого каждой секции: если часть
+        секций уже проверялась в том же виде, модель получает только
+        измененные секции и дайджесты остальных, а замечания по неизмененным
+        секциям берутся из кэша.
+        """
+        sections = {key: document.get(key) for key in DOCUMENT_KEYS}
+        hashes = {key: section_hash(value) for key, value in sections.items()}
+        document_cache_key = self._validation_cache_key("document", "".join(hashes.values()))
+        
+        cached_issues = {}
+        if use_cache:
+            cached = await self.cache.get(document_cache_key)
+            if cached is not None:
+                return cached
+            for key, digest in hashes.items():
+                issues = await self.cache.get(self._validation_cache_key(key, digest))
+                if issues is not None:
+                    cached_issues[key] = issues
+        
+        changed = [key for key in DOCUMENT_KEYS if key not in cached_issues]
+        if not changed:
+            # Итог по документу вытеснен из кэша - проверяем заново целиком
+            cached_issues = {}
+            changed = list(DOCUMENT_KEYS)
+        
+        if cached_issues:
+            operation = "validate_partial"
+            prompt = self._validation_prompt(
+                "ИЗМЕНЕННЫЕ СЕКЦИИ:\n" + compact_json({key: sections[key] for key in changed})
+                + "\n\nДАЙДЖЕСТ НЕИЗМЕНЕННЫХ СЕКЦИЙ (уже проверены, замечания по ним НЕ нужны):\n"
+                + "\n".join(f"- {key}: {section_digest(sections[key])}" for key in cached_issues)
+            )
+        else:
+            operation = "validate"
+            prompt = self._validation_prompt("ДОКУМЕНТ:\n" + compact_json(sections))
+        
+        try:
+            response = await self._call_with_retry(
+                self.model_flash,
+                prompt,
+                operation=operation,
+                generation_config=self.validation_config,
+                cached_prefix=self._static_prefix(get_prompt("validation"))
+            )
+            
+            validation = parse_structured(
+                response.text, ValidationResponse, operation,
+                repair=self._extract_json_from_text
+            )
             
         except Exception as e:
             self.logger.error(f"Document validation error: {e}")
+            LLM_FALLBACKS.labels("validation", fallback_reason(e)).inc()
             return self._get_fallback_validation()
+        
+        # Свежие замечания - по проверенным секциям; без известной секции - общие.
+        # Замечания по секциям из кэша отбрасываются: их версия уже в кэше
+        fresh_issues = {key: [] for key in changed}
+        general_issues = []
+        for issue in validation["issues"]:
+            key = section_key(issue.get("section"))
+            if key is None:
+                general_issues.append(issue)
+            elif key in fresh_issues:
+                fresh_issues[key].append(issue)
+        
+        for key, issues in fresh_issues.items():
+            self.cache.set(self._validation_cache_key(key, hashes[key]), issues)
+        
+        result = {
+            "qualityScore": validation["qualityScore"],
+            "issues": [
+                issue
+                for key in DOCUMENT_KEYS
+                for issue in cached_issues.get(key, fresh_issues.get(key, []))
+            ] + general_issues
+        }
+        self.cache.set(document_cache_key, result)
+        return result
+    
+    def _validation_cache_key(self, section: str, digest: str) -> str:
+        """Ключ кэша проверки секции (или всего документа) по хэшу содержимого"""
+        return self._response_cache_key(
+            f"validation:{section}:{digest}",
+            self.validation_config
+        )
+    
+    def _validation_prompt(self, content: str) -> str:
+        return get_prompt("validation").render(content=content)
 
-    async def generate_diagram(self, description: str, diagram_type: str) -> str:
+    async def generate_diagram(self, description: str, diagram_type: str, use_cache: bool = True) -> str:
         """
         Сгенерировать Mermaid диаграмму
         """
-        prompts = {
-            "flowchart": f"""
-        Создай Mermaid flowchart диаграмму для процесса: {description}
-
-        КРИТИЧЕСКИ ВАЖНО! Mermaid 10.9.5 требует СТРОГИЙ порядок:
-
-        ТЫ ОБЯЗАН генерировать код СТРОГО В ЭТОМ ПОРЯДКЕ (иначе парсер упадёт):
-
-        1. flowchart TD
-        2. Пустая строка
-        3. ВСЕ узлы подряд (включая start и end)
-        4. Пустая строка
-        5. ВСЕ стрелки
-
-        ПРАВИЛЬНЫЙ ПРИМЕР (копируй этот стиль):
-        flowchart TD
-
-            start((Начало))
-            A[Открыть приложение]
-            B[Просмотреть рестораны]
-            C[Выбрать ресторан]
-            D[Изучить меню]
-            E[Добавить в корзину]
-            F{{Готов оформить?}}
-            G[Подтвердить заказ]
-            H[Оплата и обработка]
-            I[Отслеживание доставки]
-            end((Конец))
-
-            start --> A
-            A --> B
-            B --> C
-            C --> D
-            D --> E
-            E --> F
-            F -->|Нет| E
-            F -->|Да| G
-            G --> H
-            H --> I
-            I --> end
-
-        Создай 8–12 узлов. Используй кириллицу. 
-        Верни ТОЛЬКО код, без ```mermaid, без пояснений, без комментариев %%.
-        """,
-
-            "sequenceDiagram": f"""
-        Создай Mermaid sequenceDiagram в Mermaid для сценария:
-        {description}
-
-        Используй русские названия участников и сообщений.
-        Верни ТОЛЬКО код, начиная со строки "sequenceDiagram", без ``` и пояснений.
-        """,
-
-            "journey": f"""
-        Создай user journey диаграмму в Mermaid для:
-        {description}
-
-        Покажи этапы, действия пользователя, эмоции и точки контакта.
-        Верни ТОЛЬКО код, начиная со строки "journey", без ``` и пояснений.
-        """,
-
-            "erDiagram": f"""
-        Создай ER-диаграмму в Mermaid для:
-        {description}
-
-        Определи сущности, атрибуты (PK, FK), связи (||--o,|--|| и т.д.).
-        Используй русские названия сущностей и полей.
-        Верни ТОЛЬКО код, начиная со строки "erDiagram", без ``` и пояснений.
-        """,
-
-            # НОВЫЙ — BPMN РАБОТАЕТ СРАЗУ ПОСЛЕ ЭТОГО
-            "bpmn": f"""
-        Создай BPMN 2.0 диаграмму в синтаксисе Mermaid для процесса:
-        {description}
-
-        ПРАВИЛА:
-        - Начинай строго со строки: bpmnDiagram
-        - Используй только поддерживаемые элементы: 
-          StartEvent, EndEvent, Task, UserTask, ServiceTask, ExclusiveGateway, ParallelGateway, SequenceFlow, MessageFlow
-        - Русский текст внутри названий задач и шлюзов
-        - Участники через participant (если нужно)
-        - Никаких --> стрелок — только SequenceFlow
-
-        Пример:
-        bpmnDiagram
-            startEvent "Начало" as start
-            task "Открыть приложение" as task1
-            userTask "Выбрать блюда" as task2
-            exclusiveGateway "Готов оплатить?" as gw1
-            serviceTask "Обработка платежа" as task3
-            endEvent "Заказ принят" as end
-
-            start --> task1
-            task1 --> task2
-            task2 --> gw1
-            gw1 -->|Да| task3
-            gw1 -->|Нет| task2
-            task3 --> end
-
-        Создай полную диаграмму с 8–15 элементами.
-        Верни ТОЛЬКО чистый код BPMN, без ```bpmn, без пояснений.
-        """
-        }
-        prompt = prompts.get(diagram_type, prompts["flowchart"])
+        template = get_prompt(f"diagram:{diagram_type}" if diagram_type in DIAGRAMS else "diagram:flowchart")
+        prompt = template.render(description=description)
+
+        cache_key = self._response_cache_key(prompt, self.structured_config)
+        if use_cache:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return cached
 
         try:
             response = await self._call_with_retry(
-                self.model_flash.generate_content,
+                self.model_flash,
                 prompt,
-                generation_config=self.structured_config
+                operation="diagram",
+                generation_config=self.structured_config,
+                cached_prefix=self._static_prefix(template)
             )
 
             mermaid_code = self._clean_mermaid_code(response.text)
+            self.cache.set(cache_key, mermaid_code)
             return mermaid_code
 
         except Exception as e:
             self.logger.error(f"Diagram generation error: {e}")
+            LLM_FALLBACKS.labels("diagram", fallback_reason(e)).inc()
             return f"graph TD\n    A[Ошибка генерации] --> B[Попробуйте еще раз]"
 
-    async def analyze_file(self, file_content: str) -> Dict:
+    async def analyze_file(self, file_content: str, use_cache: bool = True, fallback: bool = True) -> Dict:
         """
-        Проанализировать содержимое файла и извлечь требования
+        Проанализировать содержимое файла и извлечь требования.
+        Текст длиннее FILE_ANALYSIS_SINGLE_PASS_CHARS анализируется по чанкам
+        (analyze_file_chunked) - без обрезки. При ошибке - fallback_file_analysis(),
+        а с fallback=False - FileAnalysisError (вызывающему коду нужно
+        отличить настоящий анализ, например чтобы его закэшировать)
         """
-        # Ограничиваем размер текста для Gemini (макс ~50k символов)
-        if len(file_content) > 50000:
-            file_content = file_content[:50000] + "...[текст обрезан]"
+        if len(file_content) > settings.FILE_ANALYSIS_SINGLE_PASS_CHARS:
+            return await self.analyze_file_chunked(file_content, use_cache=use_cache, fallback=fallback)
         
-        prompt = f"""
-Проанализируй этот документ и извлеки структурированную информацию:
-
-1. Название проекта
-2. Цели проекта (массив строк)
-3. Бизнес-требования (массив строк)
-4. Стейкхолдеры (массив строк)
-5. Описание функционала
-
-ТЕКСТ ДОКУМЕНТА:
-{file_content}
-
-ФОРМАТ ОТВЕТА JSON:
-{{
-  "projectName": "название или 'Неизвестный проект'",
-  "goals": ["цель 1", "цель 2"],
-  "requirements": ["требование 1", "требование 2"],
-  "stakeholders": ["стейкхолдер 1", "стейкхолдер 2"],
-  "description": "краткое описание функционала"
-}}
-
-Если информации недостаточно - используй разумные предположения.
-Верни ТОЛЬКО JSON.
-"""
+        # Текст файла - в начале промпта: запросы по одному файлу делят закэшированный контекст
+        context = file_context(file_content)
+        prompt = context + get_prompt("file_analysis").render()
+        
+        cache_key = self._response_cache_key(prompt, self.file_analysis_config)
+        if use_cache:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return cached
         
         try:
             response = await self._call_with_retry(
-                self.model_pro.generate_content,  # Используем Pro для анализа файлов
+                self.model_pro,  # Используем Pro для анализа файлов
                 prompt,
-                generation_config=self.structured_config
+                operation="analyze",
+                generation_config=self.file_analysis_config,
+                cached_prefix=context,
+                cache_project=usage_ledger.current_project()
             )
             
-            json_str = self._extract_json_from_text(response.text)
-            analysis = json.loads(json_str)
+            analysis = parse_structured(
+                response.text, FileAnalysis, "analyze",
+                repair=self._extract_json_from_text
+            )
             
+            self.cache.set(cache_key, analysis)
             return analysis
             
         except Exception as e:
             self.logger.error(f"File analysis error: {e}")
-            return {
-                "projectName": "Неизвестный проект",
-                "goals": ["Анализ файла не удался"],
-                "requirements": ["Требует ручной обработки"],
-                "stakeholders": ["Не определены"],
-                "description": "Ошибка при анализе файла"
-            }
+            LLM_FALLBACKS.labels("file_analysis", fallback_reason(e)).inc()
+            if not fallback:
+                raise FileAnalysisError(f"File analysis failed: {e}") from e
+            return fallback_file_analysis()
+    
+    async def analyze_file_chunked(self, file_content: str, use_cache: bool = True, fallback: bool = True) -> Dict:
+        """
+        Map-reduce анализ длинного текста: чанки по границам страниц, листов
+        и таблиц анализируются параллельно во Flash (не больше
+        FILE_ANALYSIS_CHUNK_CONCURRENCY одновременно), результаты
+        объединяются без дубликатов. Неудачный чанк пропускается; если не
+        удались все - fallback (или FileAnalysisError, как в analyze_file)
+        """
+        chunks = split_text(file_content, settings.FILE_ANALYSIS_CHUNK_CHARS)
+        limit = asyncio.Semaphore(settings.FILE_ANALYSIS_CHUNK_CONCURRENCY)
+        
+        async def analyze(index: int, chunk: str) -> Optional[Dict]:
+            async with limit:
+                return await self._analyze_chunk(chunk, index, len(chunks), use_cache)
+        
+        results = await asyncio.gather(*[analyze(index, chunk) for index, chunk in enumerate(chunks, 1)])
+        partials = [result for result in results if result is not None]
+        self.logger.info(
+            f"Chunked file analysis: {len(file_content)} characters, "
+            f"{len(partials)}/{len(chunks)} chunks analyzed"
+        )
+        if not partials:
+            LLM_FALLBACKS.labels("file_analysis", "error").inc()
+            if not fallback:
+                raise FileAnalysisError(f"File analysis failed: all {len(chunks)} chunks failed")
+            return fallback_file_analysis()
+        return merge_file_analyses(partials)
+    
+    async def _analyze_chunk(self, chunk: str, index: int, total: int, use_cache: bool) -> Optional[Dict]:
+        template = get_prompt("file_analysis_chunk")
+        prompt = template.render(index=index, total=total, text=chunk)
+        
+        cache_key = self._response_cache_key(prompt, self.file_analysis_config)
+        if use_cache:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        try:
+            response = await self._call_with_retry(
+                self.model_flash,
+                prompt,
+                operation="analyze_chunk",
+                generation_config=self.file_analysis_config,
+                cached_prefix=self._static_prefix(template)
+            )
+            analysis = parse_structured(
+                response.text, FileAnalysis, "analyze_chunk",
+                repair=self._extract_json_from_text
+            )
+            self.cache.set(cache_key, analysis)
+            return analysis
+        except Exception as e:
+            self.logger.error(f"File chunk {index}/{total} analysis error: {e}")
+            LLM_FALLBACKS.labels("file_analysis_chunk", fallback_reason(e)).inc()
+            return None
     
-    async def improve_section(self, section_text: str, issue_description: str) -> str:
+    async def improve_section(self, section_text: str, issue_description: str, use_cache: bool = True) -> str:
         """
         Улучшить секцию документа на основе выявленной проблемы
         """
-        prompt = f"""
-Улучши эту секцию документа, устранив указанную проблему:
-
-ТЕКУЩИЙ ТЕКСТ СЕКЦИИ:
-{section_text}
-
-ПРОБЛЕМА ДЛЯ ИСПРАВЛЕНИЯ:
-{issue_description}
-
-ТРЕБОВАНИЯ К УЛУЧШЕНИЮ:
-- Сохрани смысл и структуру
-- Сделай текст более ясным и детальным
-- Устрани указанную проблему
-- Используй профессиональную терминологию
-- Добавь конкретные детали если нужно
-
-Верни ТОЛЬКО улучшенный текст, без пояснений и комментариев.
-"""
+        template = get_prompt("improve_section")
+        prompt = template.render(section_text=section_text, issue_description=issue_description)
+        
+        cache_key = self._response_cache_key(prompt, self.chat_config)
+        if use_cache:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return cached
         
         try:
             response = await self._call_with_retry(
-                self.model_flash.generate_content,
+                self.model_flash,
                 prompt,
-                generation_config=self.chat_config
+                operation="improve",
+                generation_config=self.chat_config,
+                cached_prefix=self._static_prefix(template)
             )
             
-            return response.text.strip()
+            improved_text = response.text.strip()
+            self.cache.set(cache_key, improved_text)
+            return improved_text
             
         except Exception as e:
             self.logger.error(f"Section improvement error: {e}")
@@ -459,28 +699,262 @@ health = среднее арифметическое остальных 4 мет
     
     # Utility methods
     
-    async def _call_with_retry(self, func, *args, **kwargs):
-        """Вызов API с retry логикой"""
+    def _response_cache_key(self, prompt: str, generation_config: Any = None) -> str:
+        """Ключ кэша ответов: пара моделей сервиса, промпт и конфигурация генерации"""
+        return self.cache.make_key(self._models_label, prompt, generation_config)
+    
+    def _static_prefix(self, template: PromptTemplate) -> Optional[str]:
+        """
+        Статический префикс шаблона для кэша контекста или None, если он
+        короче минимума провайдера (такой кэш не создать - не пытаемся)
+        """
+        return template.prefix if self.context_cache.cacheable(template.prefix) else None
+    
+    async def _call_with_retry(self, model, prompt, operation: str, **kwargs):
+        """
+        Вызов API с retry логикой; одинаковые одновременные вызовы объединяются.
+        operation - метка метрик: chat, document, validate, diagram, analyze, ...
+        
+        Токены объединенного вызова учитываются один раз - в области того, кто
+        его выполнил. Поэтому в ключ входит проект: вызовы разных проектов
+        не объединяются и каждый платит за свой, а ожидающие вызовы того же
+        проекта ничего не тратят и в его расход не добавляются.
+        """
+        model = self.router.route(model, operation, prompt)
+        key = self.cache.make_key(model.model_name, prompt, kwargs.get("generation_config"))
+        key = f"{usage_ledger.current_project() or ''}:{key}"
+        return await self.single_flight.do(
+            key,
+            lambda: self._hedged_call(model, operation, prompt, **kwargs)
+        )
+    
+    async def _hedged_call(self, model, operation: str, prompt, **kwargs):
+        """
+        Вызов с хеджированием: если медленная модель не ответила за задержку
+        роутера, тот же запрос параллельно уходит в быструю и возвращается
+        первый успешный ответ. Проигравший вызов не отменяется - токены
+        за него уже оплачены и должны попасть в учет расхода.
+        """
+        delay = self.router.hedge_delay(model, operation)
+        if delay is None:
+            return await self._retrying_call(model, operation, prompt, **kwargs)
+        
+        primary = asyncio.ensure_future(self._retrying_call(model, operation, prompt, **kwargs))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        
+        LLM_HEDGES.labels(operation, "started").inc()
+        self.logger.warning(f"{model_label(model)} {operation} slower than {delay:.1f}s, hedging to {model_label(self.router.fast)}")
+        hedge = asyncio.ensure_future(self._retrying_call(self.router.fast, operation, prompt, **kwargs))
+        
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    LLM_HEDGES.labels(operation, "hedge_won" if task is hedge else "primary_won").inc()
+                    for other in pending:
+                        # Результат проигравшего не нужен, но ошибку надо забрать
+                        other.add_done_callback(lambda t: t.cancelled() or t.exception())
+                    return task.result()
+                error = task.exception()
+        
+        LLM_HEDGES.labels(operation, "failed").inc()
+        raise error
+    
+    async def _retrying_call(self, model, operation: str, prompt, **kwargs):
+        """
+        Вызов API с повторами: повторяются только временные ошибки (429, 5xx,
+        таймауты), задержка - подсказка сервера или экспонента с jitter.
+        """
+        try:
+            return await self._attempt_with_retries(model, operation, prompt, **kwargs)
+        except Exception as e:
+            LLM_FAILURES.labels(model_label(model), operation, type(e).__name__).inc()
+            raise
+    
+    async def _attempt_with_retries(self, model, operation: str, prompt, **kwargs):
         max_retries = settings.GEMINI_MAX_RETRIES
+        breaker = self._breakers[id(model)]
         
         for attempt in range(max_retries):
+            probe = breaker.before_call()
             try:
-                # Для async функций
-                if asyncio.iscoroutinefunction(func):
-                    result = await func(*args, **kwargs)
-                else:
-                    result = func(*args, **kwargs)
-                
-                self.logger.info(f"Gemini API call successful on attempt {attempt + 1}")
-                return result
-                
+                await self._rate_limiters[id(model)].acquire()
+                result = await self._generate(model, operation, prompt, **kwargs)
+            except asyncio.CancelledError:
+                # Исхода нет - пробный вызов не должен навсегда занять half_open
+                if probe:
+                    breaker.release_probe()
+                raise
             except Exception as e:
+                if not is_retryable(e):
+                    # Сервис ответил - ошибка в запросе, а не в доступности API
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                
                 if attempt == max_retries - 1:
-                    raise e
+                    raise
+                
+                wait_time = retry_delay_hint(e)
+                if wait_time is None:
+                    wait_time = backoff_delay(attempt, settings.GEMINI_RETRY_BASE_DELAY, settings.GEMINI_RETRY_MAX_DELAY)
+                elif wait_time > settings.GEMINI_RETRY_MAX_DELAY:
+                    raise
                 
-                wait_time = (2 ** attempt)  # Exponential backoff
-                self.logger.warning(f"Gemini API call failed (attempt {attempt + 1}): {e}. Retrying in {wait_time}s...")
+                LLM_RETRIES.labels(model_label(model), operation).inc()
+                self.logger.warning(f"Gemini API call failed (attempt {attempt + 1}): {e}. Retrying in {wait_time:.1f}s...")
                 await asyncio.sleep(wait_time)
+                continue
+            
+            breaker.record_success()
+            self.logger.info(f"Gemini API call successful on attempt {attempt + 1}")
+            return result
+    
+    async def _generate(
+        self,
+        model,
+        operation: str,
+        prompt,
+        cached_prefix: Optional[str] = None,
+        cache_project: Optional[str] = None,
+        **kwargs
+    ):
+        """
+        Выполнить синхронный generate_content в пуле потоков с учетом лимита модели.
+        cached_prefix - неизменное начало промпта для кэша контекста провайдера,
+        cache_project - проект, к которому относится этот кэш (текст файла).
+        """
+        async with self._limits[id(model)]:
+            loop = asyncio.get_running_loop()
+            # Время одной попытки без ожидания слота модели
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await loop.run_in_executor(
+                    self._executor,
+                    partial(self.context_cache.generate, model, prompt, cached_prefix, cache_project, **kwargs)
+                )
+                outcome = "success"
+            finally:
+                labels = (model_label(model), operation)
+                elapsed = time.perf_counter() - started
+                LLM_CALL_DURATION.labels(*labels).observe(elapsed)
+                if outcome == "success":
+                    self.router.observe(model, operation, elapsed)
+                LLM_CALLS.labels(*labels, outcome).inc()
+        
+        usage_ledger.record(model_label(model), operation, usage_from_response(result, prompt))
+        return result
+    
+    async def _stream(
+        self,
+        model,
+        prompt,
+        operation: str,
+        cached_prefix: Optional[str] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        Потоковый generate_content: поток из пула читает ответ SDK и передает
+        фрагменты в event loop через очередь. Повторов нет - часть ответа
+        уже могла быть отправлена клиенту (и хеджирования тоже нет).
+        """
+        model = self.router.route(model, operation, prompt)
+        breaker = self._breakers[id(model)]
+        try:
+            probe = breaker.before_call()
+        except CircuitOpenError as e:
+            LLM_FAILURES.labels(model_label(model), operation, type(e).__name__).inc()
+            raise
+        # Текст ответа по фрагментам
+        parts = []
+        outcome = "cancelled"
+        try:
+            await self._rate_limiters[id(model)].acquire()
+            async with self._limits[id(model)]:
+                loop = asyncio.get_running_loop()
+                started = time.perf_counter()
+                queue: asyncio.Queue = asyncio.Queue()
+                stop = threading.Event()
+                done = object()
+                # Последний фрагмент (в новых SDK в нем usage_metadata всего ответа)
+                last_chunk = []
+
+                def produce():
+                    try:
+                        chunks = self.context_cache.generate(model, prompt, cached_prefix, stream=True, **kwargs)
+                        for chunk in chunks:
+                            if stop.is_set():
+                                break
+                            last_chunk[:] = [chunk]
+                            if chunk.text:
+                                loop.call_soon_threadsafe(queue.put_nowait, chunk.text)
+                    except Exception as e:
+                        loop.call_soon_threadsafe(queue.put_nowait, e)
+                    finally:
+                        loop.call_soon_threadsafe(queue.put_nowait, done)
+
+                loop.run_in_executor(self._executor, produce)
+                try:
+                    while True:
+                        item = await queue.get()
+                        if item is done:
+                            break
+                        if isinstance(item, Exception):
+                            if is_retryable(item):
+                                breaker.record_failure()
+                            else:
+                                breaker.record_success()
+                            outcome = "error"
+                            LLM_FAILURES.labels(model_label(model), operation, type(item).__name__).inc()
+                            raise item
+                        parts.append(item)
+                        yield item
+                    breaker.record_success()
+                    outcome = "success"
+                finally:
+                    # Клиент отключился или ошибка - останавливаем чтение потока
+                    stop.set()
+                    labels = (model_label(model), operation)
+                    LLM_CALL_DURATION.labels(*labels).observe(time.perf_counter() - started)
+                    LLM_CALLS.labels(*labels, outcome).inc()
+                    # Оборванный поток тоже оплачен - учитываем то, что успели получить
+                    if outcome != "error":
+                        usage = usage_from_response(
+                            last_chunk[0] if outcome == "success" and last_chunk else None,
+                            prompt,
+                            "".join(parts)
+                        )
+                        usage_ledger.record(model_label(model), operation, usage)
+        finally:
+            if outcome == "cancelled":
+                # Клиент отключился (или отмена при ожидании лимитов): если API
+                # уже отвечал - модель доступна, иначе пробный вызов half_open
+                # возвращается следующему
+                if parts:
+                    breaker.record_success()
+                elif probe:
+                    breaker.release_probe()
+    
+    def resilience_stats(self) -> Dict[str, Any]:
+        """Состояние circuit breaker и rate limiter по моделям"""
+        return {
+            model.model_name: {
+                "circuit": self._breakers[id(model)].stats(),
+                "rate_limit": self._rate_limiters[id(model)].stats()
+            }
+            for model in (self.model_flash, self.model_pro)
+        }
+    
+    def close(self):
+        """Освободить пул потоков и кэши контекста, дописать кэш ответов (при остановке приложения)"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.context_cache.clear()
+        self.cache.stop()
     
     def _extract_json_from_text(self, text: str) -> str:
         """Извлечь JSON из текста, убрав markdown блоки"""
@@ -493,23 +967,11 @@ health = среднее арифметическое остальных 4 мет
         text = re.sub(r'//.*?\n', '\n', text)
         text = re.sub(r'/\*.*?\*/', '', text, flags=re.DOTALL)
 
-        # Ищем JSON объект (самый внешний {})
-        stack = []
-        start = -1
-        for i, char in enumerate(text):
-            if char == '{':
-                if not stack:
-                    start = i
-                stack.append(char)
-            elif char == '}':
-                if stack:
-                    stack.pop()
-                    if not stack and start != -1:
-                        # Нашли полный JSON объект
-                        json_str = text[start:i+1]
-                        # Убираем trailing commas перед } и ]
-                        json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
-                        return json_str
+        # Ищем JSON объект (самый внешний {}, скобки внутри строк не считаются)
+        json_str = extract_json_object(text)
+        if json_str is not None:
+            # Убираем trailing commas перед } и ]
+            return re.sub(r',(\s*[}\]])', r'\1', json_str)
 
         # Если не нашли - пробуем regex
         json_match = re.search(r'\{.*\}', text, re.DOTALL)
@@ -566,13 +1028,14 @@ health = среднее арифметическое остальных 4 мет
         # A[Текст], B((Круг)), C{{Ромб}}, start((Начало)), end((Конец))
         # ФИНАЛЬНАЯ РАБОЧАЯ РЕГУЛЯРКА — РЕШАЕТ ПРОБЛЕМУ С end((Конец)) НАВСЕГДА
         node_pattern = re.compile(r'^([a-zA-Z_]\w*)\s*(?:[\[\(\{]| \(\()')
-        edge_pattern = re.compile(r'-->|===|==|\.\.|--|->|<->|\|', re.IGNORECASE)
+        # Стрелка в любом месте строки: A --> B, A -->|Да| B, A -.-> B, A ==> B
+        edge_pattern = re.compile(r'-->|---|-\.+->|==>|<-->')
         for i, raw_line in enumerate(lines[1:], start=2):
             line = raw_line.strip()
             if not line:
                 continue
 
-            if edge_pattern.match(line):
+            if edge_pattern.search(line):
                 edge_declarations.append(line)
             elif node_pattern.match(line):
                 node_declarations.append(line)
@@ -602,12 +1065,12 @@ health = среднее арифметическое остальных 4 мет
         final_lines = final_code.split('\n')
         edge_started = False
         for line in final_lines:
-            if any(arrow in line for arrow in ['-->', '--', '===', '==', '..', '->', '<->']):
+            if edge_pattern.search(line):
                 edge_started = True
             elif edge_started and any(bracket in line for bracket in ['[', '((', '{{', '()', ']', '))', '}}']):
                 self.logger.error(f"УЗЕЛ ПОСЛЕ СТРЕЛКИ: {line}")
                 # Принудительно кидаем ошибку, чтобы видеть в логах
-            raise ValueError("Mermaid code invalid: node declared after edge")
+                raise ValueError("Mermaid code invalid: node declared after edge")
 
 
         self.logger.info(f"Готово: {len(final_lines)} строк")
@@ -748,4 +1211,37 @@ health = среднее арифметическое остальных 4 мет
                     "fixable": True
                 }
             ]
-        }
\ No newline at end of file
+        }
+
+
+# Один экземпляр сервиса на процесс: провайдер, модели, пул потоков
+# и лимиты общие для всех роутеров. Создается лениво при первом запросе.
+_gemini_service: Optional[GeminiService] = None
+_gemini_service_lock = threading.Lock()
+
+def get_gemini_service() -> GeminiService:
+    """Dependency для получения общего GeminiService"""
+    global _gemini_service
+    if _gemini_service is None:
+        with _gemini_service_lock:
+            if _gemini_service is None:
+                _gemini_service = GeminiService()
+    return _gemini_service
+
+def drop_project_context(project_id: str) -> int:
+    """
+    Удалить кэши контекста файлов проекта у провайдера. Сервис не создается:
+    если его еще нет, кэшей тоже нет
+    """
+    service = _gemini_service
+    if service is None:
+        return 0
+    return service.context_cache.drop_project(project_id)
+
+def shutdown_gemini_service():
+    """Закрыть общий GeminiService, если он был создан"""
+    global _gemini_service
+    with _gemini_service_lock:
+        if _gemini_service is not None:
+            _gemini_service.close()
+            _gemini_service = None
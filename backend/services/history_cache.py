@@ -0,0 +1,80 @@
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Deque, List, Optional
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import Message
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CachedMessage:
+    id: str
+    role: str
+    content: str
+    timestamp: Optional[datetime]
+
+
+class ChatHistoryCache:
+    """
+    Хвост истории чата по проектам в памяти процесса.
+
+    При первом обращении хвост загружается из таблицы messages, дальше
+    обновляется при каждой вставке, так что сборка контекста не ходит в БД.
+    Кэш локален для процесса: при нескольких воркерах каждый держит свой.
+    """
+
+    def __init__(self, max_messages: int = None, max_projects: int = None):
+        self.max_messages = max_messages or settings.CHAT_HISTORY_CACHE_MESSAGES
+        self.max_projects = max_projects or settings.CHAT_HISTORY_CACHE_PROJECTS
+        self._tails: "OrderedDict[str, Deque[CachedMessage]]" = OrderedDict()
+
+    def get(self, db: Session, project_id: str) -> List[CachedMessage]:
+        """Хвост истории проекта по возрастанию времени"""
+        tail = self._tails.get(project_id)
+        if tail is None:
+            tail = self._load(db, project_id)
+            self._tails[project_id] = tail
+            while len(self._tails) > self.max_projects:
+                self._tails.popitem(last=False)
+        else:
+            self._tails.move_to_end(project_id)
+        return list(tail)
+
+    def append(self, message: Message):
+        """Добавить сохраненное сообщение (только если хвост проекта уже загружен)"""
+        tail = self._tails.get(message.project_id)
+        if tail is not None:
+            tail.append(self._to_cached(message))
+
+    def invalidate(self, project_id: str):
+        """Сбросить хвост проекта (очистка истории, удаление проекта, откат)"""
+        self._tails.pop(project_id, None)
+
+    def _load(self, db: Session, project_id: str) -> Deque[CachedMessage]:
+        messages = db.query(Message).filter(
+            Message.project_id == project_id,
+            Message.deleted == False
+        ).order_by(Message.timestamp.desc()).limit(self.max_messages).all()
+
+        return deque(
+            (self._to_cached(msg) for msg in reversed(messages)),
+            maxlen=self.max_messages
+        )
+
+    @staticmethod
+    def _to_cached(message: Message) -> CachedMessage:
+        return CachedMessage(
+            id=message.id,
+            role=message.role,
+            content=message.content,
+            timestamp=message.timestamp
+        )
+
+
+chat_history_cache = ChatHistoryCache()
@@ -0,0 +1,250 @@
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+from database import SessionLocal, Job
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[int, str], Awaitable[None]]
+JobHandler = Callable[[Dict[str, Any], ProgressCallback], Awaitable[Any]]
+
+
+class JobQueue:
+    """
+    Фоновые задачи для долгих LLM операций.
+
+    Состояние задач хранится в таблице jobs, выполняет их ограниченный пул
+    воркеров (JOB_WORKERS), поэтому тяжелые задачи не занимают все слоты
+    Gemini и интерактивный чат продолжает отвечать. После перезапуска
+    незавершенные задачи снова ставятся в очередь.
+
+    Обращения к БД синхронные и выполняются в пуле потоков, а не в event
+    loop. Большой вход задачи (текст файла) передается в submit как payload:
+    он хранится в строке задачи отдельно от params, поэтому переживает
+    перезапуск и вытеснение из кэша файлов, и удаляется, когда задача
+    завершена. Обработчик получает его в params["payload"].
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    TERMINAL = (SUCCEEDED, FAILED)
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or settings.JOB_WORKERS
+        self._handlers: Dict[str, JobHandler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._changed: Optional[asyncio.Condition] = None
+
+    def register(self, job_type: str, handler: JobHandler):
+        """Зарегистрировать обработчик для типа задачи"""
+        self._handlers[job_type] = handler
+
+    async def start(self):
+        """Запустить воркеров и вернуть в очередь незавершенные задачи"""
+        self._queue = asyncio.Queue()
+        self._changed = asyncio.Condition()
+
+        pending = await run_in_threadpool(self._requeue_unfinished)
+        for job_id in pending:
+            self._queue.put_nowait(job_id)
+
+        if pending:
+            logger.info(f"Re-queued {len(pending)} unfinished jobs")
+
+        self._tasks = [
+            asyncio.create_task(self._worker(index))
+            for index in range(self.workers)
+        ]
+
+    async def stop(self):
+        """Остановить воркеров (незавершенные задачи продолжатся после перезапуска)"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(
+        self,
+        job_type: str,
+        params: Dict[str, Any],
+        project_id: str = None,
+        payload: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Создать задачу и поставить ее в очередь"""
+        if job_type not in self._handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+
+        snapshot = await run_in_threadpool(self._create, job_type, params, project_id, payload)
+        self._queue.put_nowait(snapshot["job_id"])
+        return snapshot
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Текущее состояние задачи или None"""
+        return await run_in_threadpool(self._read, job_id)
+
+    async def watch(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Состояния задачи при каждом изменении, до завершения"""
+        last = None
+        while True:
+            snapshot = await self.get(job_id)
+            if snapshot is None:
+                return
+            if snapshot != last:
+                last = snapshot
+                yield snapshot
+            if snapshot["status"] in self.TERMINAL:
+                return
+            async with self._changed:
+                # Перепроверка под блокировкой, чтобы не пропустить уведомление
+                if await self.get(job_id) == last:
+                    await self._changed.wait()
+
+    async def _worker(self, index: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Job worker {index} failed on job {job_id}: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        job = await self.get(job_id)
+        if job is None or job["status"] != self.QUEUED:
+            return
+        await self._update(job_id, status=self.RUNNING, started_at=datetime.utcnow())
+        await self._notify()
+
+        async def progress(percent: int, message: str):
+            await self._update(job_id, progress=percent, progress_message=message)
+            await self._notify()
+
+        try:
+            params = await run_in_threadpool(self._load_params, job_id)
+            result = await self._handlers[job["type"]](params, progress)
+            await self._update(
+                job_id,
+                status=self.SUCCEEDED,
+                progress=100,
+                progress_message=None,
+                result_json=json.dumps(result, ensure_ascii=False, default=str),
+                payload=None,
+                finished_at=datetime.utcnow()
+            )
+        except Exception as e:
+            error = getattr(e, "detail", None) or str(e) or type(e).__name__
+            logger.error(f"Job {job_id} ({job['type']}) failed: {error}")
+            await self._update(job_id, status=self.FAILED, error=str(error), payload=None, finished_at=datetime.utcnow())
+        await self._notify()
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _update(self, job_id: str, **fields) -> Optional[Dict[str, Any]]:
+        return await run_in_threadpool(self._write, job_id, fields)
+
+    # Синхронные обращения к БД (выполняются в пуле потоков)
+
+    def _requeue_unfinished(self) -> List[str]:
+        db = SessionLocal()
+        try:
+            pending = db.query(Job).filter(
+                Job.status.in_([self.QUEUED, self.RUNNING])
+            ).order_by(Job.created_at).all()
+            job_ids = []
+            for job in pending:
+                job.status = self.QUEUED
+                job.started_at = None
+                job_ids.append(job.id)
+            db.commit()
+            return job_ids
+        finally:
+            db.close()
+
+    def _create(
+        self,
+        job_type: str,
+        params: Dict[str, Any],
+        project_id: Optional[str],
+        payload: Optional[str]
+    ) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            job = Job(
+                id=str(uuid.uuid4()),
+                type=job_type,
+                project_id=project_id,
+                status=self.QUEUED,
+                progress=0,
+                params_json=json.dumps(params, ensure_ascii=False),
+                payload=payload,
+                created_at=datetime.utcnow()
+            )
+            db.add(job)
+            db.commit()
+            return self._snapshot(job)
+        finally:
+            db.close()
+
+    def _read(self, job_id: str) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            job = db.query(Job).filter(Job.id == job_id).first()
+            return self._snapshot(job) if job else None
+        finally:
+            db.close()
+
+    def _write(self, job_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            job = db.query(Job).filter(Job.id == job_id).first()
+            if job is None:
+                return None
+            for name, value in fields.items():
+                setattr(job, name, value)
+            db.commit()
+            return self._snapshot(job)
+        finally:
+            db.close()
+
+    def _load_params(self, job_id: str) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            job = db.query(Job).filter(Job.id == job_id).first()
+            params = json.loads(job.params_json)
+            if job.payload is not None:
+                params["payload"] = job.payload
+            return params
+        finally:
+            db.close()
+
+    @staticmethod
+    def _snapshot(job: Job) -> Dict[str, Any]:
+        return {
+            "job_id": job.id,
+            "type": job.type,
+            "project_id": job.project_id,
+            "status": job.status,
+            "progress": job.progress,
+            "progress_message": job.progress_message,
+            "result": json.loads(job.result_json) if job.result_json else None,
+            "error": job.error,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at
+        }
+
+
+job_queue = JobQueue()
@@ -0,0 +1,165 @@
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+# Висячие запятые перед } и ] - частая ошибка LLM в JSON
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+
+_WHITESPACE = " \t\r\n"
+
+
+def loads_lenient(text: str) -> Any:
+    """json.loads; при ошибке - повтор без висячих запятых"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return json.loads(_TRAILING_COMMA.sub(r'\1', text))
+
+
+class JsonSectionScanner:
+    """
+    Инкрементальный разбор JSON объекта из потокового ответа модели.
+
+    feed() принимает очередной фрагмент текста и возвращает пары
+    (ключ, значение) верхнего уровня, которые закрылись в этом фрагменте.
+    Текст просматривается один раз, с учетом строк и экранирования, так что
+    скобки внутри строк не сбивают счетчик вложенности. Текст до первой {
+    (пояснения, markdown блок) пропускается.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0              # следующий непросмотренный символ буфера
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expecting = None     # key | colon | value | comma - на верхнем уровне объекта
+        self._key: Optional[str] = None
+        self._token_start: Optional[int] = None  # начало ключа или значения верхнего уровня
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        sections = []
+        if self.done:
+            return sections
+
+        self._buffer += chunk
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            char = buffer[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._close_top_level_string(i, sections)
+
+            elif self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+                    self._expecting = "key"
+
+            elif char == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    if self._expecting == "key" or self._expecting == "value":
+                        self._token_start = i
+
+            elif char in "{[":
+                if self._depth == 1 and self._expecting == "value":
+                    self._token_start = i
+                    self._expecting = "comma"
+                self._depth += 1
+
+            elif char in "}]":
+                if self._depth == 1:
+                    # Конец корневого объекта; перед ним может быть число/true/null
+                    self._close_primitive(i, sections)
+                    self._depth = 0
+                    self.done = True
+                    i += 1
+                    break
+                self._depth -= 1
+                if self._depth == 1:
+                    self._emit(self._buffer[self._token_start:i + 1], sections)
+
+            elif self._depth == 1:
+                if char == ":" and self._expecting == "colon":
+                    self._expecting = "value"
+                elif char == ",":
+                    self._close_primitive(i, sections)
+                    self._expecting = "key"
+                elif char not in _WHITESPACE and self._expecting == "value":
+                    # Число, true, false или null
+                    self._token_start = i
+                    self._expecting = "comma"
+
+            i += 1
+
+        self._pos = i
+        self._compact()
+        return sections
+
+    def _close_top_level_string(self, end: int, sections: List[Tuple[str, Any]]):
+        token = self._buffer[self._token_start:end + 1]
+        if self._expecting == "key":
+            self._key = json.loads(token)
+            self._token_start = None
+            self._expecting = "colon"
+        elif self._expecting == "value":
+            self._emit(token, sections)
+
+    def _close_primitive(self, end: int, sections: List[Tuple[str, Any]]):
+        if self._token_start is not None and self._expecting == "comma":
+            self._emit(self._buffer[self._token_start:end].strip(), sections)
+
+    def _emit(self, token: str, sections: List[Tuple[str, Any]]):
+        sections.append((self._key, loads_lenient(token)))
+        self._key = None
+        self._token_start = None
+        self._expecting = "comma"
+
+    def _compact(self):
+        """Отбросить уже разобранный текст, чтобы буфер не рос на весь ответ"""
+        keep = self._token_start if self._token_start is not None else self._pos
+        if keep > 0:
+            self._buffer = self._buffer[keep:]
+            self._pos -= keep
+            if self._token_start is not None:
+                self._token_start = 0
+
+
+def extract_json_object(text: str) -> Optional[str]:
+    """
+    Первый полный JSON объект верхнего уровня в тексте (с учетом строк
+    и экранирования) или None, если объект не закрыт
+    """
+    depth = 0
+    start = -1
+    in_string = False
+    escape = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            if depth:
+                in_string = True
+        elif char == "{":
+            if not depth:
+                start = i
+            depth += 1
+        elif char == "}" and depth:
+            depth -= 1
+            if not depth:
+                return text[start:i + 1]
+    return None
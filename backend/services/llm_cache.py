@@ -0,0 +1,225 @@
+import dataclasses
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+from database import SessionLocal, LLMCacheEntry
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Кэш ответов LLM для идемпотентных вызовов.
+
+    Ключ - SHA-256 от имени модели, промпта и параметров генерации.
+    Первый уровень - LRU в памяти с TTL и ограничением по числу записей и размеру,
+    второй (опционально) - таблица llm_cache в БД, переживает перезапуск.
+
+    Постоянный уровень не работает в event loop: чтение идет в пуле потоков,
+    а записи копятся в буфере и фоновый поток сохраняет их пачкой (и один
+    раз на пачку вытесняет старые записи сверх LLM_CACHE_DB_MAX_ENTRIES).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = None,
+        max_bytes: int = None,
+        ttl: int = None,
+        persistent: bool = None,
+        flush_interval: float = None
+    ):
+        self.max_entries = max_entries if max_entries is not None else settings.LLM_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes if max_bytes is not None else settings.LLM_CACHE_MAX_BYTES
+        self.ttl = ttl if ttl is not None else settings.LLM_CACHE_TTL
+        self.persistent = persistent if persistent is not None else settings.LLM_CACHE_PERSISTENT
+        self.flush_interval = flush_interval if flush_interval is not None else settings.LLM_CACHE_FLUSH_INTERVAL
+
+        # key -> (expires_at, serialized value)
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Еще не записанные в БД значения и фоновый поток, который их пишет
+        self._pending: Dict[str, Tuple[float, str]] = {}
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, generation_config: Any = None) -> str:
+        """Построить ключ кэша из модели, промпта и конфигурации генерации"""
+        if dataclasses.is_dataclass(generation_config):
+            config = dataclasses.asdict(generation_config)
+        else:
+            config = generation_config or {}
+        payload = json.dumps(
+            {"model": model_name, "prompt": prompt, "config": config},
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Получить значение из кэша или None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, raw = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(raw)
+                self._remove(key)
+
+        if self.persistent:
+            with self._lock:
+                pending = self._pending.get(key)
+            if pending is not None and pending[0] + self.ttl > now:
+                raw = pending[1]
+            else:
+                raw = await run_in_threadpool(self._db_get, key, now)
+            if raw is not None:
+                with self._lock:
+                    self.persistent_hits += 1
+                    self._put(key, raw, now)
+                return json.loads(raw)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any):
+        """Сохранить значение (должно сериализоваться в JSON)"""
+        raw = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._put(key, raw, now)
+            if self.persistent:
+                self._pending[key] = (now, raw)
+                if self._writer is None or not self._writer.is_alive():
+                    self._writer = threading.Thread(target=self._write_loop, name="llm-cache-writer", daemon=True)
+                    self._writer.start()
+
+    def flush(self):
+        """Записать накопленные значения в БД одной транзакцией"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if pending:
+                self._db_set(pending)
+
+    def stop(self):
+        """Остановить фоновую запись и дописать буфер (при остановке приложения)"""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._wakeup.set()
+            writer.join()
+            self._wakeup.clear()
+        self.flush()
+
+    def _write_loop(self):
+        while True:
+            stopping = self._wakeup.wait(self.flush_interval)
+            self.flush()
+            with self._lock:
+                if stopping or self._writer is not threading.current_thread():
+                    return
+
+    def clear(self):
+        """Очистить кэш в памяти (постоянный уровень не трогаем)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий/промахов и заполненность кэша"""
+        with self._lock:
+            lookups = self.hits + self.persistent_hits + self.misses
+            return {
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.persistent_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "persistent": self.persistent
+            }
+
+    # Внутренние методы (вызываются под self._lock)
+
+    def _put(self, key: str, raw: str, now: float):
+        if key in self._entries:
+            self._remove(key)
+        size = len(raw)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (now + self.ttl, raw)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, raw = self._entries.pop(key)
+        self._bytes -= len(raw)
+
+    # Постоянный уровень
+
+    def _db_get(self, key: str, now: float) -> Optional[str]:
+        db = SessionLocal()
+        try:
+            entry = db.query(LLMCacheEntry).filter(LLMCacheEntry.key == key).first()
+            if entry is None:
+                return None
+            if entry.expires_at <= now:
+                db.delete(entry)
+                db.commit()
+                return None
+            return entry.value
+        except Exception as e:
+            logger.warning(f"LLM cache read failed: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _db_set(self, entries: Dict[str, Tuple[float, str]]):
+        db = SessionLocal()
+        try:
+            for key, (now, raw) in entries.items():
+                db.merge(LLMCacheEntry(key=key, value=raw, created_at=now, expires_at=now + self.ttl))
+            db.commit()
+
+            # Вытесняем самые старые записи сверх лимита
+            total = db.query(LLMCacheEntry).count()
+            overflow = total - settings.LLM_CACHE_DB_MAX_ENTRIES
+            if overflow > 0:
+                oldest = db.query(LLMCacheEntry.key).order_by(LLMCacheEntry.created_at).limit(overflow)
+                db.query(LLMCacheEntry).filter(
+                    LLMCacheEntry.key.in_(oldest.scalar_subquery())
+                ).delete(synchronize_session=False)
+                db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"LLM cache write failed ({len(entries)} entries): {e}")
+        finally:
+            db.close()
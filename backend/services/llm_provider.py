@@ -0,0 +1,445 @@
+import json
+import logging
+import random
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from google.api_core import exceptions as api_exceptions
+
+from config import settings
+from services.llm_cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+# Модель провайдера повторяет интерфейс genai.GenerativeModel, который
+# использует GeminiService: атрибут model_name и
+# generate_content(prompt, generation_config=..., stream=False) -> ответ с .text
+# (при stream=True - итератор фрагментов с .text).
+
+
+class LLMUsage:
+    """usage_metadata в формате новых версий Gemini SDK"""
+
+    def __init__(self, prompt_token_count: int, candidates_token_count: int, cached_content_token_count: int = 0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.cached_content_token_count = cached_content_token_count
+
+
+class LLMResponse:
+    """Ответ или фрагмент потокового ответа"""
+
+    def __init__(self, text: str, usage_metadata: Optional[LLMUsage] = None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class CachedContent:
+    """Закэшированный на стороне провайдера префикс промпта"""
+
+    def __init__(self, name: str, model_name: str, token_count: int, expires_at: float):
+        self.name = name
+        self.model_name = model_name
+        self.token_count = token_count
+        self.expires_at = expires_at
+
+
+class CassetteMissError(LookupError):
+    """В режиме replay для запроса нет записанного ответа"""
+
+
+class LLMProvider:
+    """Источник моделей для GeminiService"""
+
+    name = "base"
+
+    # Кэш контекста (префикса промпта) на стороне провайдера
+    supports_context_cache = False
+
+    def get_model(self, model_name: str):
+        raise NotImplementedError
+
+    def create_cached_content(self, model_name: str, text: str, ttl: int) -> CachedContent:
+        raise NotImplementedError
+
+    def update_cached_content(self, name: str, ttl: int) -> float:
+        """Продлить кэш на ttl секунд; возвращает новый срок истечения"""
+        raise NotImplementedError
+
+    def delete_cached_content(self, name: str):
+        raise NotImplementedError
+
+    def cached_model(self, model_name: str, name: str):
+        """Модель, к промпту которой провайдер сам добавляет закэшированный префикс"""
+        raise NotImplementedError
+
+
+class GeminiProvider(LLMProvider):
+    """Настоящий Gemini API через google.generativeai"""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str = None):
+        import google.generativeai as genai
+
+        api_key = api_key or settings.GEMINI_API_KEY
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY is required. Please set it in .env file")
+
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        # Модуль caching появился в google-generativeai 0.7
+        self._caching = getattr(genai, "caching", None)
+        self.supports_context_cache = self._caching is not None
+
+    def get_model(self, model_name: str):
+        return self._genai.GenerativeModel(model_name)
+
+    def create_cached_content(self, model_name: str, text: str, ttl: int) -> CachedContent:
+        cached = self._caching.CachedContent.create(
+            model=model_name,
+            contents=[text],
+            ttl=timedelta(seconds=ttl)
+        )
+        return CachedContent(
+            cached.name,
+            model_name,
+            cached.usage_metadata.total_token_count,
+            cached.expire_time.timestamp()
+        )
+
+    def update_cached_content(self, name: str, ttl: int) -> float:
+        cached = self._caching.CachedContent.get(name)
+        cached.update(ttl=timedelta(seconds=ttl))
+        return cached.expire_time.timestamp()
+
+    def delete_cached_content(self, name: str):
+        self._caching.CachedContent.get(name).delete()
+
+    def cached_model(self, model_name: str, name: str):
+        return self._genai.GenerativeModel.from_cached_content(
+            cached_content=self._caching.CachedContent.get(name)
+        )
+
+
+# Канонические ответы заглушки - валидны для схем models.py
+
+STUB_DOCUMENT = {
+    "projectName": "CRM для отделений",
+    "description": {"paragraphs": ["CRM для учета клиентов, заявок и звонков в отделениях банка."] * 3},
+    "goals": [{"text": f"Цель {i}: сократить время обработки заявок", "priority": "high"} for i in range(5)],
+    "scope": {"inScope": [f"Функция {i}" for i in range(8)], "outOfScope": [f"Исключение {i}" for i in range(4)]},
+    "businessRules": [
+        {"id": f"BR00{i}", "title": f"Правило {i}", "description": "Заявка должна быть обработана в течение 24 часов", "priority": "medium"}
+        for i in range(1, 7)
+    ],
+    "useCases": [
+        {
+            "id": f"UC00{i}", "title": f"Сценарий {i}", "actor": "Менеджер",
+            "preconditions": ["Пользователь авторизован"],
+            "mainScenario": [f"Шаг {j}: менеджер выполняет действие в системе" for j in range(1, 9)],
+            "postconditions": "Заявка сохранена"
+        }
+        for i in range(1, 6)
+    ],
+    "kpis": [{"name": f"Метрика {i}", "current": 100, "target": 130, "unit": "%"} for i in range(4)],
+}
+
+STUB_VALIDATION = {
+    "qualityScore": {"health": 80, "completeness": 80, "clarity": 80, "detail": 80, "consistency": 80},
+    "issues": [{"text": "Уточнить KPI", "severity": "low", "section": "kpis", "fixable": True}],
+}
+
+STUB_FILE_ANALYSIS = {
+    "projectName": "CRM для отделений",
+    "goals": ["Сократить время обработки заявки на 30%"],
+    "requirements": ["Учет клиентов", "Учет заявок", "Интеграция с телефонией"],
+    "stakeholders": ["Менеджеры отделений", "Руководители отделений"],
+    "description": "CRM для учета клиентов, заявок и звонков в отделениях банка",
+}
+
+STUB_DIAGRAM = """flowchart TD
+
+    start((Начало))
+    A[Создать заявку]
+    B{Данные полные?}
+    C[Обработать заявку]
+    end((Конец))
+
+    start --> A
+    A --> B
+    B -->|Нет| A
+    B -->|Да| C
+    C --> end
+"""
+
+STUB_CHAT = "Понял. Какие цели проекта и кто будет основными пользователями системы?"
+
+STUB_SUMMARY = "- Проект: CRM для отделений\n- Цель: сократить время обработки заявки на 30%"
+
+
+def stub_answer(prompt: str) -> str:
+    """Канонический ответ по виду промпта GeminiService"""
+    if "СЕКЦИЯ:" in prompt:
+        # Ключи секции перечислены в строке формата JSON промпта
+        schema = prompt.split("ФОРМАТ JSON:", 1)[-1].split("ДИАЛОГ С КЛИЕНТОМ:", 1)[0]
+        payload = {key: value for key, value in STUB_DOCUMENT.items() if f'"{key}"' in schema}
+        return json.dumps(payload, ensure_ascii=False)
+    if "НОВЫЕ СООБЩЕНИЯ ДИАЛОГА" in prompt:
+        # Дельта документа: изменилась одна секция
+        return json.dumps({"goals": STUB_DOCUMENT["goals"][:3]}, ensure_ascii=False)
+    if '"qualityScore"' in prompt:
+        return json.dumps(STUB_VALIDATION, ensure_ascii=False)
+    if '"stakeholders"' in prompt:
+        return json.dumps(STUB_FILE_ANALYSIS, ensure_ascii=False)
+    if '"projectName"' in prompt:
+        return json.dumps(STUB_DOCUMENT, ensure_ascii=False)
+    if "mermaid" in prompt.lower() or "bpmn" in prompt.lower():
+        return STUB_DIAGRAM
+    if "ПРОБЛЕМА ДЛЯ ИСПРАВЛЕНИЯ" in prompt:
+        section = prompt.split("ТЕКУЩИЙ ТЕКСТ СЕКЦИИ:", 1)[-1].split("ПРОБЛЕМА ДЛЯ ИСПРАВЛЕНИЯ:", 1)[0]
+        return section.strip() + " Требование уточнено и дополнено измеримыми критериями."
+    if "КРАТКОЕ СОДЕРЖАНИЕ" in prompt and "Обнови" in prompt:
+        return STUB_SUMMARY
+    return STUB_CHAT
+
+
+class StubModel:
+    """
+    Модель-заглушка: канонические ответы с латентностью
+    first_token + токены * per_token (разброс jitter) и долей ошибок error_rate
+    """
+
+    # Фрагмент потокового ответа, в токенах
+    STREAM_CHUNK_TOKENS = 4
+
+    def __init__(self, provider: "StubProvider", model_name: str, cached_content: str = None):
+        self.provider = provider
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        self.cached_content = cached_content
+
+    def generate_content(self, prompt: str, generation_config: Any = None, stream: bool = False, **kwargs):
+        # Как у Gemini: закэшированный префикс входит в prompt_token_count
+        # и отдельно учитывается в cached_content_token_count
+        prefix = self.provider.cached_text(self.cached_content) if self.cached_content else ""
+        text = stub_answer(prefix + prompt)
+        usage = LLMUsage(
+            self.provider.token_count(prefix + prompt),
+            self.provider.token_count(text),
+            self.provider.token_count(prefix)
+        )
+        self.provider.calls += 1
+        if stream:
+            return self._stream(text, usage)
+
+        self.provider.sleep(self.provider.first_token + usage.candidates_token_count * self.provider.per_token)
+        self.provider.maybe_fail()
+        return LLMResponse(text, usage)
+
+    def _stream(self, text: str, usage: LLMUsage) -> Iterator[LLMResponse]:
+        self.provider.sleep(self.provider.first_token)
+        self.provider.maybe_fail()
+        step = self.STREAM_CHUNK_TOKENS * 3
+        for start in range(0, len(text), step):
+            chunk = text[start:start + step]
+            self.provider.sleep(self.provider.token_count(chunk) * self.provider.per_token)
+            # Как у Gemini: расход всего ответа приходит с последним фрагментом
+            last = start + step >= len(text)
+            yield LLMResponse(chunk, usage if last else None)
+
+
+class StubProvider(LLMProvider):
+    """Локальная заглушка для нагрузочных тестов и CI без API ключа"""
+
+    name = "stub"
+
+    # Кэш контекста эмулируется: префикс хранится локально до истечения ttl
+    supports_context_cache = True
+
+    def __init__(
+        self,
+        first_token: float = None,
+        per_token: float = None,
+        jitter: float = None,
+        error_rate: float = None,
+        seed: Optional[int] = None
+    ):
+        self.first_token = first_token if first_token is not None else settings.LLM_STUB_FIRST_TOKEN_LATENCY
+        self.per_token = per_token if per_token is not None else settings.LLM_STUB_TOKEN_LATENCY
+        self.jitter = jitter if jitter is not None else settings.LLM_STUB_JITTER
+        self.error_rate = error_rate if error_rate is not None else settings.LLM_STUB_ERROR_RATE
+        self._random = random.Random(seed if seed is not None else settings.LLM_STUB_SEED)
+        self._lock = threading.Lock()
+        self._cached: Dict[str, List] = {}  # имя -> [текст префикса, срок истечения]
+        self.calls = 0
+
+    def get_model(self, model_name: str) -> StubModel:
+        return StubModel(self, model_name)
+
+    def create_cached_content(self, model_name: str, text: str, ttl: int) -> CachedContent:
+        expires_at = time.time() + ttl
+        with self._lock:
+            name = f"cachedContents/stub-{len(self._cached) + 1}-{self._random.getrandbits(32):08x}"
+            self._cached[name] = [text, expires_at]
+        return CachedContent(name, model_name, self.token_count(text), expires_at)
+
+    def update_cached_content(self, name: str, ttl: int) -> float:
+        with self._lock:
+            entry = self._live_entry(name)
+            entry[1] = time.time() + ttl
+            return entry[1]
+
+    def delete_cached_content(self, name: str):
+        with self._lock:
+            self._live_entry(name)
+            del self._cached[name]
+
+    def cached_model(self, model_name: str, name: str) -> StubModel:
+        with self._lock:
+            self._live_entry(name)
+        return StubModel(self, model_name, cached_content=name)
+
+    def cached_text(self, name: str) -> str:
+        with self._lock:
+            return self._live_entry(name)[0]
+
+    def _live_entry(self, name: str) -> List:
+        entry = self._cached.get(name)
+        if entry is None or entry[1] <= time.time():
+            # Как у Gemini: истекший кэш удаляется, обращение к нему - 404
+            self._cached.pop(name, None)
+            raise api_exceptions.NotFound(f"CachedContent not found: {name}")
+        return entry
+
+    @staticmethod
+    def token_count(text: str) -> int:
+        return len(text) // 3
+
+    def sleep(self, seconds: float):
+        if self.jitter:
+            with self._lock:
+                seconds *= self._random.uniform(1 - self.jitter, 1 + self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def maybe_fail(self):
+        """Смоделировать временную ошибку API (повторяемую, как 503 Gemini)"""
+        if not self.error_rate:
+            return
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+        if failed:
+            raise api_exceptions.ServiceUnavailable("Stub provider: simulated overload")
+
+
+class CassetteStore:
+    """
+    Записанные ответы: один JSON файл на запрос, имя - ключ от модели,
+    промпта и параметров генерации (как у кэша ответов)
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = Path(directory or settings.LLM_CASSETTE_DIR)
+
+    def path(self, model_name: str, prompt: str, generation_config: Any) -> Path:
+        return self.directory / f"{ResponseCache.make_key(model_name, prompt, generation_config)}.json"
+
+    def load(self, model_name: str, prompt: str, generation_config: Any) -> Optional[List[str]]:
+        path = self.path(model_name, prompt, generation_config)
+        if not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))["chunks"]
+
+    def save(self, model_name: str, prompt: str, generation_config: Any, chunks: List[str]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(model_name, prompt, generation_config)
+        record = {"model": model_name, "prompt": prompt, "chunks": chunks}
+        # Запись через временный файл: параллельные запросы не оставят половину JSON
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps(record, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp_path.replace(path)
+
+
+class RecordingModel:
+    """Вызывает настоящую модель и сохраняет успешные ответы в кассеты"""
+
+    def __init__(self, model, store: CassetteStore):
+        self.model = model
+        self.model_name = model.model_name
+        self.store = store
+
+    def generate_content(self, prompt: str, generation_config: Any = None, stream: bool = False, **kwargs):
+        if stream:
+            return self._stream(prompt, generation_config, **kwargs)
+
+        response = self.model.generate_content(prompt, generation_config=generation_config, **kwargs)
+        self.store.save(self.model_name, prompt, generation_config, [response.text])
+        return response
+
+    def _stream(self, prompt: str, generation_config: Any, **kwargs) -> Iterator[Any]:
+        chunks = []
+        for chunk in self.model.generate_content(prompt, generation_config=generation_config, stream=True, **kwargs):
+            chunks.append(chunk.text)
+            yield chunk
+        self.store.save(self.model_name, prompt, generation_config, chunks)
+
+
+class RecordingProvider(LLMProvider):
+    """Режим record: Gemini API + запись ответов"""
+
+    name = "record"
+
+    def __init__(self, inner: LLMProvider, store: CassetteStore = None):
+        self.inner = inner
+        self.store = store or CassetteStore()
+
+    def get_model(self, model_name: str) -> RecordingModel:
+        return RecordingModel(self.inner.get_model(model_name), self.store)
+
+
+class ReplayModel:
+    """Отдает записанные ответы; для незаписанного запроса - CassetteMissError"""
+
+    def __init__(self, model_name: str, store: CassetteStore):
+        self.model_name = f"models/{model_name}"
+        self.store = store
+
+    def generate_content(self, prompt: str, generation_config: Any = None, stream: bool = False, **kwargs):
+        chunks = self.store.load(self.model_name, prompt, generation_config)
+        if chunks is None:
+            raise CassetteMissError(
+                f"No cassette for {self.model_name} request "
+                f"{self.store.path(self.model_name, prompt, generation_config).name}"
+            )
+        if stream:
+            return iter([LLMResponse(chunk) for chunk in chunks])
+        return LLMResponse("".join(chunks))
+
+
+class ReplayProvider(LLMProvider):
+    """Режим replay: только записанные ответы, без сети"""
+
+    name = "replay"
+
+    def __init__(self, store: CassetteStore = None):
+        self.store = store or CassetteStore()
+
+    def get_model(self, model_name: str) -> ReplayModel:
+        return ReplayModel(model_name, self.store)
+
+
+def create_provider(name: str = None) -> LLMProvider:
+    """Провайдер по настройке LLM_PROVIDER: gemini, stub, record или replay"""
+    name = (name or settings.LLM_PROVIDER).lower()
+    if name == "gemini":
+        return GeminiProvider()
+    if name == "stub":
+        return StubProvider()
+    if name == "record":
+        return RecordingProvider(GeminiProvider())
+    if name == "replay":
+        return ReplayProvider()
+    raise ValueError(f"Unknown LLM_PROVIDER: {name}")
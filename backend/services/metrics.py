@@ -0,0 +1,301 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+from starlette.routing import Match
+
+# Метрики в формате Prometheus (text exposition 0.0.4) без внешних зависимостей.
+# На горячем пути - поиск дочерней метрики по кортежу меток в dict
+# и короткая блокировка на инкремент; текст собирается только при запросе /metrics.
+
+# Секунды: от быстрых эндпоинтов (мс) до генерации документа (десятки секунд)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """Все метрики процесса; render() - текст для /metrics"""
+
+    def __init__(self):
+        self._metrics: List["_Metric"] = []
+
+    def register(self, metric: "_Metric"):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def labels(self, *values: str):
+        """Метрика для конкретного набора значений меток"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in list(self._children.items())
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # Последняя ячейка - значения больше верхней границы (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def samples(self) -> List[str]:
+        lines = []
+        bucket_labels = self.labelnames + ("le",)
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts = list(child.counts)
+                total_sum = child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(bucket_labels, values + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+# HTTP
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template and status",
+    ["method", "route", "status"]
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template (streaming: until the last byte)",
+    ["method", "route"]
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being processed",
+    ["method", "route"]
+)
+
+# LLM
+
+LLM_CALL_DURATION = Histogram(
+    "llm_call_duration_seconds", "Latency of a single LLM API attempt by model and operation",
+    ["model", "operation"]
+)
+LLM_CALLS = Counter(
+    "llm_calls_total", "LLM API attempts by model, operation and outcome (success, error)",
+    ["model", "operation", "outcome"]
+)
+LLM_RETRIES = Counter(
+    "llm_retries_total", "LLM API retries after a transient error",
+    ["model", "operation"]
+)
+LLM_FAILURES = Counter(
+    "llm_failures_total", "LLM calls that failed after retries, by error type",
+    ["model", "operation", "error"]
+)
+LLM_FALLBACKS = Counter(
+    "llm_fallbacks_total", "Responses replaced by a fallback (kind: document, section, document_delta, validation, diagram, file_analysis, file_analysis_chunk)",
+    ["kind", "reason"]
+)
+LLM_ROUTES = Counter(
+    "llm_route_decisions_total", "Model routing decisions by operation, chosen model and reason (operation, small_input, large_input, latency_budget)",
+    ["operation", "model", "reason"]
+)
+LLM_HEDGES = Counter(
+    "llm_hedges_total", "Hedged LLM calls: started, primary_won, hedge_won, failed",
+    ["operation", "outcome"]
+)
+LLM_CONTEXT_CACHE = Counter(
+    "llm_context_cache_total", "Provider-side context cache events: hit, create, extend, expire, evict, skip, not_found, error",
+    ["model", "event"]
+)
+LLM_STRUCTURED_OUTPUT = Counter(
+    "llm_structured_output_total", "Structured (JSON) LLM responses by parse outcome: direct, repaired, invalid_json, schema_mismatch",
+    ["operation", "outcome"]
+)
+
+# Files
+
+FILE_EXTRACTION_DURATION = Histogram(
+    "file_extraction_duration_seconds", "Text extraction time by file type and size bucket",
+    ["file_type", "size"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+FILE_EXTRACTION_POOL_EVENTS = Counter(
+    "file_extraction_pool_events_total", "Extraction pool events: timeout, crash, restart, resubmit, pdf_split",
+    ["event"]
+)
+
+FILE_CACHE = Counter(
+    "file_cache_total", "Content-hash file cache lookups and writes: hit (text and analysis), text_hit, miss, store, evict",
+    ["event"]
+)
+
+_SIZE_BUCKETS = ((100 * 1024, "lt_100kb"), (1024 * 1024, "100kb_1mb"), (5 * 1024 * 1024, "1mb_5mb"))
+
+
+def size_bucket(size: int) -> str:
+    """Метка размера файла для гистограмм (ограниченное число значений)"""
+    for limit, label in _SIZE_BUCKETS:
+        if size < limit:
+            return label
+    return "gte_5mb"
+
+
+def model_label(model) -> str:
+    """Имя модели без префикса models/"""
+    return model.model_name.split("/")[-1]
+
+
+def fallback_reason(error: Exception) -> str:
+    """
+    Причина fallback: ответ модели не разобрался как JSON, не прошел схему
+    (ошибка с атрибутом metric_reason) или любая другая ошибка
+    """
+    if isinstance(error, json.JSONDecodeError):
+        return "invalid_json"
+    return getattr(error, "metric_reason", None) or "error"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: латентность, число и активные HTTP запросы по шаблону
+    маршрута (/api/projects/{project_id}), чтобы id не раздували число меток
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self._route(scope)
+        in_flight = HTTP_IN_FLIGHT.labels(method, route)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            HTTP_REQUEST_DURATION.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+
+    @staticmethod
+    def _route(scope) -> str:
+        app = scope.get("app")
+        for route in getattr(app, "routes", ()):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
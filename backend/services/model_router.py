@@ -0,0 +1,181 @@
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from config import settings
+from services.context_builder import estimate_tokens
+from services.metrics import LLM_ROUTES, model_label
+
+# Замеров латентности в окне на пару (модель, операция)
+_WINDOW = 200
+
+_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+
+@contextmanager
+def latency_budget(seconds: float, started: Optional[float] = None) -> Iterator[None]:
+    """
+    Вызовы LLM внутри блока должны уложиться в seconds от started
+    (time.monotonic() начала запроса; по умолчанию - вход в блок), так что
+    время предыдущих шагов, например извлечения текста, тоже считается
+    """
+    deadline = (started if started is not None else time.monotonic()) + seconds
+    outer = _deadline.get()
+    token = _deadline.set(min(deadline, outer) if outer is not None else deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+class LatencyWindow:
+    """Последние замеры латентности и перцентили по ним"""
+
+    def __init__(self, size: int = _WINDOW):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class ModelRouter:
+    """
+    Выбор модели для вызова: Flash (быстрая, дешевая) или Pro (качественнее,
+    в ~4 раза дороже и медленнее).
+
+    Вызывающий код указывает предпочтительную модель; роутер:
+    - переводит на Pro операции из LLM_ROUTER_PRO_OPERATIONS;
+    - оставляет на Flash короткий вход (Pro не нужна) и очень длинный
+      (Pro дорога и не уложится в бюджет);
+    - переводит на Flash, если медиана латентности Pro для операции больше
+      оставшегося бюджета (latency_budget или LLM_ROUTER_LATENCY_BUDGETS).
+
+    Для вызовов Pro роутер задает задержку хеджирования: если ответа нет
+    дольше перцентиля LLM_HEDGE_PERCENTILE, тот же запрос параллельно
+    отправляется во Flash и используется первый успешный ответ.
+    """
+
+    def __init__(self, fast: Any, strong: Any):
+        self.fast = fast
+        self.strong = strong
+        self.pro_operations = set(settings.LLM_ROUTER_PRO_OPERATIONS)
+        self.pro_min_tokens = settings.LLM_ROUTER_PRO_MIN_INPUT_TOKENS
+        self.pro_max_tokens = settings.LLM_ROUTER_PRO_MAX_INPUT_TOKENS
+        self.budgets = dict(settings.LLM_ROUTER_LATENCY_BUDGETS)
+        self.default_budget = float(settings.GEMINI_TIMEOUT)
+        self.min_samples = settings.LLM_ROUTER_MIN_SAMPLES
+        self.hedge_enabled = settings.LLM_HEDGE_ENABLED
+        self.hedge_percentile = settings.LLM_HEDGE_PERCENTILE
+        self.hedge_default_delay = settings.LLM_HEDGE_DEFAULT_DELAY
+
+        self._latency: Dict[Tuple[str, str], LatencyWindow] = {}
+        self._decisions: Dict[Tuple[str, str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def route(self, preferred: Any, operation: str, prompt: str) -> Any:
+        """Модель для вызова operation с промптом prompt"""
+        model, reason = self._choose(preferred, operation, prompt)
+        LLM_ROUTES.labels(operation, model_label(model), reason).inc()
+        with self._lock:
+            key = (operation, model_label(model), reason)
+            self._decisions[key] = self._decisions.get(key, 0) + 1
+        return model
+
+    def _choose(self, preferred: Any, operation: str, prompt: str) -> Tuple[Any, str]:
+        if operation in self.pro_operations:
+            preferred = self.strong
+        if preferred is not self.strong:
+            return self.fast, "operation"
+
+        tokens = estimate_tokens(prompt)
+        if tokens < self.pro_min_tokens:
+            return self.fast, "small_input"
+        if tokens > self.pro_max_tokens:
+            return self.fast, "large_input"
+
+        expected = self.expected_latency(self.strong, operation)
+        if expected is not None and expected > self.remaining_budget(operation):
+            return self.fast, "latency_budget"
+        return self.strong, "operation"
+
+    def remaining_budget(self, operation: str) -> float:
+        """Сколько секунд осталось у вызова: бюджет операции или latency_budget"""
+        budget = self.budgets.get(operation, self.default_budget)
+        deadline = _deadline.get()
+        if deadline is not None:
+            budget = min(budget, deadline - time.monotonic())
+        return max(0.0, budget)
+
+    def expected_latency(self, model: Any, operation: str, q: float = 0.5) -> Optional[float]:
+        """Перцентиль латентности модели на операции или None, если замеров мало"""
+        with self._lock:
+            window = self._latency.get((model_label(model), operation))
+            if window is None or len(window) < self.min_samples:
+                return None
+            return window.percentile(q)
+
+    def observe(self, model: Any, operation: str, seconds: float):
+        """Учесть латентность успешного вызова"""
+        with self._lock:
+            key = (model_label(model), operation)
+            window = self._latency.get(key)
+            if window is None:
+                window = self._latency[key] = LatencyWindow()
+            window.add(seconds)
+
+    def hedge_delay(self, model: Any, operation: str) -> Optional[float]:
+        """
+        Через сколько секунд продублировать вызов во Flash; None - без хеджирования
+        (вызов и так идет во Flash или бюджет уже исчерпан)
+        """
+        if not self.hedge_enabled or model is not self.strong or self.fast is self.strong:
+            return None
+        remaining = self.remaining_budget(operation)
+        if remaining <= 0:
+            # Бюджет исчерпан (система перегружена) - дубль сразу удвоил бы
+            # стоимость каждого вызова Pro, а быстрее не ответит и он
+            return None
+        delay = self.expected_latency(model, operation, self.hedge_percentile)
+        if delay is None:
+            delay = self.hedge_default_delay
+        # Ответ Pro позже бюджета не нужен - дублируем не позже его исчерпания
+        return min(delay, remaining)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latency: List[Dict[str, Any]] = [
+                {
+                    "model": model,
+                    "operation": operation,
+                    "samples": len(window),
+                    "p50": window.percentile(0.5),
+                    "p90": window.percentile(0.9),
+                }
+                for (model, operation), window in sorted(self._latency.items())
+            ]
+            decisions = [
+                {"operation": operation, "model": model, "reason": reason, "count": count}
+                for (operation, model, reason), count in sorted(self._decisions.items())
+            ]
+        return {
+            "fast": model_label(self.fast),
+            "strong": model_label(self.strong),
+            "pro_operations": sorted(self.pro_operations),
+            "hedge_enabled": self.hedge_enabled,
+            "hedge_percentile": self.hedge_percentile,
+            "latency": latency,
+            "decisions": decisions,
+        }
@@ -0,0 +1,466 @@
+from typing import Dict, List, Tuple
+
+# Промпты GeminiService. Статическая часть (роль, правила, формат ответа)
+# собирается один раз при импорте и идет первой, переменная (диалог,
+# документ, текст файла) - в конце: одинаковый префикс у всех вызовов
+# можно закэшировать на стороне провайдера (см. ContextCache).
+
+
+class PromptTemplate:
+    """Промпт из готового статического префикса и шаблона переменной части"""
+
+    def __init__(self, name: str, prefix: str, body: str):
+        self.name = name
+        self.prefix = prefix.strip() + "\n\n"
+        self.body = body.strip() + "\n"
+
+    def render(self, **values) -> str:
+        return self.prefix + self.body.format(**values)
+
+
+PROMPTS: Dict[str, PromptTemplate] = {}
+
+
+def register(template: PromptTemplate) -> PromptTemplate:
+    PROMPTS[template.name] = template
+    return template
+
+
+def get_prompt(name: str) -> PromptTemplate:
+    return PROMPTS[name]
+
+
+def file_context(text: str) -> str:
+    """Блок с текстом загруженного файла - общий префикс всех запросов по этому файлу"""
+    return f"ТЕКСТ ДОКУМЕНТА:\n{text}\n\n"
+
+
+# Чат
+
+register(PromptTemplate(
+    "chat",
+    """
+Ты - AI Business Analyst для банка ForteBank в Казахстане.
+Твоя задача - собирать бизнес-требования через профессиональный диалог.
+
+ВАЖНО:
+- Задавай уточняющие вопросы только если информация отсутствует
+- НЕ задавай повторно вопросы на которые пользователь уже ответил
+- Анализируй всю историю диалога перед ответом
+- После сбора основной информации (цели, пользователи, функции) переходи к деталям
+- Будь профессионален, но дружелюбен
+- Отвечай на русском языке
+
+ТВОЯ РОЛЬ:
+- Задавай уточняющие вопросы о целях проекта
+- Выясняй стейкхолдеров и их потребности
+- Собирай функциональные и нефункциональные требования
+- Определяй ограничения и риски
+- Помогай структурировать требования
+
+СТИЛЬ ОБЩЕНИЯ:
+- Используй банковскую терминологию корректно
+- Структурируй вопросы логично
+- Не задавай более 2-3 вопросов за раз
+- Подтверждай понимание важных моментов
+- Избегай повторения вопросов
+
+ФОКУС НА:
+- Бизнес-цели и KPI
+- Пользовательские сценарии
+- Интеграции и техническая архитектура
+- Сроки и ресурсы
+- Соответствие регулятивным требованиям
+""",
+    """
+{history}Клиент: {message}
+Аналитик:
+"""
+))
+
+register(PromptTemplate(
+    "summary",
+    """
+Ты ведешь протокол переговоров бизнес-аналитика с клиентом.
+Обнови краткое содержание беседы, добавив в него новые сообщения.
+
+ПРАВИЛА:
+- Сохрани ВСЕ факты: название проекта, цели, цифры, KPI, пользователей, функции, ограничения, сроки, интеграции
+- Сохрани решения и ответы клиента на уточняющие вопросы
+- Не добавляй ничего, чего не было в беседе
+- Пиши сжато, списком, на русском языке
+""",
+    """
+ТЕКУЩЕЕ КРАТКОЕ СОДЕРЖАНИЕ:
+{previous}
+
+НОВЫЕ СООБЩЕНИЯ:
+{messages}
+
+Верни ТОЛЬКО обновленное краткое содержание.
+"""
+))
+
+# Документ требований
+
+register(PromptTemplate(
+    "document",
+    """
+Ты - эксперт по написанию бизнес-требований. На основе диалога с клиентом создай ДЕТАЛЬНЫЙ документ.
+
+КРИТИЧЕСКИ ВАЖНО:
+1. Если клиент назвал проект (например "Project Alpha", "CRM для банка", "Мобильное приложение доставки") - используй ТОЧНОЕ название в projectName
+2. Если клиент указал конкретные цели (например "Увеличить вовлеченность на 20%", "Автоматизировать процесс") - используй ИХ ТОЧНЫЕ формулировки в goals
+3. Если клиент описал функции - перенеси их в useCases с деталями
+4. НЕ используй общие фразы типа "Определить цели проекта" или "Требует уточнения" - ТОЛЬКО конкретика из диалога
+
+СТРУКТУРА JSON:
+{
+  "projectName": "ТОЧНОЕ название из диалога (не 'Новый проект'!)",
+  "description": {"paragraphs": ["конкретное описание из диалога", "детали проекта", "контекст и цели"]},
+  "goals": [{"text": "КОНКРЕТНАЯ цель из диалога (не заглушка!)", "priority": "high|medium|low"}],
+  "scope": {"inScope": ["конкретные функции из диалога"], "outOfScope": ["что точно не входит"]},
+  "businessRules": [{"id": "BR001", "title": "название", "description": "конкретное правило", "priority": "high|medium|low"}],
+  "useCases": [{"id": "UC001", "title": "конкретный сценарий", "actor": "роль пользователя", "preconditions": ["что должно быть"], "mainScenario": ["шаг 1: детально", "шаг 2: детально", "шаг 3: детально"], "postconditions": "результат"}],
+  "kpis": [{"name": "измеримая метрика", "current": текущее_число, "target": целевое_число, "unit": "единица измерения"}]
+}
+
+ПРАВИЛА ЗАПОЛНЕНИЯ:
+- projectName: Если клиент сказал "хочу создать CRM" -> "CRM система", если "Project Alpha" -> "Project Alpha"
+- goals: Если клиент сказал "увеличить продажи на 30%" -> {"text": "Увеличить продажи на 30%", "priority": "high"}
+- useCases: Минимум 3-5 детальных сценариев с 5-10 шагами каждый
+- kpis: Реальные числа если упомянуты ("рост на 20%" -> current: 100, target: 120)
+
+ЗАПРЕЩЕНО использовать:
+❌ "Определить цели проекта"
+❌ "Новый проект"
+❌ "Требует уточнения"
+❌ "Будет определено позже"
+❌ Любые заглушки
+""",
+    """
+ДИАЛОГ С КЛИЕНТОМ:
+{chat_text}
+
+Верни ТОЛЬКО валидный JSON без markdown блоков.
+"""
+))
+
+# Секции документа для параллельной генерации: ключи JSON, что описать, формат
+DOCUMENT_SECTIONS: Dict[str, Tuple[List[str], str, str]] = {
+    "description": (
+        ["projectName", "description"],
+        "Название проекта и описание: что делается, для кого, зачем, контекст.",
+        '''{"projectName": "ТОЧНОЕ название из диалога", "description": {"paragraphs": ["описание", "детали проекта", "контекст и цели"]}}'''
+    ),
+    "goals": (
+        ["goals"],
+        "Цели проекта с приоритетами. Используй ТОЧНЫЕ формулировки клиента.",
+        '''{"goals": [{"text": "конкретная цель", "priority": "high|medium|low"}]}'''
+    ),
+    "scope": (
+        ["scope"],
+        "Границы проекта: что входит и что точно не входит.",
+        '''{"scope": {"inScope": ["конкретные функции"], "outOfScope": ["что не входит"]}}'''
+    ),
+    "businessRules": (
+        ["businessRules"],
+        "Бизнес-правила: ограничения, политики, регулятивные требования.",
+        '''{"businessRules": [{"id": "BR001", "title": "название", "description": "конкретное правило", "priority": "high|medium|low"}]}'''
+    ),
+    "useCases": (
+        ["useCases"],
+        "Минимум 3-5 детальных сценариев использования с 5-10 шагами каждый.",
+        '''{"useCases": [{"id": "UC001", "title": "сценарий", "actor": "роль", "preconditions": ["что должно быть"], "mainScenario": ["шаг 1", "шаг 2"], "postconditions": "результат"}]}'''
+    ),
+    "kpis": (
+        ["kpis"],
+        "Измеримые KPI. Реальные числа, если упомянуты (\"рост на 20%\" -> current: 100, target: 120).",
+        '''{"kpis": [{"name": "метрика", "current": число, "target": число, "unit": "единица"}]}'''
+    ),
+}
+
+for _name, (_keys, _instructions, _schema) in DOCUMENT_SECTIONS.items():
+    register(PromptTemplate(
+        f"document_section:{_name}",
+        f"""
+Ты - эксперт по написанию бизнес-требований. На основе диалога с клиентом заполни ОДНУ секцию документа.
+
+СЕКЦИЯ: {_name}
+{_instructions}
+
+ФОРМАТ JSON:
+{_schema}
+
+НЕ используй заглушки ("Требует уточнения", "Будет определено позже") - ТОЛЬКО конкретика из диалога.
+""",
+        """
+ДИАЛОГ С КЛИЕНТОМ:
+{chat_text}
+
+Верни ТОЛЬКО валидный JSON без markdown блоков.
+"""
+    ))
+
+register(PromptTemplate(
+    "document_delta",
+    """
+Ты - эксперт по написанию бизнес-требований. Документ уже составлен по предыдущей части диалога с клиентом.
+Обнови его с учетом НОВЫХ сообщений.
+
+ПРАВИЛА:
+1. Верни JSON только с теми секциями верхнего уровня (projectName, description, goals, scope, businessRules, useCases, kpis), которые нужно изменить
+2. Каждую измененную секцию возвращай ЦЕЛИКОМ, сохранив неизмененные элементы и их id
+3. Если новые сообщения не меняют документ - верни {}
+4. НЕ используй заглушки ("Требует уточнения", "Будет определено позже") - ТОЛЬКО конкретика из диалога
+""",
+    """
+ТЕКУЩИЙ ДОКУМЕНТ:
+{document}
+
+НОВЫЕ СООБЩЕНИЯ ДИАЛОГА:
+{messages}
+
+Верни ТОЛЬКО валидный JSON без markdown блоков.
+"""
+))
+
+register(PromptTemplate(
+    "validation",
+    """
+Проанализируй документ бизнес-требований и оцени качество по 4 критериям (0-100%):
+
+1. ПОЛНОТА (completeness): все ли секции заполнены, достаточно ли информации
+2. ЯСНОСТЬ (clarity): понятность формулировок, отсутствие двусмысленности
+3. ДЕТАЛИЗАЦИЯ (detail): достаточно ли деталей для реализации
+4. СОГЛАСОВАННОСТЬ (consistency): нет ли противоречий между секциями
+
+Также найди конкретные проблемы с указанием секции и возможности исправления.
+
+ФОРМАТ ОТВЕТА JSON:
+{
+  "qualityScore": {
+    "health": число_от_0_до_100,
+    "completeness": число_от_0_до_100,
+    "clarity": число_от_0_до_100,
+    "detail": число_от_0_до_100,
+    "consistency": число_от_0_до_100
+  },
+  "issues": [
+    {
+      "text": "описание проблемы",
+      "severity": "high|medium|low",
+      "section": "ключ секции: projectName|description|goals|scope|businessRules|useCases|kpis",
+      "fixable": true/false
+    }
+  ]
+}
+
+health = среднее арифметическое остальных 4 метрик.
+""",
+    """
+{content}
+
+Верни ТОЛЬКО JSON.
+"""
+))
+
+# Файлы: текст файла (file_context) идет перед этими инструкциями
+
+register(PromptTemplate(
+    "file_analysis",
+    """
+Проанализируй этот документ и извлеки структурированную информацию:
+
+1. Название проекта
+2. Цели проекта (массив строк)
+3. Бизнес-требования (массив строк)
+4. Стейкхолдеры (массив строк)
+5. Описание функционала
+
+ФОРМАТ ОТВЕТА JSON:
+{
+  "projectName": "название или 'Неизвестный проект'",
+  "goals": ["цель 1", "цель 2"],
+  "requirements": ["требование 1", "требование 2"],
+  "stakeholders": ["стейкхолдер 1", "стейкхолдер 2"],
+  "description": "краткое описание функционала"
+}
+""",
+    """
+Если информации недостаточно - используй разумные предположения.
+Верни ТОЛЬКО JSON.
+"""
+))
+
+# Длинный файл анализируется по чанкам: статические инструкции - префикс, фрагмент - в конце
+
+register(PromptTemplate(
+    "file_analysis_chunk",
+    """
+Это фрагмент длинного документа с требованиями. Извлеки из ФРАГМЕНТА
+всю структурированную информацию, которая в нем есть:
+
+1. Название проекта - только если оно явно указано во фрагменте, иначе пустая строка
+2. Цели проекта (массив строк)
+3. Бизнес-требования - все, что есть во фрагменте, без обобщения (массив строк)
+4. Стейкхолдеры (массив строк)
+5. Описание функционала, о котором идет речь во фрагменте
+
+Не додумывай то, чего нет во фрагменте: пустой массив - допустимый ответ.
+
+ФОРМАТ ОТВЕТА JSON:
+{
+  "projectName": "название или пустая строка",
+  "goals": ["цель 1", "цель 2"],
+  "requirements": ["требование 1", "требование 2"],
+  "stakeholders": ["стейкхолдер 1", "стейкхолдер 2"],
+  "description": "краткое описание функционала"
+}
+""",
+    """
+ФРАГМЕНТ {index} ИЗ {total}:
+{text}
+
+Верни ТОЛЬКО JSON.
+"""
+))
+
+# Улучшение секции документа
+
+register(PromptTemplate(
+    "improve_section",
+    """
+Улучши секцию документа бизнес-требований, устранив указанную проблему.
+
+ТРЕБОВАНИЯ К УЛУЧШЕНИЮ:
+- Сохрани смысл и структуру
+- Сделай текст более ясным и детальным
+- Устрани указанную проблему
+- Используй профессиональную терминологию
+- Добавь конкретные детали если нужно
+""",
+    """
+ТЕКУЩИЙ ТЕКСТ СЕКЦИИ:
+{section_text}
+
+ПРОБЛЕМА ДЛЯ ИСПРАВЛЕНИЯ:
+{issue_description}
+
+Верни ТОЛЬКО улучшенный текст, без пояснений и комментариев.
+"""
+))
+
+# Диаграммы Mermaid: правила типа диаграммы - префикс, описание процесса - в конце
+
+DIAGRAMS: Dict[str, Tuple[str, str]] = {
+    "flowchart": (
+        """
+Создай Mermaid flowchart диаграмму для процесса, описанного в конце.
+
+КРИТИЧЕСКИ ВАЖНО! Mermaid 10.9.5 требует СТРОГИЙ порядок:
+
+ТЫ ОБЯЗАН генерировать код СТРОГО В ЭТОМ ПОРЯДКЕ (иначе парсер упадёт):
+
+1. flowchart TD
+2. Пустая строка
+3. ВСЕ узлы подряд (включая start и end)
+4. Пустая строка
+5. ВСЕ стрелки
+
+ПРАВИЛЬНЫЙ ПРИМЕР (копируй этот стиль):
+flowchart TD
+
+    start((Начало))
+    A[Открыть приложение]
+    B[Просмотреть рестораны]
+    C[Выбрать ресторан]
+    D[Изучить меню]
+    E[Добавить в корзину]
+    F{Готов оформить?}
+    G[Подтвердить заказ]
+    H[Оплата и обработка]
+    I[Отслеживание доставки]
+    end((Конец))
+
+    start --> A
+    A --> B
+    B --> C
+    C --> D
+    D --> E
+    E --> F
+    F -->|Нет| E
+    F -->|Да| G
+    G --> H
+    H --> I
+    I --> end
+
+Создай 8–12 узлов. Используй кириллицу.
+""",
+        "Верни ТОЛЬКО код, без ```mermaid, без пояснений, без комментариев %%.",
+    ),
+    "sequenceDiagram": (
+        """
+Создай Mermaid sequenceDiagram для сценария, описанного в конце.
+
+Используй русские названия участников и сообщений.
+""",
+        'Верни ТОЛЬКО код, начиная со строки "sequenceDiagram", без ``` и пояснений.',
+    ),
+    "journey": (
+        """
+Создай user journey диаграмму в Mermaid для процесса, описанного в конце.
+
+Покажи этапы, действия пользователя, эмоции и точки контакта.
+""",
+        'Верни ТОЛЬКО код, начиная со строки "journey", без ``` и пояснений.',
+    ),
+    "erDiagram": (
+        """
+Создай ER-диаграмму в Mermaid для системы, описанной в конце.
+
+Определи сущности, атрибуты (PK, FK), связи (||--o,|--|| и т.д.).
+Используй русские названия сущностей и полей.
+""",
+        'Верни ТОЛЬКО код, начиная со строки "erDiagram", без ``` и пояснений.',
+    ),
+    "bpmn": (
+        """
+Создай BPMN 2.0 диаграмму в синтаксисе Mermaid для процесса, описанного в конце.
+
+ПРАВИЛА:
+- Начинай строго со строки: bpmnDiagram
+- Используй только поддерживаемые элементы:
+  StartEvent, EndEvent, Task, UserTask, ServiceTask, ExclusiveGateway, ParallelGateway, SequenceFlow, MessageFlow
+- Русский текст внутри названий задач и шлюзов
+- Участники через participant (если нужно)
+- Никаких --> стрелок — только SequenceFlow
+
+Пример:
+bpmnDiagram
+    startEvent "Начало" as start
+    task "Открыть приложение" as task1
+    userTask "Выбрать блюда" as task2
+    exclusiveGateway "Готов оплатить?" as gw1
+    serviceTask "Обработка платежа" as task3
+    endEvent "Заказ принят" as end
+
+    start --> task1
+    task1 --> task2
+    task2 --> gw1
+    gw1 -->|Да| task3
+    gw1 -->|Нет| task2
+    task3 --> end
+
+Создай полную диаграмму с 8–15 элементами.
+""",
+        "Верни ТОЛЬКО чистый код BPMN, без ```bpmn, без пояснений.",
+    ),
+}
+
+for _name, (_rules, _answer) in DIAGRAMS.items():
+    register(PromptTemplate(
+        f"diagram:{_name}",
+        _rules,
+        "ОПИСАНИЕ:\n{description}\n\n" + _answer
+    ))
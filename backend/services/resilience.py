@@ -0,0 +1,172 @@
+import asyncio
+import random
+import re
+import time
+from typing import Any, Dict, Optional
+
+from google.api_core import exceptions as api_exceptions
+
+# Ошибки, которые имеет смысл повторять: перегрузка, таймауты, 5xx
+RETRYABLE_ERRORS = (
+    api_exceptions.ResourceExhausted,
+    api_exceptions.TooManyRequests,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    api_exceptions.GatewayTimeout,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.Aborted,
+    api_exceptions.Unknown,
+    ConnectionError,
+    TimeoutError,
+)
+
+_RETRY_IN_PATTERN = re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE)
+
+
+class CircuitOpenError(Exception):
+    """Circuit breaker разомкнут - вызов отклонен без обращения к API"""
+
+
+def is_retryable(exc: Exception) -> bool:
+    """Можно ли повторить вызов после этой ошибки"""
+    return isinstance(exc, RETRYABLE_ERRORS)
+
+
+def retry_delay_hint(exc: Exception) -> Optional[float]:
+    """
+    Задержка, которую просит сервер: RetryInfo в деталях gRPC ошибки,
+    заголовок Retry-After REST ответа или "retry in Ns" в тексте ошибки.
+    """
+    for detail in getattr(exc, "details", None) or []:
+        retry_delay = getattr(detail, "retry_delay", None)
+        if retry_delay is not None:
+            return retry_delay.seconds + retry_delay.nanos / 1e9
+
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        retry_after = headers.get("Retry-After")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+
+    match = _RETRY_IN_PATTERN.search(str(exc))
+    if match:
+        return float(match.group(1))
+
+    return None
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Экспоненциальная задержка с полным jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """Ограничение частоты исходящих запросов: capacity запросов за window секунд"""
+
+    def __init__(self, capacity: int, window: float):
+        self.capacity = capacity
+        self.rate = capacity / window
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Дождаться свободного токена"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "capacity": self.capacity,
+            "rate_per_second": round(self.rate, 4),
+            "available": round(self._tokens, 2)
+        }
+
+
+class CircuitBreaker:
+    """
+    closed - вызовы проходят; после failure_threshold ошибок подряд -> open.
+    open - вызовы сразу отклоняются; через recovery_timeout -> half_open.
+    half_open - пропускается один пробный вызов: успех -> closed, ошибка -> open.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.rejected = 0
+        self._probe_in_flight = False
+
+    def before_call(self) -> bool:
+        """
+        Проверить, можно ли выполнять вызов; иначе CircuitOpenError.
+        True - вызов пробный (half_open): его исход нужно записать или,
+        если вызов отменен, вернуть пробу через release_probe
+        """
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(f"Gemini circuit for {self.name} is open")
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(f"Gemini circuit for {self.name} is probing recovery")
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release_probe(self):
+        """Пробный вызов отменен без ответа API - следующий вызов снова будет пробным"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        retry_in = None
+        if self.state == self.OPEN:
+            retry_in = max(0.0, round(self.recovery_timeout - (time.monotonic() - self.opened_at), 2))
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "recovery_timeout": self.recovery_timeout,
+            "rejected": self.rejected,
+            "probe_in": retry_in
+        }
@@ -0,0 +1,39 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных вызовов.
+
+    Пока вызов с ключом выполняется, остальные вызовы с тем же ключом ждут
+    его результат (или ошибку) вместо собственного запроса. Сам вызов
+    выполняется отдельной задачей, поэтому отмена одного из ожидающих
+    (например, клиент закрыл соединение) не отменяет его для остальных.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.calls = 0
+        self.collapsed = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполнить func() или присоединиться к уже идущему вызову с тем же ключом"""
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.collapsed += 1
+        else:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        """Сколько вызовов было объединено"""
+        return {
+            "calls": self.calls,
+            "collapsed": self.collapsed,
+            "executed": self.calls - self.collapsed,
+            "in_flight": len(self._inflight)
+        }
@@ -0,0 +1,136 @@
+import inspect
+import json
+import logging
+from typing import Any, Dict, Iterable, Type
+
+import google.generativeai as genai
+from pydantic import BaseModel, Field, ValidationError, create_model
+
+from services.metrics import LLM_STRUCTURED_OUTPUT
+
+logger = logging.getLogger(__name__)
+
+# Ключи JSON Schema, которые понимает response_schema Gemini (подмножество OpenAPI 3.0)
+_SCHEMA_KEYS = {
+    "type", "format", "description", "nullable", "enum", "properties",
+    "required", "items", "minimum", "maximum", "minItems", "maxItems",
+}
+
+
+class SchemaMismatchError(ValueError):
+    """JSON ответа модели не соответствует схеме"""
+
+    metric_reason = "schema_mismatch"
+
+
+def response_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    Схема ответа для Gemini из Pydantic модели: $ref раскрыты, служебные
+    ключи (title, default, additionalProperties) убраны
+    """
+    schema = model.model_json_schema()
+    return _convert(schema, schema.get("$defs", {}))
+
+
+def patch_model(model: Type[BaseModel]) -> Type[BaseModel]:
+    """Модель с теми же полями, но все необязательные (изменения части секций)"""
+    return create_model(
+        model.__name__ + "Patch",
+        **{
+            name: (info.annotation, Field(None, json_schema_extra=info.json_schema_extra))
+            for name, info in model.model_fields.items()
+        }
+    )
+
+
+def subset_model(model: Type[BaseModel], fields: Iterable[str]) -> Type[BaseModel]:
+    """Модель из части полей model (например, одна секция документа)"""
+    return create_model(
+        model.__name__ + "Part",
+        **{name: (model.model_fields[name].annotation, model.model_fields[name]) for name in fields}
+    )
+
+
+def _convert(node: Dict[str, Any], definitions: Dict[str, Any]) -> Dict[str, Any]:
+    if "$ref" in node:
+        return _convert(definitions[node["$ref"].split("/")[-1]], definitions)
+    if "allOf" in node and len(node["allOf"]) == 1:
+        return _convert(node["allOf"][0], definitions)
+
+    result = {}
+    for key, value in node.items():
+        if key not in _SCHEMA_KEYS:
+            continue
+        if key == "properties":
+            value = {name: _convert(prop, definitions) for name, prop in value.items()}
+        elif key == "items":
+            value = _convert(value, definitions)
+        result[key] = value
+    return result
+
+
+def supports_json_mode() -> bool:
+    """Поддерживает ли установленный SDK response_mime_type/response_schema"""
+    return "response_schema" in inspect.signature(genai.types.GenerationConfig).parameters
+
+
+def json_config(base: Any, schema: Dict[str, Any]) -> Any:
+    """
+    Конфиг генерации с нативным JSON режимом и схемой ответа. Если SDK
+    их не поддерживает (google-generativeai 0.3.x), возвращается base -
+    формат задает промпт, а ответ разбирается parse_structured.
+    """
+    if not supports_json_mode():
+        return base
+    options = {
+        name: getattr(base, name)
+        for name in inspect.signature(genai.types.GenerationConfig).parameters
+        if getattr(base, name, None) is not None
+    }
+    return genai.types.GenerationConfig(
+        **options,
+        response_mime_type="application/json",
+        response_schema=schema
+    )
+
+
+def parse_structured(
+    text: str,
+    model: Type[BaseModel],
+    operation: str,
+    repair=None,
+    strict: bool = True
+) -> Dict[str, Any]:
+    """
+    Разобрать JSON ответ модели и проверить его по схеме.
+
+    Сначала json.loads без обработки (ответ JSON режима); repair - очистка
+    текста (markdown блоки, комментарии, лишние запятые) только если прямой
+    разбор не удался. strict=False - несоответствие схеме учитывается
+    в метриках, но словарь возвращается для достройки вызывающим кодом.
+    """
+    try:
+        data = json.loads(text)
+        outcome = "direct"
+    except json.JSONDecodeError:
+        if repair is None:
+            LLM_STRUCTURED_OUTPUT.labels(operation, "invalid_json").inc()
+            raise
+        try:
+            data = json.loads(repair(text))
+            outcome = "repaired"
+        except json.JSONDecodeError:
+            LLM_STRUCTURED_OUTPUT.labels(operation, "invalid_json").inc()
+            raise
+
+    try:
+        model.model_validate(data)
+    except ValidationError as e:
+        LLM_STRUCTURED_OUTPUT.labels(operation, "schema_mismatch").inc()
+        if strict:
+            raise SchemaMismatchError(f"{model.__name__}: {e.error_count()} validation errors") from e
+        logger.warning(f"{operation}: response does not match {model.__name__} ({e.error_count()} errors)")
+        return data
+
+    LLM_STRUCTURED_OUTPUT.labels(operation, outcome).inc()
+    return data
@@ -0,0 +1,85 @@
+from fastapi.responses import JSONResponse
+
+from config import settings
+
+
+def file_too_large_detail() -> str:
+    return f"File too large. Maximum size: {settings.MAX_FILE_SIZE // (1024*1024)}MB"
+
+
+class _BodyTooLarge(Exception):
+    """Тело запроса превысило лимит - чтение прервано"""
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware: ограничение размера multipart запросов (загрузки файлов).
+
+    Запрос с Content-Length больше лимита отклоняется (413) без чтения тела;
+    без Content-Length (chunked) тело считается по мере получения и чтение
+    прерывается, как только лимит превышен, - файл не буферизуется целиком.
+    Ответ 413 middleware отправляет само, вместо ответа приложения на
+    прерванный разбор формы. Регистрируется до CORSMiddleware, чтобы 413
+    проходил через него и получал CORS заголовки.
+    """
+
+    def __init__(self, app, max_body_size: int = None):
+        self.app = app
+        self.max_body_size = max_body_size or settings.MAX_FILE_SIZE + settings.UPLOAD_MULTIPART_OVERHEAD
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._is_multipart(scope):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = self._header(scope, b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_size:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        too_large = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    too_large = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if too_large:
+                # Ответ приложения на прерванное чтение (400) заменяется на 413
+                return
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not too_large:
+                raise
+        if too_large and not response_started:
+            await self._reject(scope, receive, send)
+
+    @staticmethod
+    async def _reject(scope, receive, send):
+        response = JSONResponse(status_code=413, content={"detail": file_too_large_detail()})
+        await response(scope, receive, send)
+
+    @classmethod
+    def _is_multipart(cls, scope) -> bool:
+        content_type = cls._header(scope, b"content-type") or ""
+        return content_type.startswith("multipart/form-data")
+
+    @staticmethod
+    def _header(scope, name: bytes):
+        for key, value in scope.get("headers", ()):
+            if key == name:
+                return value.decode("latin-1")
+        return None
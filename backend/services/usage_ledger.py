@@ -0,0 +1,373 @@
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import func
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+from database import SessionLocal, TokenQuota, TokenUsage
+from services.context_builder import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaExceededError(Exception):
+    """Проект израсходовал квоту токенов"""
+
+    def __init__(self, project_id: str, used: int, limit: int):
+        self.project_id = project_id
+        self.used = used
+        self.limit = limit
+        super().__init__(f"Token quota exceeded for project {project_id}: {used} of {limit} tokens used")
+
+
+@dataclass
+class Usage:
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    estimated: bool = False
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.output_tokens
+
+
+@dataclass
+class UsageScope:
+    """Проект, к которому относятся вызовы LLM, и их суммарный расход"""
+    project_id: Optional[str]
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.output_tokens
+
+
+_current_scope: ContextVar[Optional[UsageScope]] = ContextVar("usage_scope", default=None)
+
+
+def usage_from_response(response: Any, prompt: str, text: Optional[str] = None) -> Usage:
+    """
+    Расход токенов из usage_metadata ответа. Если SDK его не отдает
+    (google-generativeai 0.3.x), токены оцениваются по длине текста.
+    """
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is not None and getattr(metadata, "prompt_token_count", None) is not None:
+        return Usage(
+            prompt_tokens=metadata.prompt_token_count or 0,
+            output_tokens=getattr(metadata, "candidates_token_count", 0) or 0,
+            cached_tokens=getattr(metadata, "cached_content_token_count", 0) or 0
+        )
+
+    if text is None:
+        try:
+            text = response.text
+        except Exception:
+            # Ответ заблокирован или без кандидатов
+            text = ""
+    return Usage(
+        prompt_tokens=estimate_tokens(prompt),
+        output_tokens=estimate_tokens(text) if text else 0,
+        estimated=True
+    )
+
+
+class UsageLedger:
+    """
+    Учет токенов и стоимости вызовов LLM (таблица token_usage) и квоты проектов.
+
+    Проект определяется областью scope(): ее открывают роуты и фоновые задачи,
+    а GeminiService записывает каждый вызов в текущую область. Квоты и
+    суммарный расход проектов держатся в памяти, чтобы проверка квоты не
+    ходила в БД на каждый запрос (при нескольких воркерах - у каждого свой);
+    первая проверка проекта загружает их в пуле потоков, не в event loop.
+
+    record() вызывается из event loop, поэтому в БД не пишет: строки копятся
+    в буфере, и фоновый поток сохраняет их пачкой раз в LLM_USAGE_FLUSH_INTERVAL.
+    Отчеты и загрузка итога проекта сначала дописывают буфер (flush).
+    """
+
+    def __init__(
+        self,
+        prices: Dict[str, Dict[str, float]] = None,
+        default_quota: Optional[int] = None,
+        flush_interval: float = None
+    ):
+        self.prices = prices if prices is not None else settings.LLM_PRICES_PER_MTOK
+        self.default_quota = default_quota if default_quota is not None else settings.LLM_PROJECT_TOKEN_QUOTA
+        self.flush_interval = flush_interval if flush_interval is not None else settings.LLM_USAGE_FLUSH_INTERVAL
+        # project_id -> израсходовано токенов и квота (загружаются при первой проверке)
+        self._totals: Dict[str, int] = {}
+        self._quotas: Dict[str, Optional[int]] = {}
+        self._lock = threading.Lock()
+        # Еще не записанные строки token_usage и фоновый поток, который их пишет
+        self._pending: List[Dict[str, Any]] = []
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+
+    @contextmanager
+    def scope(self, project_id: Optional[str], check_quota: bool = True) -> Iterator[UsageScope]:
+        """
+        Отнести вызовы LLM внутри блока к проекту; квота проверяется на входе.
+        Проверка синхронная (первая идет в БД) - в event loop сначала
+        await check_quota(), а область открывается с check_quota=False.
+        """
+        if project_id and check_quota:
+            self._check_loaded_quota(project_id)
+        scope = UsageScope(project_id=project_id)
+        token = _current_scope.set(scope)
+        try:
+            yield scope
+        finally:
+            try:
+                _current_scope.reset(token)
+            except ValueError:
+                # Генератор закрыт в другом контексте (обрыв потока) - область уже не нужна
+                pass
+
+    def current_project(self) -> Optional[str]:
+        """Проект текущей области или None"""
+        scope = _current_scope.get()
+        return scope.project_id if scope else None
+
+    async def check_quota(self, project_id: str):
+        """QuotaExceededError, если проект израсходовал свою квоту"""
+        with self._lock:
+            loaded = project_id in self._quotas and project_id in self._totals
+        if loaded:
+            self._check_loaded_quota(project_id)
+        else:
+            await run_in_threadpool(self._check_loaded_quota, project_id)
+
+    def _check_loaded_quota(self, project_id: str):
+        limit = self.get_quota(project_id)
+        if limit is None:
+            return
+        used = self._project_total(project_id)
+        if used >= limit:
+            raise QuotaExceededError(project_id, used, limit)
+
+    def record(self, model: str, operation: str, usage: Usage):
+        """Записать вызов в текущую область и в таблицу token_usage"""
+        scope = _current_scope.get()
+        project_id = scope.project_id if scope else None
+        if scope:
+            scope.prompt_tokens += usage.prompt_tokens
+            scope.output_tokens += usage.output_tokens
+            scope.cached_tokens += usage.cached_tokens
+
+        if project_id:
+            with self._lock:
+                if project_id in self._totals:
+                    self._totals[project_id] += usage.total_tokens
+
+        row = dict(
+            project_id=project_id,
+            operation=operation,
+            model=model,
+            prompt_tokens=usage.prompt_tokens,
+            output_tokens=usage.output_tokens,
+            cached_tokens=usage.cached_tokens,
+            estimated=usage.estimated,
+            cost_usd=self.cost(model, usage),
+            created_at=datetime.utcnow()
+        )
+        with self._lock:
+            self._pending.append(row)
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name="usage-ledger-writer", daemon=True)
+                self._writer.start()
+
+    def flush(self):
+        """Записать накопленные строки token_usage одной транзакцией"""
+        # Один писатель за раз: иначе отчет может не увидеть пачку,
+        # которую как раз пишет фоновый поток
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return
+            db = SessionLocal()
+            try:
+                db.add_all([TokenUsage(**row) for row in rows])
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Failed to record token usage ({len(rows)} calls): {e}")
+            finally:
+                db.close()
+
+    def stop(self):
+        """Остановить фоновую запись и дописать буфер (при остановке приложения)"""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._wakeup.set()
+            writer.join()
+            self._wakeup.clear()
+        self.flush()
+
+    def _write_loop(self):
+        while True:
+            stopping = self._wakeup.wait(self.flush_interval)
+            self.flush()
+            with self._lock:
+                if stopping or self._writer is not threading.current_thread():
+                    return
+
+    def cost(self, model: str, usage: Usage) -> float:
+        """Стоимость вызова в USD; кэшированные токены входят в prompt_tokens"""
+        price = self.prices.get(model)
+        if not price:
+            return 0.0
+        uncached = max(0, usage.prompt_tokens - usage.cached_tokens)
+        return (
+            uncached * price.get("input", 0)
+            + usage.cached_tokens * price.get("cached", price.get("input", 0))
+            + usage.output_tokens * price.get("output", 0)
+        ) / 1_000_000
+
+    # Квоты
+
+    def get_quota(self, project_id: str) -> Optional[int]:
+        with self._lock:
+            if project_id in self._quotas:
+                return self._quotas[project_id]
+
+        db = SessionLocal()
+        try:
+            quota = db.query(TokenQuota).filter(TokenQuota.project_id == project_id).first()
+            limit = quota.max_tokens if quota else self.default_quota
+        finally:
+            db.close()
+
+        with self._lock:
+            return self._quotas.setdefault(project_id, limit)
+
+    def set_quota(self, project_id: str, max_tokens: Optional[int]):
+        """Установить квоту проекта; None - вернуть квоту по умолчанию"""
+        db = SessionLocal()
+        try:
+            quota = db.query(TokenQuota).filter(TokenQuota.project_id == project_id).first()
+            if max_tokens is None:
+                if quota:
+                    db.delete(quota)
+            elif quota:
+                quota.max_tokens = max_tokens
+            else:
+                db.add(TokenQuota(project_id=project_id, max_tokens=max_tokens))
+            db.commit()
+        finally:
+            db.close()
+
+        with self._lock:
+            self._quotas[project_id] = max_tokens if max_tokens is not None else self.default_quota
+
+    def forget_project(self, project_id: str):
+        """Забыть квоту и расход удаленного проекта в памяти"""
+        with self._lock:
+            self._quotas.pop(project_id, None)
+            self._totals.pop(project_id, None)
+
+    def _project_total(self, project_id: str) -> int:
+        with self._lock:
+            total = self._totals.get(project_id)
+        if total is not None:
+            return total
+
+        self.flush()
+        db = SessionLocal()
+        try:
+            total = db.query(
+                func.coalesce(func.sum(TokenUsage.prompt_tokens + TokenUsage.output_tokens), 0)
+            ).filter(TokenUsage.project_id == project_id).scalar()
+        finally:
+            db.close()
+
+        with self._lock:
+            return self._totals.setdefault(project_id, int(total))
+
+    # Отчеты
+
+    def project_usage(self, project_id: str) -> Dict[str, Any]:
+        """Расход проекта: итог и разбивка по операциям и моделям"""
+        self.flush()
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                TokenUsage.operation,
+                TokenUsage.model,
+                func.count(TokenUsage.id),
+                func.sum(TokenUsage.prompt_tokens),
+                func.sum(TokenUsage.output_tokens),
+                func.sum(TokenUsage.cached_tokens),
+                func.sum(TokenUsage.cost_usd)
+            ).filter(
+                TokenUsage.project_id == project_id
+            ).group_by(TokenUsage.operation, TokenUsage.model).all()
+        finally:
+            db.close()
+
+        breakdown = [self._row(row[2:], operation=row[0], model=row[1]) for row in rows]
+        total = self._sum(breakdown)
+        return {
+            "project_id": project_id,
+            "total": total,
+            "by_operation": breakdown,
+            "quota": self.get_quota(project_id)
+        }
+
+    def daily_usage(self, project_id: Optional[str] = None, days: int = 30) -> List[Dict[str, Any]]:
+        """Расход по дням (UTC) за последние days дней, по проекту или по всем"""
+        since = datetime.utcnow() - timedelta(days=days)
+        day = func.date(TokenUsage.created_at)
+        self.flush()
+        db = SessionLocal()
+        try:
+            query = db.query(
+                day,
+                func.count(TokenUsage.id),
+                func.sum(TokenUsage.prompt_tokens),
+                func.sum(TokenUsage.output_tokens),
+                func.sum(TokenUsage.cached_tokens),
+                func.sum(TokenUsage.cost_usd)
+            ).filter(TokenUsage.created_at >= since)
+            if project_id:
+                query = query.filter(TokenUsage.project_id == project_id)
+            rows = query.group_by(day).order_by(day).all()
+        finally:
+            db.close()
+
+        return [self._row(row[1:], date=str(row[0])) for row in rows]
+
+    @staticmethod
+    def _row(values, **keys) -> Dict[str, Any]:
+        calls, prompt_tokens, output_tokens, cached_tokens, cost = values
+        return {
+            **keys,
+            "calls": calls or 0,
+            "prompt_tokens": prompt_tokens or 0,
+            "output_tokens": output_tokens or 0,
+            "cached_tokens": cached_tokens or 0,
+            "total_tokens": (prompt_tokens or 0) + (output_tokens or 0),
+            "cost_usd": round(cost or 0.0, 6)
+        }
+
+    @staticmethod
+    def _sum(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        fields = ("calls", "prompt_tokens", "output_tokens", "cached_tokens", "total_tokens")
+        total = {field: sum(row[field] for row in rows) for field in fields}
+        total["cost_usd"] = round(sum(row["cost_usd"] for row in rows), 6)
+        return total
+
+
+usage_ledger = UsageLedger()
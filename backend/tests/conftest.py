@@ -0,0 +1,36 @@
+import os
+import tempfile
+
+# Настройки читаются при импорте config - окружение тестов задается до него:
+# заглушка вместо Gemini и отдельная SQLite база
+_DATA_DIR = tempfile.mkdtemp(prefix="backend_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DATA_DIR}/test.db"
+os.environ["LLM_PROVIDER"] = "stub"
+os.environ["LLM_STUB_FIRST_TOKEN_LATENCY"] = "0"
+os.environ["LLM_STUB_TOKEN_LATENCY"] = "0"
+os.environ["LLM_STUB_JITTER"] = "0"
+os.environ["LLM_STUB_ERROR_RATE"] = "0"
+os.environ["UPLOAD_TMP_DIR"] = _DATA_DIR
+
+import pytest
+
+from database import init_db
+from services.gemini_service import GeminiService
+from services.llm_provider import StubProvider
+
+init_db()
+
+
+@pytest.fixture
+def make_service():
+    """GeminiService поверх StubProvider с заданной латентностью"""
+    services = []
+
+    def make(first_token: float = 0.0, per_token: float = 0.0, error_rate: float = 0.0) -> GeminiService:
+        service = GeminiService(StubProvider(first_token, per_token, jitter=0, error_rate=error_rate, seed=1))
+        services.append(service)
+        return service
+
+    yield make
+    for service in services:
+        service.close()
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import uuid
+
+from config import settings
+from database import SessionLocal, Message, Project
+from main import app
+from services.gemini_service import get_gemini_service
+from services.resilience import CircuitBreaker
+
+
+def _create_project() -> str:
+    db = SessionLocal()
+    try:
+        project = Project(id=str(uuid.uuid4()), name="Тестовый проект")
+        db.add(project)
+        db.commit()
+        return project.id
+    finally:
+        db.close()
+
+
+async def _stream_and_disconnect(project_id: str, after_tokens: int) -> list:
+    """
+    POST /api/chat/stream через ASGI напрямую: клиент отключается после
+    after_tokens событий token (0 - до первого). Возвращает события ответа
+    """
+    body = json.dumps({"project_id": project_id, "message": "Нужна CRM для отделений"}).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/api/chat/stream", "raw_path": b"/api/chat/stream",
+        "query_string": b"", "root_path": "", "server": ("test", 80), "client": ("test", 1),
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    }
+    disconnect = asyncio.Event()
+    events = []
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            if after_tokens == 0:
+                disconnect.set()
+        elif message["type"] == "http.response.body" and message.get("body"):
+            events.append(message["body"].decode())
+            if sum(event.startswith("event: token") for event in events) >= after_tokens:
+                disconnect.set()
+
+    await asyncio.wait_for(app(scope, receive, send), timeout=10)
+    return events
+
+
+def _run_aborted_stream(make_service, after_tokens: int, **latency):
+    service = make_service(**latency)
+    breaker = service._breakers[id(service.model_flash)]
+    breaker.state = CircuitBreaker.OPEN
+    breaker.opened_at = 0.0  # recovery_timeout истек: поток будет пробным вызовом
+    project_id = _create_project()
+
+    app.dependency_overrides[get_gemini_service] = lambda: service
+    try:
+        events = asyncio.run(_stream_and_disconnect(project_id, after_tokens))
+    finally:
+        app.dependency_overrides.pop(get_gemini_service, None)
+    return service, breaker, project_id, events
+
+
+def test_chat_stream_abort_before_first_token_releases_probe(make_service):
+    service, breaker, _, events = _run_aborted_stream(make_service, 0, first_token=0.5)
+
+    assert not any(event.startswith("event: done") for event in events)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker._probe_in_flight
+    assert service._limits[id(service.model_flash)]._value == settings.GEMINI_MAX_CONCURRENCY_FLASH
+
+
+def test_chat_stream_abort_mid_stream_closes_circuit_and_saves_partial_answer(make_service):
+    service, breaker, project_id, events = _run_aborted_stream(make_service, 1, per_token=0.02)
+
+    assert events and not any(event.startswith("event: done") for event in events)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert service._limits[id(service.model_flash)]._value == settings.GEMINI_MAX_CONCURRENCY_FLASH
+
+    db = SessionLocal()
+    try:
+        saved = db.query(Message).filter(Message.project_id == project_id, Message.role == "assistant").all()
+    finally:
+        db.close()
+    assert len(saved) == 1
@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+CALL_LATENCY = 0.5
+CALLS = 8
+
+
+async def _max_loop_lag(stop: asyncio.Event, tick: float = 0.01) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(tick)
+        worst = max(worst, time.perf_counter() - started - tick)
+    return worst
+
+
+def test_parallel_calls_finish_in_time_of_one(make_service):
+    service = make_service(first_token=CALL_LATENCY)
+
+    async def run():
+        started = time.perf_counter()
+        results = await asyncio.gather(*[
+            service.improve_section(f"Секция {i}", "Уточнить формулировку", use_cache=False)
+            for i in range(CALLS)
+        ])
+        return time.perf_counter() - started, results
+
+    elapsed, results = asyncio.run(run())
+
+    assert len(results) == CALLS
+    assert service.provider.calls == CALLS
+    # Последовательно было бы CALLS * CALL_LATENCY = 4 с
+    assert elapsed < CALL_LATENCY * 2
+
+
+def test_slow_call_does_not_block_event_loop(make_service):
+    service = make_service(first_token=CALL_LATENCY)
+
+    async def run():
+        stop = asyncio.Event()
+        lag = asyncio.ensure_future(_max_loop_lag(stop))
+        await service.improve_section("Секция", "Уточнить формулировку", use_cache=False)
+        stop.set()
+        return await lag
+
+    assert asyncio.run(run()) < 0.1
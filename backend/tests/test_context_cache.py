@@ -0,0 +1,90 @@
+import asyncio
+import uuid
+
+import httpx
+
+import services.gemini_service as gemini_module
+from database import SessionLocal, Project
+from main import app
+from services.context_builder import CHARS_PER_TOKEN
+from services.prompt_templates import file_context
+
+
+def test_short_template_prefixes_skip_context_cache(make_service):
+    service = make_service()
+
+    asyncio.run(service.improve_section("Система учитывает клиентов.", "Нет критериев приемки", use_cache=False))
+    asyncio.run(service.generate_diagram("Оформление заявки на кредит", "bpmn", use_cache=False))
+
+    # Префиксы шаблонов короче минимума провайдера - кэш даже не запрашивается
+    stats = service.context_cache.stats()
+    assert stats["creates"] == 0
+    assert stats["skipped"] == 0
+
+
+def _long_text(service) -> str:
+    return "Требование: система хранит историю заявок клиента. " * (
+        service.context_cache.min_tokens * CHARS_PER_TOKEN // 50 + 1
+    )
+
+
+def test_long_file_context_is_cached_once_reused(make_service):
+    service = make_service()
+    text = _long_text(service)
+
+    # Разовый анализ файла кэш не создает
+    asyncio.run(service.analyze_file(text, use_cache=False))
+    assert service.context_cache.stats()["creates"] == 0
+
+    asyncio.run(service.analyze_file(text, use_cache=False))
+    stats = service.context_cache.stats()
+    assert stats["creates"] == 1
+    assert stats["deferred"] == 1
+
+
+def test_prefix_used_once_per_model_is_not_cached(make_service):
+    service = make_service()
+    prefix = file_context(_long_text(service))
+
+    # Основной вызов и хедж того же запроса в другую модель
+    for model in (service.model_pro, service.model_flash):
+        service.context_cache.generate(model, prefix + "Вопрос", cached_prefix=prefix)
+
+    assert service.context_cache.stats()["creates"] == 0
+
+
+def test_projects_do_not_share_context_cache_handles(make_service):
+    service = make_service()
+    cache = service.context_cache
+    prefix = file_context(_long_text(service))
+
+    for project_id in ("project-a", "project-a", "project-b", "project-b"):
+        cache.generate(service.model_pro, prefix + "Вопрос", cached_prefix=prefix, project_id=project_id)
+    assert cache.stats()["creates"] == 2
+
+    assert cache.drop_project("project-a") == 1
+    # Кэш проекта B остался и используется
+    cache.generate(service.model_pro, prefix + "Вопрос", cached_prefix=prefix, project_id="project-b")
+    stats = cache.stats()
+    assert [handle["project_id"] for handle in stats["handles"]] == ["project-b"]
+    assert stats["hits"] == 1
+
+
+def test_delete_project_does_not_create_llm_service(monkeypatch):
+    monkeypatch.setattr(gemini_module, "_gemini_service", None)
+    db = SessionLocal()
+    try:
+        project = Project(id=str(uuid.uuid4()), name="Удаляемый проект")
+        db.add(project)
+        db.commit()
+        project_id = project.id
+    finally:
+        db.close()
+
+    async def delete():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.delete(f"/api/projects/{project_id}")
+
+    assert asyncio.run(delete()).status_code == 200
+    assert gemini_module._gemini_service is None
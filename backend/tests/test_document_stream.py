@@ -0,0 +1,131 @@
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import httpx
+
+from database import SessionLocal, Document, Message, Project
+from main import app
+from services.gemini_service import get_gemini_service
+
+HISTORY = [{"role": "user", "content": "Нужна CRM для отделений"}]
+
+
+def _project_with_document(document: dict, late_message: str = None) -> str:
+    """
+    Проект с историей чата и версией документа по ней; late_message -
+    сообщение, отправленное, пока версия генерировалась (раньше ее сохранения)
+    """
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        project = Project(id=str(uuid.uuid4()), name="Тестовый проект")
+        db.add(project)
+        first = now - timedelta(minutes=5)
+        db.add(Message(
+            id=str(uuid.uuid4()), project_id=project.id, role="user",
+            content="Нужна CRM для отделений", timestamp=first
+        ))
+        if late_message:
+            db.add(Message(
+                id=str(uuid.uuid4()), project_id=project.id, role="user",
+                content=late_message, timestamp=now - timedelta(minutes=1)
+            ))
+        db.add(Document(
+            id=str(uuid.uuid4()), project_id=project.id, content_json=json.dumps(document, ensure_ascii=False),
+            quality_score=80, created_at=now, updated_at=now, version=1, history_until=first
+        ))
+        db.commit()
+        return project.id
+    finally:
+        db.close()
+
+
+def _versions(project_id: str) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(Document).filter(Document.project_id == project_id).count()
+    finally:
+        db.close()
+
+
+def _stream(project_id: str, mode: str) -> list:
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post(
+                "/api/documents/generate/stream",
+                json={"project_id": project_id, "mode": mode}
+            )
+        assert response.status_code == 200
+        return [
+            (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+            for block in response.text.strip().split("\n\n")
+        ]
+
+    return asyncio.run(run())
+
+
+def test_stream_delta_without_new_messages_returns_latest_version(make_service):
+    service = make_service()
+
+    async def full_regeneration(*args, **kwargs):
+        raise AssertionError("delta mode must not regenerate the whole document")
+        yield
+
+    async def validate(*args, **kwargs):
+        raise AssertionError("an unchanged version must not be validated again")
+
+    service.stream_document = full_regeneration
+    service.validate_document = validate
+    previous = service._get_fallback_document(HISTORY)
+    project_id = _project_with_document(previous)
+    app.dependency_overrides[get_gemini_service] = lambda: service
+    try:
+        events = _stream(project_id, "delta")
+    finally:
+        app.dependency_overrides.pop(get_gemini_service, None)
+
+    sections = {data["name"]: data["content"] for event, data in events if event == "section"}
+    assert sections == previous
+    assert events[-1][0] == "done"
+    assert _versions(project_id) == 1
+
+
+def test_delta_includes_message_sent_during_generation(make_service):
+    service = make_service()
+    received = []
+
+    async def update_document(document, new_messages, chat_history):
+        received.extend(message["content"] for message in new_messages)
+        return document
+
+    service.update_document = update_document
+    project_id = _project_with_document(service._get_fallback_document(HISTORY), late_message="Добавьте учет звонков")
+    app.dependency_overrides[get_gemini_service] = lambda: service
+    try:
+        async def generate():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post("/api/documents/generate", json={"project_id": project_id, "mode": "delta"})
+
+        response = asyncio.run(generate())
+    finally:
+        app.dependency_overrides.pop(get_gemini_service, None)
+
+    assert response.status_code == 200, response.text
+    assert received == ["Добавьте учет звонков"]
+    assert _versions(project_id) == 2
+
+
+def test_stream_sections_mode_saves_document(make_service):
+    service = make_service()
+    project_id = _project_with_document(service._get_fallback_document(HISTORY))
+    app.dependency_overrides[get_gemini_service] = lambda: service
+    try:
+        events = _stream(project_id, "sections")
+    finally:
+        app.dependency_overrides.pop(get_gemini_service, None)
+
+    assert events[-1][0] == "done", events[-1]
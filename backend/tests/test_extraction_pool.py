@@ -0,0 +1,38 @@
+import asyncio
+import time
+
+from services.extraction_pool import ExtractionError, ExtractionPool
+
+
+# Задачи воркеров - функции модуля: spawn-воркер импортирует их по имени
+
+def _hang() -> None:
+    time.sleep(60)
+
+
+def _work(index: int) -> int:
+    time.sleep(1.0)
+    return index
+
+
+def test_hanging_job_does_not_fail_other_jobs():
+    pool = ExtractionPool(workers=2, timeout=3.0, memory_limit_mb=0, split_min_pages=10_000)
+
+    async def run():
+        await pool.warmup()
+        hanging = asyncio.ensure_future(pool.run(_hang))
+        await asyncio.sleep(0.1)
+        # Воркер один: задачи идут одна за другой, последняя ждет дольше таймаута
+        jobs = [pool.run(_work, index) for index in range(4)]
+        results = await asyncio.gather(hanging, *jobs, return_exceptions=True)
+        return results[0], results[1:]
+
+    try:
+        hang_result, results = asyncio.run(run())
+    finally:
+        pool.stop()
+
+    assert isinstance(hang_result, ExtractionError)
+    assert results == list(range(4))
+    assert pool.timeouts == 1
+    assert pool.crashes == 0
@@ -0,0 +1,88 @@
+import asyncio
+import hashlib
+
+import httpx
+import pytest
+
+import routes.file as file_route
+from main import app
+from services.file_cache import file_cache
+from services.gemini_service import get_gemini_service
+
+SPEC = "Клиенты банка оплачивают коммунальные услуги в мобильном приложении.".encode("utf-8")
+STORED = {
+    "project_name": "Сохраненный анализ",
+    "goals": ["Цель"],
+    "requirements": ["Требование"],
+    "stakeholders": ["Клиенты"],
+    "description": "Анализ из кэша файлов",
+    "extracted_text_length": len(SPEC.decode("utf-8")),
+    "file_type": "txt"
+}
+
+
+@pytest.fixture
+def service(make_service, monkeypatch):
+    service = make_service()
+    app.dependency_overrides[get_gemini_service] = lambda: service
+
+    async def no_extraction(*args, **kwargs):
+        raise AssertionError("text must come from the file cache")
+
+    # Текст файла уже в кэше - повторно его не извлекаем
+    monkeypatch.setattr(file_route.extraction_pool, "extract", no_extraction)
+    yield service
+    app.dependency_overrides.pop(get_gemini_service, None)
+
+
+def _upload(**params) -> dict:
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post(
+                "/api/files/upload",
+                params=params,
+                files={"file": ("spec.txt", SPEC, "text/plain")}
+            )
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    return asyncio.run(run())
+
+
+def _store(analysis_version: str):
+    sha256 = hashlib.sha256(SPEC).hexdigest()
+    file_cache.put(sha256, "txt", SPEC.decode("utf-8"), {"filename": "spec.txt"}, STORED, analysis_version)
+
+
+def test_stored_analysis_is_served_for_current_version(service):
+    _store(service.file_analysis_version)
+
+    response = _upload()
+
+    assert response["cached"] is True
+    assert response["project_name"] == STORED["project_name"]
+    assert service.provider.calls == 0
+
+
+def test_use_cache_false_reanalyzes_cached_text(service):
+    _store(service.file_analysis_version)
+
+    response = _upload(use_cache="false")
+
+    assert response["cached"] is False
+    assert service.provider.calls == 1
+
+
+def test_analysis_of_another_version_is_not_served(service):
+    _store("previous-version")
+
+    response = _upload()
+
+    assert response["cached"] is False
+    assert service.provider.calls == 1
+    sha256 = hashlib.sha256(SPEC).hexdigest()
+    # Новый анализ сохранен с текущей версией
+    assert file_cache.get(sha256, service.file_analysis_version).analysis == {
+        key: value for key, value in response.items() if key != "cached"
+    }
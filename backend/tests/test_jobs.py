@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import json
+
+import httpx
+
+from database import SessionLocal, Job
+import routes.jobs as jobs_route
+from main import app
+from routes.jobs import _run_file_analysis
+from services.file_cache import file_cache
+from services.gemini_service import FileAnalysisError, fallback_file_analysis
+from services.job_queue import job_queue
+
+SPEC = "Система должна принимать платежи клиентов банка.".encode("utf-8")
+
+
+async def _progress(percent: int, message: str):
+    pass
+
+
+def _analyze_after_restart() -> dict:
+    """
+    Поставить анализ файла через API, пока воркеры остановлены, очистить кэш
+    файлов и "перезапустить" очередь - задача должна выполниться
+    """
+    async def run():
+        await job_queue.start()
+        await job_queue.stop()
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post(
+                    "/api/jobs/files/analyze",
+                    files={"file": ("spec.txt", SPEC, "text/plain")}
+                )
+            assert response.status_code == 202, response.text
+            file_cache.clear()
+
+            await job_queue.start()
+            async for job in job_queue.watch(response.json()["job_id"]):
+                pass
+            return job
+        finally:
+            await job_queue.stop()
+
+    return asyncio.run(run())
+
+
+def _job_row(job_id: str) -> Job:
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).one()
+        job.payload  # отложенная колонка - загрузить до закрытия сессии
+        return job
+    finally:
+        db.close()
+
+
+def test_file_analysis_job_survives_cache_eviction_and_restart():
+    sha256 = hashlib.sha256(SPEC).hexdigest()
+    # Текст уже в кэше файлов - извлечение в пуле процессов не нужно
+    file_cache.put(sha256, "txt", SPEC.decode("utf-8"), {"filename": "spec.txt"})
+
+    job = _analyze_after_restart()
+
+    assert job["status"] == "succeeded", job["error"]
+    assert job["result"]["extracted_text_length"] == len(SPEC.decode("utf-8"))
+    row = _job_row(job["job_id"])
+    params = json.loads(row.params_json)
+    assert params["sha256"] == sha256
+    assert "text" not in params and "payload" not in params
+    # Текст нужен только до завершения задачи
+    assert row.payload is None
+
+
+def test_legacy_job_fails_when_text_evicted():
+    params = {"sha256": "0" * 64, "file_type": "txt", "use_cache": False}
+    try:
+        asyncio.run(_run_file_analysis(params, _progress))
+    except ValueError as e:
+        assert "upload the file again" in str(e)
+    else:
+        raise AssertionError("missing cached text must fail the job")
+
+
+class _AnalysisService:
+    """Сервис с заданным исходом analyze_file"""
+
+    file_analysis_version = "test"
+
+    def __init__(self, result: dict = None, error: Exception = None):
+        self.result = result
+        self.error = error
+
+    async def analyze_file(self, text: str, use_cache: bool = True, fallback: bool = True) -> dict:
+        if self.error is not None:
+            if fallback:
+                return fallback_file_analysis()
+            raise self.error
+        return self.result
+
+
+def _analyze_cached_text(monkeypatch, service: _AnalysisService, sha256: str) -> dict:
+    file_cache.put(sha256, "txt", SPEC.decode("utf-8"), {"filename": "spec.txt"})
+    monkeypatch.setattr(jobs_route, "get_gemini_service", lambda: service)
+    params = {"sha256": sha256, "file_type": "txt", "use_cache": False, "payload": SPEC.decode("utf-8")}
+    return asyncio.run(_run_file_analysis(params, _progress))
+
+
+def test_real_analysis_equal_to_fallback_is_cached(monkeypatch):
+    sha256 = "1" * 64
+    _analyze_cached_text(monkeypatch, _AnalysisService(result=fallback_file_analysis()), sha256)
+    assert file_cache.get(sha256, "test").analysis is not None
+
+
+def test_failed_analysis_is_not_cached(monkeypatch):
+    sha256 = "2" * 64
+    result = _analyze_cached_text(monkeypatch, _AnalysisService(error=FileAnalysisError("LLM is down")), sha256)
+    assert result["project_name"] == fallback_file_analysis()["projectName"]
+    assert file_cache.get(sha256, "test").analysis is None
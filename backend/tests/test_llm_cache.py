@@ -0,0 +1,85 @@
+import asyncio
+import time
+import uuid
+
+import services.llm_cache as llm_cache_module
+from database import SessionLocal, LLMCacheEntry
+from services.llm_cache import ResponseCache
+
+
+def _db_value(key: str):
+    db = SessionLocal()
+    try:
+        entry = db.query(LLMCacheEntry).filter(LLMCacheEntry.key == key).first()
+        return entry.value if entry else None
+    finally:
+        db.close()
+
+
+def test_key_is_deterministic():
+    config = {"temperature": 0.2, "max_output_tokens": 100}
+    key = ResponseCache.make_key("gemini-2.5-pro", "Промпт", config)
+
+    assert key == ResponseCache.make_key("gemini-2.5-pro", "Промпт", dict(reversed(list(config.items()))))
+    assert key != ResponseCache.make_key("gemini-2.5-flash", "Промпт", config)
+    assert key != ResponseCache.make_key("gemini-2.5-pro", "Промпт.", config)
+    assert key != ResponseCache.make_key("gemini-2.5-pro", "Промпт", {**config, "temperature": 0.3})
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    cache = ResponseCache(max_entries=10, max_bytes=10_000, ttl=60, persistent=False)
+    now = time.time()
+    monkeypatch.setattr(llm_cache_module.time, "time", lambda: now)
+    cache.set("key", {"answer": 42})
+    assert asyncio.run(cache.get("key")) == {"answer": 42}
+
+    monkeypatch.setattr(llm_cache_module.time, "time", lambda: now + 61)
+    assert asyncio.run(cache.get("key")) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2, max_bytes=10_000, ttl=60, persistent=False)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # "a" использован позже "b" - вытесняется "b"
+    assert asyncio.run(cache.get("a")) == 1
+    cache.set("c", 3)
+
+    assert asyncio.run(cache.get("b")) is None
+    assert asyncio.run(cache.get("a")) == 1
+    assert asyncio.run(cache.get("c")) == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_persistent_tier_writes_through_in_background():
+    cache = ResponseCache(max_entries=10, max_bytes=10_000, ttl=60, persistent=True, flush_interval=0.05)
+    key = ResponseCache.make_key("gemini-2.5-flash", str(uuid.uuid4()))
+    try:
+        cache.set(key, ["A --> B"])
+
+        deadline = time.monotonic() + 2
+        while _db_value(key) is None and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert _db_value(key) == '["A --> B"]'
+
+        # Новый экземпляр (перезапуск) читает значение из БД
+        restarted = ResponseCache(max_entries=10, max_bytes=10_000, ttl=60, persistent=True)
+        assert asyncio.run(restarted.get(key)) == ["A --> B"]
+        assert restarted.stats()["persistent_hits"] == 1
+    finally:
+        cache.stop()
+    assert cache._writer is None
+
+
+def test_pending_write_is_served_before_flush():
+    cache = ResponseCache(max_entries=1, max_bytes=10_000, ttl=60, persistent=True, flush_interval=60)
+    try:
+        cache.set("first", 1)
+        cache.set("second", 2)
+        # "first" вытеснен из памяти, но еще не записан в БД
+        assert _db_value("first") is None
+        assert asyncio.run(cache.get("first")) == 1
+    finally:
+        cache.stop()
+    assert _db_value("first") == "1"
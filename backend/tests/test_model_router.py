@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+from config import settings
+from services.llm_provider import StubProvider
+from services.model_router import ModelRouter, latency_budget
+
+
+def _router() -> ModelRouter:
+    provider = StubProvider(0, 0, jitter=0, error_rate=0, seed=1)
+    router = ModelRouter(provider.get_model("gemini-2.5-flash"), provider.get_model("gemini-2.5-pro"))
+    router.hedge_enabled = True
+    router.hedge_default_delay = 5.0
+    return router
+
+
+def test_hedge_delay_capped_by_remaining_budget():
+    router = _router()
+    with latency_budget(2.0):
+        delay = router.hedge_delay(router.strong, "analyze")
+    assert 0 < delay <= 2.0
+    assert router.hedge_delay(router.fast, "analyze") is None
+
+
+def test_no_hedge_when_budget_exhausted():
+    router = _router()
+    with latency_budget(1.0, started=time.monotonic() - 5):
+        assert router.remaining_budget("analyze") == 0
+        assert router.hedge_delay(router.strong, "analyze") is None
+
+
+def test_response_cache_key_does_not_depend_on_answering_model(make_service, monkeypatch):
+    service = make_service()
+    text = "Система должна отправлять клиенту уведомление о статусе заявки."
+
+    # Первый анализ отдает Flash (роутер или хедж), повторный направлен в Pro
+    monkeypatch.setattr(service.router, "route", lambda preferred, operation, prompt: service.model_flash)
+    first = asyncio.run(service.analyze_file(text))
+    monkeypatch.setattr(service.router, "route", lambda preferred, operation, prompt: service.model_pro)
+    second = asyncio.run(service.analyze_file(text))
+
+    assert second == first
+    assert service.provider.calls == 1
+
+
+def test_response_cache_key_changes_with_either_model(make_service, monkeypatch):
+    prompt = "Промпт анализа файла"
+    key = make_service()._response_cache_key(prompt)
+
+    # Ответ на Pro-запрос может дать Flash - смена любой из моделей меняет ключ
+    monkeypatch.setattr(settings, "GEMINI_MODEL_FLASH", "gemini-3-flash")
+    assert make_service()._response_cache_key(prompt) != key
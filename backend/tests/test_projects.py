@@ -0,0 +1,49 @@
+import asyncio
+import uuid
+
+import httpx
+
+from database import SessionLocal, Project, Message, Document, ConversationSummary, TokenQuota
+from main import app
+
+
+def _project_with_related_rows() -> str:
+    db = SessionLocal()
+    try:
+        project = Project(id=str(uuid.uuid4()), name="Удаляемый проект")
+        db.add(project)
+        db.flush()
+        message = Message(project_id=project.id, role="user", content="Нужен онлайн-кредит")
+        db.add(message)
+        db.flush()
+        db.add_all([
+            Document(project_id=project.id, content_json="{}"),
+            ConversationSummary(
+                project_id=project.id, summary="Онлайн-кредит", message_count=1, last_message_id=message.id
+            ),
+            TokenQuota(project_id=project.id, max_tokens=1000),
+        ])
+        db.commit()
+        return project.id
+    finally:
+        db.close()
+
+
+def test_delete_project_removes_related_rows():
+    project_id = _project_with_related_rows()
+
+    async def delete():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.delete(f"/api/projects/{project_id}")
+
+    response = asyncio.run(delete())
+
+    assert response.status_code == 200, response.text
+    db = SessionLocal()
+    try:
+        for model in (Project, Message, Document, ConversationSummary, TokenQuota):
+            column = model.id if model is Project else model.project_id
+            assert db.query(model).filter(column == project_id).count() == 0, model.__tablename__
+    finally:
+        db.close()
@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import pytest
+
+from config import settings
+from services.resilience import CircuitBreaker, CircuitOpenError
+
+
+def _half_open(breaker: CircuitBreaker):
+    """Разомкнутый breaker, у которого истек recovery_timeout: следующий вызов - пробный"""
+    breaker.state = CircuitBreaker.OPEN
+    breaker.opened_at = time.monotonic() - breaker.recovery_timeout - 1
+
+
+def test_release_probe_allows_next_probe():
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=10)
+    _half_open(breaker)
+
+    assert breaker.before_call() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.release_probe()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.before_call() is True
+
+
+def test_aborted_probe_stream_before_first_chunk_releases_probe(make_service):
+    service = make_service(first_token=0.5)
+    model = service.model_flash
+    breaker = service._breakers[id(model)]
+    _half_open(breaker)
+
+    async def run():
+        stream = service._stream(model, "Привет", operation="chat_stream", generation_config=service.chat_config)
+        first = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.05)
+        # Клиент отключился, пока модель еще не ответила
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(run())
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker._probe_in_flight
+    assert service._limits[id(model)]._value == settings.GEMINI_MAX_CONCURRENCY_FLASH
+    assert breaker.before_call() is True
+
+
+def test_aborted_probe_stream_after_first_chunk_closes_circuit(make_service):
+    service = make_service(per_token=0.01)
+    model = service.model_flash
+    breaker = service._breakers[id(model)]
+    _half_open(breaker)
+
+    async def run():
+        stream = service._stream(model, "Привет", operation="chat_stream", generation_config=service.chat_config)
+        assert await stream.__anext__()
+        await stream.aclose()
+
+    asyncio.run(run())
+
+    # API ответил - модель доступна
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert service._limits[id(model)]._value == settings.GEMINI_MAX_CONCURRENCY_FLASH
+
+
+def test_cancelled_probe_call_releases_probe(make_service):
+    service = make_service(first_token=0.5)
+    model = service.model_flash
+    breaker = service._breakers[id(model)]
+    _half_open(breaker)
+
+    async def run():
+        call = asyncio.ensure_future(service.improve_section("Секция", "Уточнить", use_cache=False))
+        await asyncio.sleep(0.05)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+    asyncio.run(run())
+
+    assert not breaker._probe_in_flight
+    assert breaker.before_call() is True
@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+
+from config import settings
+from main import app
+
+ORIGIN = "http://localhost:5173"
+BOUNDARY = "limit-test"
+CHUNK = b"x" * (1024 * 1024)
+
+
+async def _multipart_body():
+    yield (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="big.txt"\r\n'
+        "Content-Type: text/plain\r\n\r\n"
+    ).encode()
+    for _ in range(settings.MAX_FILE_SIZE // len(CHUNK) + 1):
+        yield CHUNK
+    yield f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def _post(content, headers: dict) -> httpx.Response:
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(
+                "/api/files/extract-text",
+                content=content,
+                headers={
+                    "Origin": ORIGIN,
+                    "Content-Type": f"multipart/form-data; boundary={BOUNDARY}",
+                    **headers
+                }
+            )
+
+    return asyncio.run(run())
+
+
+def test_chunked_upload_over_limit_gets_413_with_cors_headers():
+    # Тело без Content-Length - лимит срабатывает по ходу чтения
+    response = _post(_multipart_body(), {})
+
+    assert response.status_code == 413
+    assert "File too large" in response.json()["detail"]
+    assert "access-control-allow-origin" in response.headers
+
+
+def test_declared_length_over_limit_gets_413_with_cors_headers():
+    response = _post(b"", {"Content-Length": str(settings.MAX_FILE_SIZE * 2)})
+
+    assert response.status_code == 413
+    assert "access-control-allow-origin" in response.headers
@@ -0,0 +1,97 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+
+import services.usage_ledger as usage_ledger_module
+from database import SessionLocal, TokenUsage
+from services.usage_ledger import QuotaExceededError, Usage, UsageLedger, usage_ledger
+
+
+def _rows(project_id: str) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(TokenUsage).filter(TokenUsage.project_id == project_id).count()
+    finally:
+        db.close()
+
+
+def test_record_buffers_writes_off_the_caller():
+    ledger = UsageLedger(prices={}, default_quota=None, flush_interval=60)
+    project_id = str(uuid.uuid4())
+    try:
+        with ledger.scope(project_id) as scope:
+            for _ in range(5):
+                ledger.record("gemini-2.5-flash", "chat", Usage(prompt_tokens=100, output_tokens=20))
+
+        # Расход области считается сразу, строки еще в буфере
+        assert scope.total_tokens == 600
+        assert _rows(project_id) == 0
+
+        report = ledger.project_usage(project_id)
+        assert report["total"]["calls"] == 5
+        assert report["total"]["total_tokens"] == 600
+    finally:
+        ledger.stop()
+
+
+def test_background_writer_flushes_batch():
+    ledger = UsageLedger(prices={}, default_quota=None, flush_interval=0.05)
+    project_id = str(uuid.uuid4())
+    try:
+        with ledger.scope(project_id):
+            for _ in range(3):
+                ledger.record("gemini-2.5-pro", "analyze", Usage(prompt_tokens=10, output_tokens=5))
+
+        deadline = time.monotonic() + 2
+        while _rows(project_id) < 3 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert _rows(project_id) == 3
+    finally:
+        ledger.stop()
+    assert ledger._writer is None
+
+
+def test_quota_check_after_first_load_does_not_touch_db(monkeypatch):
+    ledger = UsageLedger(prices={}, default_quota=100, flush_interval=60)
+    project_id = str(uuid.uuid4())
+    try:
+        asyncio.run(ledger.check_quota(project_id))
+
+        def no_db():
+            raise AssertionError("quota check must be served from memory")
+
+        monkeypatch.setattr(usage_ledger_module, "SessionLocal", no_db)
+        with ledger.scope(project_id, check_quota=False):
+            ledger.record("gemini-2.5-flash", "chat", Usage(prompt_tokens=80, output_tokens=20))
+        with pytest.raises(QuotaExceededError):
+            asyncio.run(ledger.check_quota(project_id))
+    finally:
+        monkeypatch.undo()
+        ledger.stop()
+
+
+def _improve_in_projects(service, project_ids):
+    async def improve(project_id):
+        with usage_ledger.scope(project_id, check_quota=False) as scope:
+            await service.improve_section("Секция", "Уточнить формулировку", use_cache=False)
+        return scope.total_tokens
+
+    async def run():
+        return await asyncio.gather(*[improve(project_id) for project_id in project_ids])
+
+    return asyncio.run(run())
+
+
+def test_identical_calls_are_merged_only_within_a_project(make_service):
+    service = make_service(first_token=0.2)
+    project_a, project_b = str(uuid.uuid4()), str(uuid.uuid4())
+
+    charged = _improve_in_projects(service, [project_a, project_b])
+    # Разные проекты - отдельные вызовы, каждый оплачивает свой
+    assert service.provider.calls == 2
+    assert all(tokens > 0 for tokens in charged)
+
+    _improve_in_projects(service, [project_a, project_a])
+    assert service.provider.calls == 3
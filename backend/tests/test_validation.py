@@ -0,0 +1,19 @@
+import asyncio
+
+from services.llm_provider import STUB_DOCUMENT
+
+
+def test_partial_revalidation_does_not_duplicate_issues(make_service):
+    service = make_service()
+    document = dict(STUB_DOCUMENT)
+
+    first = asyncio.run(service.validate_document(document))
+
+    # Изменена одна секция; заглушка снова сообщает о неизмененной kpis
+    document["goals"] = document["goals"][:1]
+    calls = service.provider.calls
+    second = asyncio.run(service.validate_document(document))
+
+    assert service.provider.calls == calls + 1
+    assert [issue["section"] for issue in first["issues"]] == ["kpis"]
+    assert second["issues"] == first["issues"]
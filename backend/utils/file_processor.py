@@ -2,19 +2,47 @@ import fitz  # PyMuPDF
 from docx import Document
 import openpyxl
 import io
-from typing import Tuple
+import os
+import time
+from typing import BinaryIO, Optional, Tuple, Union
 import logging
 
+from services.metrics import FILE_EXTRACTION_DURATION, size_bucket
+
 logger = logging.getLogger(__name__)
 
+# Путь к файлу на диске (загрузки сохраняются во временный файл) или байты
+FileSource = Union[str, bytes]
+
+# Сколько байт начала файла нужно для определения типа
+_HEAD_SIZE = 2000
+
+
+def _open_source(source: FileSource) -> Union[str, BinaryIO]:
+    """Путь или байты в виде, который принимают python-docx и openpyxl"""
+    return source if isinstance(source, str) else io.BytesIO(source)
+
+
+def _read_head(source: FileSource) -> bytes:
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read(_HEAD_SIZE)
+    return source[:_HEAD_SIZE]
+
+
+def source_size(source: FileSource) -> int:
+    return os.path.getsize(source) if isinstance(source, str) else len(source)
+
+
 class FileProcessor:
     """Utility class for processing different file types"""
     
     @staticmethod
-    def detect_file_type(file_bytes: bytes, filename: str = "") -> str:
+    def detect_file_type(source: FileSource, filename: str = "") -> str:
         """
         Определить тип файла по magic bytes и расширению
         """
+        file_bytes = _read_head(source)
         # Проверка по magic bytes
         if file_bytes.startswith(b'%PDF'):
             return 'pdf'
@@ -38,34 +66,99 @@ class FileProcessor:
         return 'unknown'
     
     @staticmethod
-    def process_pdf(file_bytes: bytes) -> Tuple[str, dict]:
+    def _open_pdf(source: FileSource) -> "fitz.Document":
+        # Файл PyMuPDF читает с диска сам, без копии в памяти
+        if isinstance(source, str):
+            return fitz.open(source, filetype="pdf")
+        return fitz.open(stream=source, filetype="pdf")
+    
+    @staticmethod
+    def _close_pdf(doc):
+        # Обязательно закрываем документ (bool(doc) - это число страниц)
+        if doc is not None:
+            try:
+                doc.close()
+            except:
+                pass
+    
+    @staticmethod
+    def _pdf_metadata(doc) -> dict:
+        return {
+            "pages": doc.page_count,
+            "title": doc.metadata.get("title", ""),
+            "author": doc.metadata.get("author", ""),
+            "subject": doc.metadata.get("subject", "")
+        }
+    
+    @staticmethod
+    def _pdf_pages_text(doc, start: int, stop: int) -> str:
+        """Текст страниц [start, stop) с маркерами страниц"""
+        text_parts = []
+        for page_num in range(start, stop):
+            page = doc[page_num]
+            text = page.get_text()
+            if text.strip():  # Только непустые страницы
+                text_parts.append(f"=== Страница {page_num + 1} ===\n{text}")
+        return "\n\n".join(text_parts)
+    
+    @staticmethod
+    def pdf_page_range(page_count: int, first_page: int = 1, last_page: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Страницы first_page..last_page (с 1, включительно) в виде [start, stop)
+        с 0; last_page больше числа страниц обрезается
         """
-        Извлечь текст из PDF файла
+        if first_page < 1 or (last_page is not None and last_page < first_page):
+            raise ValueError(f"Invalid page range: {first_page}-{last_page}")
+        stop = page_count if last_page is None else min(last_page, page_count)
+        if first_page > stop:
+            raise ValueError(f"Page range starts at {first_page}, but the document has {page_count} pages")
+        return first_page - 1, stop
+    
+    @classmethod
+    def pdf_info(cls, source: FileSource) -> dict:
+        """Метаданные PDF без извлечения текста"""
+        doc = None
+        try:
+            doc = cls._open_pdf(source)
+            return cls._pdf_metadata(doc)
+        except Exception as e:
+            logger.error(f"PDF processing error: {e}")
+            raise ValueError(f"Failed to process PDF file: {str(e)}")
+        finally:
+            cls._close_pdf(doc)
+    
+    @classmethod
+    def process_pdf_pages(cls, source: FileSource, start: int, stop: int) -> str:
+        """
+        Очищенный текст страниц [start, stop) - часть большого PDF,
+        которую разбирает один воркер ExtractionPool
+        """
+        doc = None
+        try:
+            doc = cls._open_pdf(source)
+            return cls.clean_extracted_text(cls._pdf_pages_text(doc, start, stop))
+        except Exception as e:
+            logger.error(f"PDF processing error: {e}")
+            raise ValueError(f"Failed to process PDF file: {str(e)}")
+        finally:
+            cls._close_pdf(doc)
+    
+    @classmethod
+    def process_pdf(cls, source: FileSource, first_page: int = 1, last_page: Optional[int] = None) -> Tuple[str, dict]:
+        """
+        Извлечь текст из PDF файла (страницы first_page..last_page, по умолчанию все)
         Returns: (extracted_text, metadata)
         """
         doc = None
         try:
-            # Открываем PDF из байтов
-            doc = fitz.open(stream=file_bytes, filetype="pdf")
-            
-            text_parts = []
-            metadata = {
-                "pages": doc.page_count,
-                "title": doc.metadata.get("title", ""),
-                "author": doc.metadata.get("author", ""),
-                "subject": doc.metadata.get("subject", "")
-            }
-            
-            for page_num in range(doc.page_count):
-                page = doc[page_num]
-                text = page.get_text()
-                if text.strip():  # Только непустые страницы
-                    text_parts.append(f"=== Страница {page_num + 1} ===\n{text}")
-            
-            doc.close()
+            doc = cls._open_pdf(source)
+            metadata = cls._pdf_metadata(doc)
+            start, stop = cls.pdf_page_range(doc.page_count, first_page, last_page)
+            if (start, stop) != (0, doc.page_count):
+                metadata["page_range"] = [start + 1, stop]
             
-            full_text = "\n\n".join(text_parts)
-            logger.info(f"PDF processed: {doc.page_count} pages, {len(full_text)} characters")
+            full_text = cls._pdf_pages_text(doc, start, stop)
+            logger.info(f"PDF processed: {stop - start} of {metadata['pages']} pages, {len(full_text)} characters")
             
             return full_text, metadata
             
@@ -73,21 +166,16 @@ class FileProcessor:
             logger.error(f"PDF processing error: {e}")
             raise ValueError(f"Failed to process PDF file: {str(e)}")
         finally:
-            # Обязательно закрываем документ
-            if doc:
-                try:
-                    doc.close()
-                except:
-                    pass
+            cls._close_pdf(doc)
     
     @staticmethod
-    def process_docx(file_bytes: bytes) -> Tuple[str, dict]:
+    def process_docx(source: FileSource) -> Tuple[str, dict]:
         """
         Извлечь текст из DOCX файла
         Returns: (extracted_text, metadata)
         """
         try:
-            doc = Document(io.BytesIO(file_bytes))
+            doc = Document(_open_source(source))
             
             # Основной текст из параграфов
             paragraphs = []
@@ -132,13 +220,13 @@ class FileProcessor:
             raise ValueError(f"Failed to process DOCX file: {str(e)}")
     
     @staticmethod
-    def process_xlsx(file_bytes: bytes) -> Tuple[str, dict]:
+    def process_xlsx(source: FileSource) -> Tuple[str, dict]:
         """
         Извлечь данные из Excel файла
         Returns: (extracted_text, metadata)
         """
         try:
-            wb = openpyxl.load_workbook(io.BytesIO(file_bytes), read_only=True)
+            wb = openpyxl.load_workbook(_open_source(source), read_only=True)
             
             sheets_data = []
             total_rows = 0
@@ -205,19 +293,41 @@ class FileProcessor:
         return text.strip()
     
     @classmethod
-    def process_file(cls, file_bytes: bytes, filename: str) -> Tuple[str, str, dict]:
+    def process_file(cls, source: FileSource, filename: str) -> Tuple[str, str, dict]:
         """
-        Обработать файл любого поддерживаемого типа
+        Обработать файл любого поддерживаемого типа (путь к файлу или байты)
         Returns: (extracted_text, file_type, metadata)
         """
-        file_type = cls.detect_file_type(file_bytes, filename)
+        started = time.perf_counter()
+        cleaned_text, file_type, metadata = cls.extract(source, filename)
+        
+        FILE_EXTRACTION_DURATION.labels(file_type, size_bucket(source_size(source))).observe(
+            time.perf_counter() - started
+        )
+        
+        return cleaned_text, file_type, metadata
+    
+    @classmethod
+    def extract(
+        cls,
+        source: FileSource,
+        filename: str,
+        first_page: int = 1,
+        last_page: Optional[int] = None
+    ) -> Tuple[str, str, dict]:
+        """
+        То же, что process_file, но без метрик - для воркеров ExtractionPool
+        (метрики процесса-воркера не видны в /metrics, время учитывает пул).
+        first_page/last_page ограничивают страницы PDF, для DOCX/XLSX не используются
+        """
+        file_type = cls.detect_file_type(source, filename)
         
         if file_type == 'pdf':
-            text, metadata = cls.process_pdf(file_bytes)
+            text, metadata = cls.process_pdf(source, first_page, last_page)
         elif file_type == 'docx':
-            text, metadata = cls.process_docx(file_bytes)
+            text, metadata = cls.process_docx(source)
         elif file_type == 'xlsx':
-            text, metadata = cls.process_xlsx(file_bytes)
+            text, metadata = cls.process_xlsx(source)
         else:
             raise ValueError(f"Unsupported file type: {file_type}. Supported types: PDF, DOCX, XLSX")
         
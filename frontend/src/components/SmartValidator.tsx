@@ -20,6 +20,17 @@ interface ValidationResult {
   }>;
 }
 
+// Названия секций для ключей, которыми сервер помечает замечания
+const SECTION_LABELS: Record<string, string> = {
+  projectName: 'Название проекта',
+  description: 'Описание проекта',
+  goals: 'Цели и задачи',
+  scope: 'Scope (Границы)',
+  businessRules: 'Бизнес-правила',
+  useCases: 'Use Cases',
+  kpis: 'KPI и метрики',
+};
+
 interface SmartValidatorProps {
   documentContent: DocumentContent;
   onValidationComplete?: (result: ValidationResult) => void;
@@ -130,7 +141,7 @@ export const SmartValidator = ({ documentContent, onValidationComplete }: SmartV
                 <div key={idx} className="bg-background/40 rounded-lg p-3 text-sm">
                   {issue.section && (
                     <div className="font-semibold text-foreground mb-1">
-                      {issue.section}
+                      {SECTION_LABELS[issue.section] ?? issue.section}
                     </div>
                   )}
                   <div className="text-muted-foreground mb-2">
@@ -11,7 +11,7 @@ import { FileUpload } from "@/components/FileUpload";
 import { NewProjectModal, ProjectConfig } from "@/components/NewProjectModal";
 
 import ApiService from "@/services/apiService";
-import { ProjectResponse, ChatMessage } from "@/services/apiService";
+import { ProjectResponse } from "@/services/apiService";
 
 import {
   MessageSquare,
@@ -283,52 +283,48 @@ const Chat = () => {
       isTyping: true,
     };
     setMessages(prev => [...prev, typingMessage]);
+    const aiMessageId = `ai_${Date.now()}`;
     
     try {
-      // Prepare chat history INCLUDING current user message
-      const chatHistory: ChatMessage[] = [
-        ...messages
-          .filter(m => m.role !== "system" && !m.isTyping)
-          .map(m => ({
-            role: m.role as "user" | "assistant",
-            content: m.content,
-            timestamp: m.timestamp.toISOString(),
-          })),
-        // Add current user message to history
+      // Stream the response from backend, replacing the typing indicator on first token
+      let accumulatedText = '';
+      
+      await ApiService.streamChatMessage(
         {
-          role: "user" as const,
-          content: content.trim(),
-          timestamp: new Date().toISOString(),
+          project_id: currentProject.id,
+          message: content.trim(),
+        },
+        (text) => {
+          const isFirstToken = accumulatedText === '';
+          accumulatedText += text;
+          const snapshot = accumulatedText;
+          setMessages(prev => {
+            const withoutTyping = isFirstToken ? prev.filter(m => m.id !== typingId) : prev;
+            if (isFirstToken) {
+              return [...withoutTyping, {
+                id: aiMessageId,
+                role: "assistant" as const,
+                content: snapshot,
+                timestamp: new Date(),
+                isTyping: true,
+              }];
+            }
+            return withoutTyping.map(msg =>
+              msg.id === aiMessageId ? { ...msg, content: snapshot } : msg
+            );
+          });
         }
-      ];
-
-      // Keep only last 15 messages for context (to avoid token limit)
-      const recentHistory = chatHistory.slice(-15);
-
-      // Send to backend
-      const response = await ApiService.sendChatMessage({
-        project_id: currentProject.id,
-        message: content.trim(),
-        history: recentHistory,
-      });
-      
-      // Replace typing message with actual response
-      setMessages(prev => prev.filter(m => m.id !== typingId));
-      
-      const aiMessage: Message = {
-        id: `ai_${Date.now()}`,
-        role: "assistant",
-        content: "",
-        timestamp: new Date(),
-      };
-      setMessages(prev => [...prev, aiMessage]);
+      );
       
-      // Start typewriter effect
-      simulateTyping(response.message, aiMessage.id);
+      setMessages(prev =>
+        prev
+          .filter(m => m.id !== typingId)
+          .map(msg => msg.id === aiMessageId ? { ...msg, isTyping: false } : msg)
+      );
       
     } catch (error) {
       console.error('Error sending message:', error);
-      setMessages(prev => prev.filter(m => m.id !== typingId));
+      setMessages(prev => prev.filter(m => m.id !== typingId && m.id !== aiMessageId));
       
       const errorMessage: Message = {
         id: `error_${Date.now()}`,
@@ -341,36 +337,7 @@ const Chat = () => {
     } finally {
       setIsAiTyping(false);
     }
-  }, [currentProject, currentChatId, messages, isAiTyping]);
-  
-  const simulateTyping = (text: string, messageId: string) => {
-    const chars = text.split('');
-    let currentIndex = 0;
-    let accumulatedText = '';
-    
-    const typingInterval = setInterval(() => {
-      if (currentIndex < chars.length) {
-        accumulatedText += chars[currentIndex];
-        setMessages(prev =>
-          prev.map(msg =>
-            msg.id === messageId 
-              ? { ...msg, content: accumulatedText, isTyping: true }
-              : msg
-          )
-        );
-        currentIndex++;
-      } else {
-        clearInterval(typingInterval);
-        setMessages(prev =>
-          prev.map(msg => 
-            msg.id === messageId 
-              ? { ...msg, isTyping: false }
-              : msg
-          )
-        );
-      }
-    }, 40); // 40ms per character
-  };
+  }, [currentProject, currentChatId, isAiTyping]);
   
   // ========================
   // PROJECT CREATION
@@ -29,6 +29,16 @@ import {
 } from "lucide-react";
 import { useNavigate, useLocation } from "react-router-dom";
 
+const EMPTY_DOCUMENT: DocumentContent = {
+  projectName: '',
+  description: { paragraphs: [] },
+  goals: [],
+  scope: { inScope: [], outOfScope: [] },
+  businessRules: [],
+  useCases: [],
+  kpis: [],
+};
+
 const Document = () => {
   const navigate = useNavigate();
   const location = useLocation();
@@ -91,7 +101,12 @@ const Document = () => {
   const generateDocument = async (projId: string) => {
     setIsGenerating(true);
     try {
-      const response = await ApiService.generateDocument({ project_id: projId });
+      // Секции показываются по мере генерации, остальные пока пустые
+      let partial: DocumentContent = { ...EMPTY_DOCUMENT };
+      const response = await ApiService.streamDocument({ project_id: projId }, (name, content) => {
+        partial = { ...partial, [name]: content };
+        setProjectDocument(partial);
+      });
       setProjectDocument(response.document);
       setDocumentId(response.document_id);
 
@@ -400,8 +415,8 @@ const Document = () => {
     }
   };
 
-  // Loading state
-  if (isLoading || isGenerating) {
+  // Loading state (до первой готовой секции)
+  if ((isLoading || isGenerating) && !projectDocument) {
     return (
       <div className="flex items-center justify-center min-h-screen bg-background">
         <div className="text-center max-w-md mx-auto px-4">
@@ -522,6 +537,9 @@ const Document = () => {
               <h1 className="text-4xl font-bold text-primary flex-1">
                 Бизнес-требования: {projectDocument.projectName}
               </h1>
+              {isGenerating && (
+                <Loader2 className="w-6 h-6 animate-spin text-primary mt-2" />
+              )}
 
 
             </div>
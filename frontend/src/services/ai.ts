@@ -1,6 +1,5 @@
 // AI Service - теперь работает ТОЛЬКО через Backend API
 import ApiService, { 
-  ChatMessage, 
   ChatMessageRequest,
   DocumentContent,
   DiagramGenerateRequest 
@@ -26,16 +25,9 @@ class AIService {
   }
   async chat(messages: AIMessage[], projectId: string): Promise<string> {
     try {
-      const chatMessages: ChatMessage[] = messages.map(msg => ({
-        role: msg.role as 'user' | 'assistant',
-        content: msg.content,
-        timestamp: msg.timestamp?.toISOString()
-      }));
-
       const request: ChatMessageRequest = {
         project_id: projectId,
-        message: messages[messages.length - 1]?.content || '',
-        history: chatMessages.slice(0, -1)
+        message: messages[messages.length - 1]?.content || ''
       };
 
       const response = await ApiService.sendChatMessage(request);
@@ -54,33 +46,19 @@ class AIService {
     onError: (error: Error) => void
   ): Promise<void> {
     try {
-      const response = await this.chat(messages, projectId);
-      this.simulateTyping(response, onChunk, onComplete);
+      await ApiService.streamChatMessage(
+        {
+          project_id: projectId,
+          message: messages[messages.length - 1]?.content || ''
+        },
+        onChunk
+      );
+      onComplete();
     } catch (error) {
       onError(error as Error);
     }
   }
 
-  private simulateTyping(
-    text: string, 
-    onChunk: (text: string) => void, 
-    onComplete: () => void
-  ): void {
-    const words = text.split(' ');
-    let index = 0;
-    
-    const interval = setInterval(() => {
-      if (index < words.length) {
-        const word = words[index];
-        onChunk(index === 0 ? word : ` ${word}`);
-        index++;
-      } else {
-        clearInterval(interval);
-        onComplete();
-      }
-    }, 80);
-  }
-
   // VALIDATION METHODS
   async validateDocument(document: DocumentContent): Promise<{
     overallScore: number;
@@ -2,10 +2,10 @@
 const API_BASE_URL = import.meta.env.VITE_API_URL || 'https://nonaddicting-lidia-nonviviparously.ngrok-free.dev';
 
 // Type definitions
+// История чата собирается на сервере из сохраненных сообщений
 export interface ChatMessageRequest {
   project_id: string;
   message: string;
-  history: ChatMessage[];
 }
 
 export interface ChatMessage {
@@ -21,6 +21,12 @@ export interface ChatMessageResponse {
   tokens_used?: number;
 }
 
+export interface ChatStreamDone {
+  message_id: string;
+  timestamp: string;
+  tokens_used?: number;
+}
+
 export interface ProjectCreateRequest {
   name: string;
   type?: string;
@@ -130,6 +136,7 @@ export interface FileAnalysisResponse {
   description: string;
   extracted_text_length: number;
   file_type: string;
+  cached?: boolean;
 }
 
 export interface SectionImprovementRequest {
@@ -249,6 +256,68 @@ async function makeRequest<T>(
   }
 }
 
+// POST запрос, ответ на который - поток Server-Sent Events
+async function openEventStream(endpoint: string, body: unknown, signal?: AbortSignal): Promise<Response> {
+  let response: Response;
+  try {
+    response = await fetch(`${API_BASE_URL}${endpoint}`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Accept': 'text/event-stream',
+        'ngrok-skip-browser-warning': 'true'
+      },
+      body: JSON.stringify(body),
+      signal,
+    });
+  } catch (error) {
+    if (error instanceof TypeError && error.message.includes('Failed to fetch')) {
+      throw new ApiError('Сервер недоступен. Проверьте подключение к интернету', 0);
+    }
+    throw error;
+  }
+
+  if (!response.ok || !response.body) {
+    await handleResponse<unknown>(response);
+    throw new ApiError('Пустой ответ сервера', response.status);
+  }
+  return response;
+}
+
+// Прочитать поток SSE, вызывая onEvent для каждого события с JSON данными
+async function readEventStream(
+  response: Response,
+  onEvent: (event: string, payload: any) => void
+): Promise<void> {
+  const reader = response.body!.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // События SSE разделяются пустой строкой
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+
+      let event = 'message';
+      let data = '';
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      }
+      if (!data) continue;
+
+      onEvent(event, JSON.parse(data));
+    }
+  }
+}
+
 // API Service class
 export class ApiService {
   
@@ -265,6 +334,31 @@ export class ApiService {
     });
   }
   
+  // Потоковый ответ (SSE): onToken вызывается для каждого фрагмента текста
+  static async streamChatMessage(
+    request: ChatMessageRequest,
+    onToken: (text: string) => void,
+    signal?: AbortSignal
+  ): Promise<ChatStreamDone> {
+    const response = await openEventStream('/api/chat/stream', request, signal);
+
+    let result: ChatStreamDone | null = null;
+    await readEventStream(response, (event, payload) => {
+      if (event === 'token') {
+        onToken(payload.text);
+      } else if (event === 'done') {
+        result = payload;
+      } else if (event === 'error') {
+        throw new ApiError(payload.detail || 'AI сервис недоступен', 503);
+      }
+    });
+
+    if (!result) {
+      throw new ApiError('Поток ответа прерван', 0);
+    }
+    return result;
+  }
+  
   static async getChatHistory(
     projectId: string, 
     skip = 0, 
@@ -307,6 +401,31 @@ export class ApiService {
     });
   }
   
+  // Потоковая генерация (SSE): onSection вызывается для каждой готовой секции документа
+  static async streamDocument(
+    request: DocumentGenerateRequest,
+    onSection: (name: keyof DocumentContent, content: any) => void,
+    signal?: AbortSignal
+  ): Promise<DocumentGenerateResponse> {
+    const response = await openEventStream('/api/documents/generate/stream', request, signal);
+
+    let result: DocumentGenerateResponse | null = null;
+    await readEventStream(response, (event, payload) => {
+      if (event === 'section') {
+        onSection(payload.name, payload.content);
+      } else if (event === 'done') {
+        result = payload;
+      } else if (event === 'error') {
+        throw new ApiError(payload.detail || 'Ошибка генерации документа', 503);
+      }
+    });
+
+    if (!result) {
+      throw new ApiError('Поток ответа прерван', 0);
+    }
+    return result;
+  }
+  
   static async getDocument(documentId: string): Promise<{
     document_id: string;
     project_id: string;